@@ -0,0 +1,90 @@
+import os, sys
+sys.path.append(os.path.dirname(__file__))
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import db
+import match_making
+
+# Awaitable access to the same database for code running on an event loop. Every call runs the normal
+# synchronous function from db.py on a worker thread, so the schema, caching and transactions are shared
+# with the scripts, which keep calling db directly.
+#
+# Writes go through a single thread, one at a time and in the order they were awaited. Reads run on a small
+# pool (each worker keeps its own pooled connection, and WAL lets them run alongside the writer). Identical
+# reads that are in flight at the same time are run once and every caller gets the same result, so treat
+# returned lists as read-only.
+
+READ_WORKERS = 4
+
+_lock = threading.Lock()
+_reader = None
+_writer = None
+_in_flight = {} # (loop, function, args) -> future for reads currently running
+_generation = 0 # bumped by every write so reads awaited after it never join one started before it
+
+def _executors():
+    global _reader, _writer
+    with _lock:
+        if _writer is None:
+            _reader = ThreadPoolExecutor(max_workers=READ_WORKERS, thread_name_prefix='db-read')
+            _writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-write')
+        return _reader, _writer
+
+def shutdown():
+    """Waits for queued work and stops the worker threads. They are started again on the next call."""
+    global _reader, _writer
+    with _lock:
+        reader, writer = _reader, _writer
+        _reader = _writer = None
+    for executor in (writer, reader):
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+async def read(function, *args):
+    """Runs a read-only db function on the reader pool, sharing the result with identical calls in flight."""
+    loop = asyncio.get_running_loop()
+    key = (loop, _generation, function, args)
+    future = _in_flight.get(key)
+    if future is None:
+        reader, _ = _executors()
+        future = loop.run_in_executor(reader, functools.partial(function, *args))
+        _in_flight[key] = future
+        future.add_done_callback(lambda f: _in_flight.pop(key, None))
+    # shield so one caller being cancelled doesn't cancel the query for the others
+    return await asyncio.shield(future)
+
+async def write(function, *args, **kwargs):
+    """Runs a db function that writes on the writer thread, after every write awaited before it."""
+    global _generation
+    _generation += 1
+    _, writer = _executors()
+    return await asyncio.get_running_loop().run_in_executor(writer, functools.partial(function, *args, **kwargs))
+
+async def get_players():
+    return await read(db.get_players)
+
+async def get_matches_for_season(season):
+    return await read(db.get_matches_for_season, season)
+
+async def get_matches_for_group(season, grouping):
+    return await read(db.get_matches_for_group, season, grouping)
+
+async def get_standings(season, grouping):
+    return await read(db.get_standings, season, grouping)
+
+async def get_current_season():
+    return await read(db.get_current_season)
+
+async def enter_score(winner_id, loser_id, sets, overwrite=False):
+    """Awaitable db.enter_score; returns its ScoreResult."""
+    return await write(db.enter_score, winner_id, loser_id, sets, overwrite=overwrite)
+
+async def create_season(season, start_date, weeks, best_of=5):
+    return await write(db.create_season, season, start_date, weeks, best_of=best_of)
+
+async def create_matches_for_season(start_date, skip_weeks=[], include_byes=False):
+    """Awaitable match_making.create_matches_for_season: the season row and its whole schedule in one write."""
+    return await write(match_making.create_matches_for_season, start_date, skip_weeks, include_byes)
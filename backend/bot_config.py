@@ -9,9 +9,11 @@ if os.path.isfile(path):
     with open(path) as data_file:
         text_config = json.load(data_file)
 
-def _get_value_for_key(key):
+def _get_value_for_key(key, default=None):
     if key in os.environ:
         return os.environ[key]
+    if default is not None:
+        return text_config.get(key, default)
     return text_config[key]
 
 def get_slack_api_key():
@@ -27,4 +29,12 @@ def get_commissioner_slack_id():
     return _get_value_for_key('COMMISSIONER_SLACK_ID')
 
 def get_log_path():
-    return _get_value_for_key('LOG_PATH')
\ No newline at end of file
+    return _get_value_for_key('LOG_PATH')
+def get_replica_path():
+    return _get_value_for_key('REPLICA_PATH', os.path.abspath(os.path.join(os.path.dirname(__file__), "../replica")))
+
+def get_query_stats_enabled():
+    return str(_get_value_for_key('QUERY_STATS', 'false')).lower() in ('1', 'true', 'yes')
+
+def get_slow_query_ms():
+    return float(_get_value_for_key('SLOW_QUERY_MS', 100))
@@ -0,0 +1,123 @@
+import collections
+import re
+import bot_config
+
+# The bot's commands as a table: each one is a pattern, a handler and who may use it where. Patterns are
+# compiled to regexes once, when they are registered, and indexed by their first word (or '<@' for ones
+# starting with a mention), so a message is only tried against the few commands it could be. Placeholders
+# in a pattern extract typed arguments:
+#   {name:mention}  a <@slack id>, as the upper case id
+#   {name:score}    3-0, 3-1 or 3-2, as the games played (3, 4 or 5)
+#   {name:group}    one letter or digit
+#   {name:text}     the rest of the words, stripped
+# and '...' matches anything (including nothing). A pattern has to match the whole message.
+
+Config = collections.namedtuple('Config', 'bot_user_id channel_id commissioner_id')
+
+def snapshot_config():
+    """The config values the bot checks on every message, read once."""
+    return Config(bot_config.get_bot_slack_user_id(), bot_config.get_channel_slack_id(), bot_config.get_commissioner_slack_id())
+
+Message = collections.namedtuple('Message', 'text channel user ts is_dm is_admin')
+
+_new = tuple.__new__
+
+def message_from_event(event, config):
+    """A Message for an RTM event whose text has already had the bot's mention taken off."""
+    channel, user = event['channel'], event['user']
+    return _new(Message, (event['text'], channel, user, event['ts'], channel[:1] == 'D', user == config.commissioner_id))
+
+_ARGUMENTS = {
+    'mention': (r'<@([^>]+)>', lambda s: s.upper()),
+    'score': (r'(3-[012])', lambda s: 3 + int(s[2])),
+    'group': (r'([A-Za-z0-9])', lambda s: s),
+    'text': (r'(.+?)', lambda s: s.strip()),
+}
+_PLACEHOLDER = re.compile(r'\{(\w+):(\w+)\}|\.\.\.')
+
+Route = collections.namedtuple('Route', 'pattern regex arguments handler dm_only admin_only')
+
+def _compile(pattern):
+    """(regex, [(argument name, converter)]) for a command pattern; the regex is None for plain text."""
+    parts, arguments = [], []
+    position = 0
+    for m in _PLACEHOLDER.finditer(pattern):
+        parts.append(re.escape(pattern[position:m.start()]))
+        if m.group(0) == '...':
+            parts.append('.*?')
+        else:
+            name, kind = m.groups()
+            if kind not in _ARGUMENTS:
+                raise ValueError('Unknown argument type {} in {!r}'.format(kind, pattern))
+            regex, convert = _ARGUMENTS[kind]
+            parts.append(regex)
+            arguments.append((name, convert))
+        position = m.end()
+    if position == 0:
+        return None, arguments # compared as a string
+    parts.append(re.escape(pattern[position:]))
+    return re.compile(''.join(parts), re.DOTALL), arguments
+
+def _key(text):
+    # The index key: the first word, or '<@' for anything starting with a mention
+    if text[:2] == '<@':
+        return '<@'
+    return text.partition(' ')[0]
+
+def _pattern_key(pattern):
+    m = _PLACEHOLDER.match(pattern)
+    if m is None:
+        return _key(pattern)
+    if m.group(2) != 'mention':
+        raise ValueError('A pattern has to start with a word or a mention: {!r}'.format(pattern))
+    return '<@'
+
+class Router:
+    """
+    Commands in registration order; the first one that matches (and whose dm_only/admin_only allow the
+    message) is run as handler(message, **arguments). Messages nothing matches go to the fallback.
+    """
+    def __init__(self):
+        self._routes = []
+        self._by_key = {}
+        self._fallback = None
+
+    def add(self, pattern, handler, dm_only=False, admin_only=False):
+        regex, arguments = _compile(pattern)
+        route = Route(pattern, regex, arguments, handler, dm_only, admin_only)
+        self._routes.append(route)
+        self._by_key.setdefault(_pattern_key(pattern), []).append(route)
+        return route
+
+    def command(self, pattern, dm_only=False, admin_only=False):
+        """Decorator form of add."""
+        def register(handler):
+            self.add(pattern, handler, dm_only, admin_only)
+            return handler
+        return register
+
+    def fallback(self, handler):
+        self._fallback = handler
+        return handler
+
+    def match(self, message):
+        """(Route, arguments) for a Message, or (None, {}) when no command matches."""
+        text = message.text
+        for route in self._by_key.get(_key(text), ()):
+            if (route.dm_only and not message.is_dm) or (route.admin_only and not message.is_admin):
+                continue
+            if route.regex is None:
+                if text == route.pattern:
+                    return route, {}
+                continue
+            m = route.regex.fullmatch(text)
+            if m is None:
+                continue
+            return route, dict((name, convert(value)) for (name, convert), value in zip(route.arguments, m.groups()))
+        return None, {}
+
+    def dispatch(self, message):
+        route, arguments = self.match(message)
+        handler = route.handler if route is not None else self._fallback
+        if handler is not None:
+            return handler(message, **arguments)
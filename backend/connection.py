@@ -0,0 +1,202 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Applied to every new connection. WAL lets the bot and the admin API read while the other writes,
+# and NORMAL synchronous is safe under WAL (a crash can only lose the last commits, never corrupt).
+PRAGMAS = [
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -16000),  # negative means KiB, so ~16MB of page cache per connection
+    ('mmap_size', 268435456),
+    ('temp_store', 'MEMORY'),
+    ('busy_timeout', 5000),
+]
+
+class _ObservedCursor(sqlite3.Cursor):
+    """Times each statement and the fetches that follow it and reports them to the connection's observer."""
+    _call = None
+
+    def _timed(self, method, sql, params):
+        observer = self.connection.observer
+        self._call = call = observer.begin(sql)
+        start = time.perf_counter()
+        try:
+            result = method(sql, params)
+        finally:
+            elapsed = time.perf_counter() - start
+            rows = self.rowcount if self.description is None and self.rowcount > 0 else 0
+            observer.record(call, rows, elapsed, new_call=True)
+        return result
+
+    def execute(self, sql, params=()):
+        return self._timed(super().execute, sql, params)
+
+    def executemany(self, sql, param_rows):
+        return self._timed(super().executemany, sql, param_rows)
+
+    def _fetched(self, rows, start):
+        if self._call is not None:
+            self.connection.observer.record(self._call, rows, time.perf_counter() - start)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(0 if row is None else 1, start)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(len(rows), start)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(len(rows), start)
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(0, start)
+            raise
+        self._fetched(1, start)
+        return row
+
+class _ObservedConnection(sqlite3.Connection):
+    observer = None
+
+    def cursor(self, factory=_ObservedCursor):
+        return super().cursor(factory)
+
+    # The C shortcuts build a plain cursor, so route them through ours
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, param_rows):
+        return self.cursor().executemany(sql, param_rows)
+
+class ConnectionManager:
+    """
+    Hands out one long-lived sqlite connection per thread for a database file. Connections are opened
+    lazily, tuned once with PRAGMAS and reused for every query made on that thread.
+    """
+    def __init__(self, path, observer=None):
+        self.path = path
+        self.observer = observer # e.g. a query_stats.QueryStats; threads reconnect on their next query when it changes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = {}  # thread ident -> connection, so they can all be closed together
+
+    def _connect(self):
+        factory = sqlite3.Connection if self.observer is None else _ObservedConnection
+        conn = sqlite3.connect(self.path, detect_types=sqlite3.PARSE_DECLTYPES, isolation_level=None,
+                               check_same_thread=False, factory=factory)
+        if self.observer is not None:
+            conn.observer = self.observer
+        for name, value in PRAGMAS:
+            conn.execute('PRAGMA {} = {}'.format(name, value))
+        return conn
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.observer is not self.observer and not self._local.depth:
+            # Instrumentation was switched on or off since this thread connected
+            with self._lock:
+                self._connections.pop(threading.get_ident(), None)
+            conn.close()
+            conn = None
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.observer = self.observer
+            self._local.depth = 0
+            with self._lock:
+                self._close_dead_threads()
+                self._connections[threading.get_ident()] = conn
+        return conn
+
+    def _close_dead_threads(self):
+        alive = set(t.ident for t in threading.enumerate())
+        for ident in [i for i in self._connections if i not in alive]:
+            self._connections.pop(ident).close()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Runs the block in a single write transaction on this thread's connection. Nested blocks join
+        the outermost transaction, so db functions can be composed into one atomic unit.
+        """
+        conn = self.connection()
+        if self._local.depth:
+            self._local.depth += 1
+            try:
+                yield conn
+            finally:
+                self._local.depth -= 1
+            return
+
+        conn.execute('BEGIN IMMEDIATE')
+        self._local.depth = 1
+        self._local.after_commit = []
+        try:
+            yield conn
+        except BaseException:
+            self._local.depth = 0
+            self._local.after_commit = []
+            conn.execute('ROLLBACK')
+            raise
+        self._local.depth = 0
+        conn.execute('COMMIT')
+        callbacks, self._local.after_commit = self._local.after_commit, []
+        for callback in callbacks:
+            callback()
+
+    def in_transaction(self):
+        return getattr(self._local, 'depth', 0) > 0
+
+    def after_commit(self, callback):
+        """
+        Calls callback() once this thread's outermost transaction commits (dropped if it rolls back), or right
+        away outside a transaction. The same callback queued twice runs once.
+        """
+        if not self.in_transaction():
+            callback()
+        elif callback not in self._local.after_commit:
+            self._local.after_commit.append(callback)
+
+    def _cursor(self, factory):
+        cursor = self.connection().cursor()
+        if factory is not None:
+            cursor.row_factory = factory
+        return cursor
+
+    def fetchall(self, sql, params=(), factory=None):
+        return self._cursor(factory).execute(sql, params).fetchall()
+
+    def fetchone(self, sql, params=(), factory=None):
+        return self._cursor(factory).execute(sql, params).fetchone()
+
+    def execute(self, sql, params=()):
+        with self.transaction() as conn:
+            return conn.execute(sql, params).rowcount
+
+    def executemany(self, sql, param_rows):
+        with self.transaction() as conn:
+            return conn.executemany(sql, param_rows).rowcount
+
+    def checkpoint(self):
+        self.connection().execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def close_all(self):
+        """Closes every pooled connection, e.g. before the database file is copied or removed."""
+        with self._lock:
+            for conn in self._connections.values():
+                conn.close()
+            self._connections = {}
+        self._local = threading.local()
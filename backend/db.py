@@ -1,89 +1,172 @@
+import os, sys
+sys.path.append(os.path.dirname(__file__))
+
 import sqlite3
+import collections
 import datetime
-import os
-import subprocess
+import json
+import threading
+import time
+from connection import ConnectionManager
+import migrations
+import replication
+import bot_config
+import query_stats
+import ratings
+import roster
+from player_directory import PlayerDirectory
 
 path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../smash_league.sqlite"))
 
-command_prefix = ''
-command_suffix = ''
-if True: #windows
-    command_prefix = '"C:\Program Files\Git\\bin\\bash.exe" -c "'
-    command_suffix = '"'
-def get_connection():
-    return sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES)
+_pool = None
+auto_migrate = True # bring the schema up to date the first time a database is opened
+_query_stats = query_stats.QueryStats(bot_config.get_slow_query_ms()) if bot_config.get_query_stats_enabled() else None
+
+def get_pool():
+    # Rebuilt if someone points the module at another file by reassigning db.path
+    global _pool
+    if _pool is None or _pool.path != path:
+        if _pool is not None:
+            _pool.close_all()
+        _pool = ConnectionManager(path, _query_stats)
+        if auto_migrate:
+            _migrate(_pool)
+    return _pool
+
+def _migrate(pool):
+    applied = migrations.migrate(pool)
+    if migrations.RATING_TABLES in applied:
+        # Backfill the new rating tables with the current rating rules, as rebuild_ratings would
+        with pool.transaction() as c:
+            ratings.rebuild(c)
+    return applied
 
-def push_db():
-    p = subprocess.Popen(command_prefix+'cp smash_league.sqlite smash_league.sqlite.bak'+command_suffix, shell=True).wait()
-    p = subprocess.Popen(command_prefix+'rsync -avzhe ssh smash_league.sqlite ec2-user@10.110.83.255:~/smashbot/'+command_suffix, shell=True).wait()
-    p = subprocess.Popen(command_prefix+'rm smash_league.sqlite'+command_suffix, shell=True).wait()
+def get_connection():
+    """Returns this thread's pooled connection. Callers must not close it."""
+    return get_pool().connection()
+
+def transaction():
+    """Context manager grouping any number of db.* calls into one atomic write transaction."""
+    return get_pool().transaction()
+
+def close_connections():
+    get_pool().close_all()
+
+def enable_query_stats(slow_ms=None):
+    """
+    Starts recording calls, rows and time per db function and statement (see query_stats). Statements slower
+    than slow_ms (default SLOW_QUERY_MS from the config) are logged to the smashbot log.
+    """
+    global _query_stats
+    _query_stats = query_stats.QueryStats(bot_config.get_slow_query_ms() if slow_ms is None else slow_ms)
+    get_pool().observer = _query_stats
+
+def disable_query_stats():
+    global _query_stats
+    _query_stats = None
+    get_pool().observer = None
+
+def query_stats_snapshot():
+    """Everything recorded so far as a dict, or None when instrumentation is off."""
+    return _query_stats.snapshot() if _query_stats is not None else None
+
+def _fetchall(sql, params=(), factory=None):
+    return get_pool().fetchall(sql, params, factory)
+
+def _fetchone(sql, params=(), factory=None):
+    return get_pool().fetchone(sql, params, factory)
+
+def _execute(sql, params=()):
+    return get_pool().execute(sql, params)
+
+_MISSING = object()
+
+class _CachedValue:
+    """
+    Keeps the result of a small query in memory. Writers in this process call invalidate(); the value is also
+    re-read every max_age seconds so changes committed by the other process (bot vs. admin API) show up.
+    Nothing is cached while this thread has a transaction open, since it may still roll back.
+    """
+    def __init__(self, loader, max_age):
+        self.loader = loader
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self.invalidate()
+
+    def invalidate(self):
+        with self._lock:
+            self._value = _MISSING
+            self._key = None
+
+    def get(self):
+        pool = get_pool()
+        now = time.monotonic()
+        value, key = self._value, self._key
+        if value is not _MISSING and key is not None and key[0] is pool and now - key[1] < self.max_age:
+            return value
+        if pool.in_transaction():
+            return self.loader()
+        value = self.loader()
+        with self._lock:
+            # Only keep it if nobody invalidated while we were loading
+            if self._key is key:
+                self._value = value
+                self._key = (pool, now)
+        return value
+
+def push_db(target_dir=None):
+    """
+    Ships a hot snapshot of the database to the replica directory (REPLICA_PATH in the config).
+    The bot can keep running; only pages changed since the last push are written.
+    """
+    return replication.replicate(path, target_dir or bot_config.get_replica_path())
 
 def rm_db():
-    p = subprocess.Popen(command_prefix+'rm smash_league.sqlite'+command_suffix, shell=True).wait()
+    close_connections()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
 
 def create_tables():
-    # Connecting to the database file
-    conn = get_connection()
-    c = conn.cursor()
-
-    c.execute('CREATE TABLE player (slack_id TEXT PRIMARY KEY, name TEXT, grouping TEXT, active INT)')
-
-    # Creating a second table with 1 column and set it as PRIMARY KEY
-    # note that PRIMARY KEY column must consist of unique values!
-    c.execute('CREATE TABLE match ('
-              'player_1 TEXT, '
-              'player_2 TEXT, '
-              'winner TEXT, '
-              'week DATE, '
-              'grouping TEXT, '
-              'season INT, '
-              'sets INT, '
-              'FOREIGN KEY (player_1) REFERENCES player, '
-              'FOREIGN KEY (player_2) REFERENCES player, '
-              'FOREIGN KEY (winner) REFERENCES player)')
-
-    # Committing changes and closing the connection to the database file
-    conn.commit()
-    conn.close()
+    return _migrate(get_pool())
 
 def create_floor_battle_tables():
-    conn = get_connection()
-    c = conn.cursor()
-
-    c.execute('CREATE TABLE floor_player (slack_id TEXT PRIMARY KEY, name TEXT, floor TEXT)')
-    c.execute('CREATE TABLE floor_match ('
-              'winner TEXT, '
-              'loser TEXT, '
-              'sets INT, '
-              'FOREIGN KEY (winner) REFERENCES floor_player, '
-              'FOREIGN KEY (loser) REFERENCES floor_player)')
-    conn.commit()
-    conn.close()
+    with transaction() as c:
+        c.execute('CREATE TABLE floor_player (slack_id TEXT PRIMARY KEY, name TEXT, floor TEXT)')
+        c.execute('CREATE TABLE floor_match ('
+                  'winner TEXT, '
+                  'loser TEXT, '
+                  'sets INT, '
+                  'FOREIGN KEY (winner) REFERENCES floor_player, '
+                  'FOREIGN KEY (loser) REFERENCES floor_player)')
+
+def _normalize_grouping(grouping):
+    # Group letters are stored upper case (migration 8), so lookups can use a plain = and the (season, grouping) indexes
+    return grouping.upper() if grouping is not None else None
 
 def add_player(slack_id, name, grouping):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("INSERT INTO player VALUES ('{}', '{}', '{}', 1)".format(slack_id, name.replace("'","''"), grouping))
-    conn.commit()
-    conn.close()
+    with transaction():
+        _execute('INSERT INTO player VALUES (?, ?, ?, 1)', (slack_id, name, _normalize_grouping(grouping)))
+        bump_data_version()
+    get_pool().after_commit(_player_directory.invalidate)
 
 def add_floor_player(slack_id, name, floor):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("INSERT INTO floor_player VALUES ('{}', '{}', '{}')".format(slack_id, name, floor))
-    conn.commit()
-    conn.close()
-
-class Player:
-    def __init__(self, slack_id, name, grouping, active):
-        self.slack_id = slack_id
-        self.name = name
-        self.grouping = grouping
-        self.active = active
+    _execute('INSERT INTO floor_player VALUES (?, ?, ?)', (slack_id, name, floor))
+
+# Models are immutable tuples built straight from rows by the sqlite row_factory, so there is no per-row
+# __init__/from_db dispatch, no per-instance dict, and copying one is free. Use _replace() to get a
+# modified copy.
+_new = tuple.__new__
+
+def _tuple_factory(cls):
+    return lambda cursor, row: _new(cls, row)
+
+class Player(collections.namedtuple('Player', 'slack_id name grouping active')):
+    __slots__ = ()
 
     @classmethod
     def from_db(cls, row):
-        return Player(row[0], row[1], row[2], row[3])
+        return _new(cls, row)
 
     def __str__(self):
         return self.name + ' ' + self.slack_id + ' ' + self.grouping + ' ' + str(self.active)
@@ -91,15 +174,12 @@ class Player:
     def __repr__(self):
         return self.name + ' ' + self.slack_id + ' ' + self.grouping + ' ' + str(self.active)
 
-class FloorPlayer:
-    def __init__(self, slack_id, name, floor):
-        self.slack_id = slack_id
-        self.name = name
-        self.floor = floor
+class FloorPlayer(collections.namedtuple('FloorPlayer', 'slack_id name floor')):
+    __slots__ = ()
 
     @classmethod
     def from_db(cls, row):
-        return FloorPlayer(row[0], row[1], row[2])
+        return _new(cls, row)
 
     def __str__(self):
         return self.name + ' ' + self.slack_id + ' ' + self.floor + ' '
@@ -107,180 +187,403 @@ class FloorPlayer:
     def __repr__(self):
         return self.name + ' ' + self.slack_id + ' ' + self.floor + ' '
 
-def get_players():
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('SELECT * FROM player')
-    rows = c.fetchall()
-    conn.close()
+_player_factory = _tuple_factory(Player)
+_floor_player_factory = _tuple_factory(FloorPlayer)
 
-    return [Player.from_db(p) for p in rows]
+def get_players():
+    return _fetchall('SELECT * FROM player', factory=_player_factory)
 
 def get_floor_players():
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('SELECT * FROM floor_player')
-    rows = c.fetchall()
-    conn.close()
-
-    return [FloorPlayer.from_db(p) for p in rows]
+    return _fetchall('SELECT * FROM floor_player', factory=_floor_player_factory)
 
 def get_active_players():
-    return [p for p in get_players() if p.active]
+    return _fetchall('SELECT * FROM player WHERE active', factory=_player_factory)
 
 def get_player_by_name(name):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT * FROM player WHERE name = '{}'".format(name))
-    row = c.fetchone()
-    conn.close()
-    if row is None or len(row) == 0:
+    row = _fetchone('SELECT * FROM player WHERE name = ?', (name,), _player_factory)
+    if row is None:
         print('Couldn not find player with name:', name)
         return None
-    return Player.from_db(row)
+    return row
 
 def get_player_by_id(id):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT * FROM player WHERE slack_id = '{}'".format(id))
-    row = c.fetchone()
-    conn.close()
-    if len(row) == 0:
+    row = _fetchone('SELECT * FROM player WHERE slack_id = ?', (id,), _player_factory)
+    if row is None:
         print('Couldn not find player with id:', id)
         return None
-    return Player.from_db(row)
+    return row
 
 def get_floor_player_by_id(id):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT * FROM floor_player WHERE slack_id = '{}'".format(id))
-    row = c.fetchone()
-    conn.close()
-    if row == None or len(row) == 0:
+    row = _fetchone('SELECT * FROM floor_player WHERE slack_id = ?', (id,), _floor_player_factory)
+    if row is None:
         print('Could not find player with id:', id)
         return None
-    return FloorPlayer.from_db(row)
+    return row
 
 def set_floor_for_player(slack_id, floor):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("UPDATE floor_player SET floor = '{}' WHERE slack_id = '{}'".format(floor, slack_id))
-    conn.commit()
-    conn.close()
+    _execute('UPDATE floor_player SET floor = ? WHERE slack_id = ?', (floor, slack_id))
 
 def update_grouping(slack_id, grouping):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("UPDATE player SET grouping='{}' WHERE slack_id = '{}'".format(grouping, slack_id))
-    conn.commit()
-    conn.close()
+    with transaction():
+        _execute('UPDATE player SET grouping = ? WHERE slack_id = ?', (_normalize_grouping(grouping), slack_id))
+        bump_data_version()
+    get_pool().after_commit(_player_directory.invalidate)
 
 def set_active(slack_id, active):
-    conn = get_connection()
-    c = conn.cursor()
     active_int = 1 if active else 0
-    c.execute("UPDATE player SET active={} WHERE slack_id = '{}'".format(active_int, slack_id))
-    conn.commit()
-    conn.close()
+    with transaction():
+        _execute('UPDATE player SET active = ? WHERE slack_id = ?', (active_int, slack_id))
+        bump_data_version()
+    get_pool().after_commit(_player_directory.invalidate)
 
-def add_match(player_1, player_2, week_date, grouping, season):
-    conn = get_connection()
-    c = conn.cursor()
+_player_directory = _CachedValue(lambda: PlayerDirectory(get_players()), max_age=5)
+
+def _load_data_version():
+    row = _fetchone('SELECT version FROM data_version')
+    return row[0] if row is not None else 0
+
+# Checked before every cached bot response; re-read every couple of seconds to pick up the other process's writes
+_data_version = _CachedValue(_load_data_version, max_age=2)
+
+def get_data_version():
+    """A counter that goes up whenever scores, rosters or seasons change (see response_cache)."""
+    return _data_version.get()
+
+def bump_data_version():
+    """Marks everything derived from the league data as stale. Call it in the transaction that changes it."""
+    _execute('UPDATE data_version SET version = version + 1')
+    # Not before the commit: another thread could re-read and cache the old version in between
+    get_pool().after_commit(_data_version.invalidate)
+
+def get_player_directory():
+    """All players indexed by slack id and name (see PlayerDirectory). Load it once per request or command."""
+    return _player_directory.get()
+
+def _match_row(player_1, player_2, week_date, grouping, season):
+    grouping = _normalize_grouping(grouping)
     if player_1 is None or player_2 is None:
         p_id = player_1.slack_id if player_1 is not None else player_2.slack_id
-        c.execute("INSERT INTO match VALUES ('{}', null, null, '{}', '{}', {}, 0)".format(p_id, str(week_date), grouping, season))
-    else:
-        c.execute("INSERT INTO match VALUES ('{}', '{}', null, '{}', '{}', {}, 0)".format(player_1.slack_id, player_2.slack_id, str(week_date), grouping, season))
-    conn.commit()
-    conn.close()
+        return (p_id, None, str(week_date), grouping, season)
+    return (player_1.slack_id, player_2.slack_id, str(week_date), grouping, season)
+
+def add_match(player_1, player_2, week_date, grouping, season):
+    add_matches([(player_1, player_2, week_date, grouping, season)])
+
+def add_matches(matches):
+    """
+    Inserts many matches in one transaction.
+    :param matches: iterable of (player_1, player_2, week_date, grouping, season), same as add_match's arguments
+    """
+    rows = [_match_row(*m) for m in matches]
+    # Every player starts the season with an empty standings row, in the order they first appear
+    standings = []
+    for p1, p2, week, grouping, season in rows:
+        standings.append((season, grouping, p1))
+        if p2 is not None:
+            standings.append((season, grouping, p2))
+    with transaction() as c:
+        c.executemany('INSERT INTO match VALUES (?, ?, null, ?, ?, ?, 0)', rows)
+        c.executemany('INSERT OR IGNORE INTO standings VALUES (?, ?, ?, 0, 0, 0, 0)', standings)
+        bump_data_version()
 
 def add_floor_match(winner_id, loser_id, sets):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("INSERT INTO floor_match VALUES ('{}', '{}', {})".format(winner_id, loser_id, sets))
-    conn.commit()
-    conn.close()
+    _execute('INSERT INTO floor_match VALUES (?, ?, ?)', (winner_id, loser_id, sets))
     return True
 
-class Match:
-    def __init__(self, p1_id, p2_id, winner_id, week, grouping, season, sets):
-        self.player_1_id = p1_id
-        self.player_2_id = p2_id
-        self.winner_id = winner_id
-        self.week = week
-        self.grouping = grouping
-        self.season = season
-        self.sets = sets
+class Match(collections.namedtuple('Match', 'player_1_id player_2_id winner_id week grouping season sets')):
+    __slots__ = ()
 
     @classmethod
     def from_db(cls, row):
-        return Match(row[0], row[1], row[2], row[3], row[4], row[5], row[6])
+        return _new(cls, row)
 
-class FloorMatch:
-    def __init__(self, winner_id, loser_id, sets):
-        self.winner_id = winner_id
-        self.loser_id = loser_id
-        self.sets = sets
+class FloorMatch(collections.namedtuple('FloorMatch', 'winner_id loser_id sets')):
+    __slots__ = ()
 
     @classmethod
     def from_db(cls, row):
-        return FloorMatch(row[0], row[1], row[2])
+        return _new(cls, row)
+
+_floor_match_factory = _tuple_factory(FloorMatch)
+
+# week is read as text and parsed once per distinct value by the factory instead of per row by the DATE converter.
+# Match lists are always returned in insertion (rowid) order whichever index the query uses; standings and
+# the season markup list tied players and week rows in that order.
+MATCH_COLUMNS = 'player_1, player_2, winner, CAST(week AS TEXT), grouping, season, sets'
+
+def _parse_date(text):
+    return datetime.date(*map(int, text.split('-')))
+
+def _match_factory():
+    """
+    Row factory for one match query. A result set repeats the same few slack ids and weeks thousands of
+    times, so every row shares one str/date object per distinct value instead of holding its own copies.
+    """
+    shared = {None: None}
+    weeks = {None: None}
+    share = shared.setdefault
+
+    def factory(cursor, row):
+        p1, p2, winner, week, grouping, season, sets = row
+        if week not in weeks:
+            weeks[week] = _parse_date(week)
+        return _new(Match, (share(p1, p1), share(p2, p2), share(winner, winner), weeks[week], grouping, season, sets))
+    return factory
 
 def get_floor_matches():
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('SELECT * FROM floor_match')
-    rows = c.fetchall()
-    conn.close()
-    return [FloorMatch.from_db(m) for m in rows]
+    return _fetchall('SELECT * FROM floor_match', factory=_floor_match_factory)
 
 def get_matches():
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('SELECT * FROM match')
-    rows = c.fetchall()
-    conn.close()
-
-    return [Match.from_db(m) for m in rows]
+    return _fetchall('SELECT ' + MATCH_COLUMNS + ' FROM match ORDER BY rowid', factory=_match_factory())
 
 def get_matches_for_season(season):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('SELECT * FROM match WHERE season = {}'.format(season))
-    rows = c.fetchall()
-    conn.close()
-
-    return [Match.from_db(m) for m in rows]
+    return _fetchall('SELECT ' + MATCH_COLUMNS + ' FROM match WHERE season = ? ORDER BY rowid', (season,), _match_factory())
 
 def clear_matches_for_season(season):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('DELETE FROM match WHERE season = {}'.format(season))
-    conn.commit()
-    conn.close()
+    with transaction():
+        _execute('DELETE FROM match WHERE season = ?', (season,))
+        _execute('DELETE FROM standings WHERE season = ?', (season,))
+        _execute('DELETE FROM season WHERE season = ?', (season,))
+        if _fetchone('SELECT 1 FROM career_season WHERE season = ?', (season,)) is not None:
+            rebuild_career_stats()
+        if _fetchone('SELECT 1 FROM rating_change WHERE match NOT IN (SELECT rowid FROM match)') is not None:
+            rebuild_ratings()
+        _execute("UPDATE season SET status = 'active' WHERE season = (SELECT MAX(season) FROM season)")
+        bump_data_version()
+    get_pool().after_commit(_current_season.invalidate) # after the caller's commit when this is nested in one
+
+def get_matches_for_group(season, grouping):
+    return _fetchall('SELECT ' + MATCH_COLUMNS + ' FROM match WHERE season = ? and grouping = ? ORDER BY rowid',
+                     (season, _normalize_grouping(grouping)), _match_factory())
 
 def get_matches_for_week(week):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT * FROM match WHERE week = '{}'".format(week))
-    rows = c.fetchall()
-    conn.close()
-
-    return [Match.from_db(m) for m in rows]
+    return _fetchall('SELECT ' + MATCH_COLUMNS + ' FROM match WHERE week = ? ORDER BY rowid', (str(week),), _match_factory())
 
 def get_match_by_players(player_a, player_b):
     season = get_current_season()
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT * FROM match WHERE season = {} and (player_1 = '{}' or player_2 = '{}') and (player_1 = '{}' or player_2 = '{}')"\
-              .format(season, player_a.slack_id, player_a.slack_id, player_b.slack_id, player_b.slack_id))
-    row = c.fetchone()
-    conn.close()
-
-    if len(row) == 0:
+    row = _fetchone('SELECT ' + MATCH_COLUMNS + ' FROM match WHERE season = ? and ((player_1 = ? and player_2 = ?) or (player_1 = ? and player_2 = ?))',
+                    (season, player_a.slack_id, player_b.slack_id, player_b.slack_id, player_a.slack_id), _match_factory())
+
+    if row is None:
         print("No match for players:", player_a.name, player_b.name)
         return None
-    return Match.from_db(row)
+    return row
+
+class ScoreResult:
+    UPDATED = 'updated'
+    ALREADY_REPORTED = 'already reported'
+    NOT_FOUND = 'not found'
+    INVALID = 'invalid'
+
+    def __init__(self, status, match=None, replaced=None, best_of=None):
+        self.status = status
+        self.match = match # the match as it stands after the call, when there is one
+        self.replaced = replaced # the match as it was, when overwrite replaced a reported result
+        self.best_of = best_of # the season's format, for explaining an INVALID score
+
+    def __bool__(self):
+        return self.status == ScoreResult.UPDATED
+
+def enter_score(winner_id, loser_id, sets, overwrite=False):
+    """
+    Reports a result for the current season's match between two slack ids. The lookup, the checks and the
+    guarded UPDATE share one write transaction, so two reports racing for the same match can't both win.
+    Standings, career stats and ratings are updated in the same transaction.
+    :param sets: games played in the match, e.g. 4 for a 3-1 in a best of 5
+    :param overwrite: replace a result that was already reported (commissioner corrections)
+    :return: a ScoreResult
+    """
+    if winner_id == loser_id:
+        return ScoreResult(ScoreResult.INVALID)
+
+    season = get_current_season()
+    with transaction() as c:
+        best_of = _get_best_of(c, season)
+        if sets not in range(best_of // 2 + 1, best_of + 1):
+            return ScoreResult(ScoreResult.INVALID, best_of=best_of)
+
+        row = c.execute('SELECT rowid, ' + MATCH_COLUMNS + ' FROM match WHERE season = ? and ((player_1 = ? and player_2 = ?) or (player_1 = ? and player_2 = ?))',
+                        (season, winner_id, loser_id, loser_id, winner_id)).fetchone()
+        if row is None:
+            return ScoreResult(ScoreResult.NOT_FOUND)
+
+        rowid, match = row[0], _match_factory()(c, row[1:])
+        if match.winner_id is not None and not overwrite:
+            return ScoreResult(ScoreResult.ALREADY_REPORTED, match)
+
+        c.execute('UPDATE match SET winner = ?, sets = ? WHERE rowid = ? and (winner IS NULL or ?)',
+                  (winner_id, sets, rowid, 1 if overwrite else 0))
+        new_match = match._replace(winner_id=winner_id, sets=sets)
+        if match.winner_id is not None:
+            _apply_to_standings(c, match, -1)
+            _apply_to_career(c, match, best_of, -1)
+            ratings.undo_result(c, rowid)
+        _apply_to_standings(c, new_match, 1)
+        _apply_to_career(c, new_match, best_of, 1)
+        ratings.apply_result(c, rowid, winner_id, loser_id, sets, best_of)
+        bump_data_version()
+    return ScoreResult(ScoreResult.UPDATED, new_match, match if match.winner_id is not None else None)
+
+def _get_best_of(c, season):
+    row = c.execute('SELECT best_of FROM season WHERE season = ?', (season,)).fetchone()
+    if row is None or row[0] is None:
+        return 5
+    return row[0]
+
+def _result_totals(won, sets):
+    # (matches won, matches lost, sets won, sets lost) a reported result adds to one player, as gather_scores counts them
+    if won:
+        return (1, 0, 3, max(sets - 3, 0))
+    return (0, 1, max(sets - 3, 0), 3)
+
+def _apply_to_standings(c, match, sign):
+    """Adds (sign=1) or takes back (sign=-1) a reported match's result in the standings table."""
+    for player_id in (match.player_1_id, match.player_2_id):
+        totals = _result_totals(player_id == match.winner_id, match.sets)
+        c.execute('UPDATE standings SET matches_won = matches_won + ?, matches_lost = matches_lost + ?, '
+                  'sets_won = sets_won + ?, sets_lost = sets_lost + ? WHERE season = ? and grouping = ? and player = ?',
+                  tuple(sign * t for t in totals) + (match.season, match.grouping, player_id))
+
+def _career_totals(won, sets, best_of):
+    # (matches won, matches lost, games won, games lost) a reported result adds to one player's career
+    to_win = best_of // 2 + 1
+    if won:
+        return (1, 0, to_win, max(sets - to_win, 0))
+    return (0, 1, max(sets - to_win, 0), to_win)
+
+def _apply_to_career(c, match, best_of, sign):
+    """Adds (sign=1) or takes back (sign=-1) a reported match's result in the career tables."""
+    for player_id in (match.player_1_id, match.player_2_id):
+        totals = tuple(sign * t for t in _career_totals(player_id == match.winner_id, match.sets, best_of))
+        c.execute('INSERT OR IGNORE INTO career_season VALUES (?, ?, 0, 0, 0, 0)', (player_id, match.season))
+        c.execute('UPDATE career_season SET matches_won = matches_won + ?, matches_lost = matches_lost + ?, '
+                  'games_won = games_won + ?, games_lost = games_lost + ? WHERE player = ? and season = ?',
+                  totals + (player_id, match.season))
+        c.execute('INSERT OR IGNORE INTO career VALUES (?, 0, 0, 0, 0)', (player_id,))
+        c.execute('UPDATE career SET matches_won = matches_won + ?, matches_lost = matches_lost + ?, '
+                  'games_won = games_won + ?, games_lost = games_lost + ? WHERE player = ?',
+                  totals + (player_id,))
+
+class CareerStats(collections.namedtuple('CareerStats', 'slack_id name matches_won matches_lost games_won games_lost')):
+    __slots__ = ()
+
+    @property
+    def winrate(self):
+        # Share of individual games won, as a percentage
+        games = self.games_won + self.games_lost
+        if games == 0:
+            return 0
+        return round(self.games_won / games * 100, 2)
+
+_career_factory = _tuple_factory(CareerStats)
+
+def get_career_stats():
+    """Career totals for every player, including those who never played (all zeros)."""
+    return _fetchall('SELECT p.slack_id, p.name, COALESCE(c.matches_won, 0), COALESCE(c.matches_lost, 0), '
+                     'COALESCE(c.games_won, 0), COALESCE(c.games_lost, 0) '
+                     'FROM player p LEFT JOIN career c ON c.player = p.slack_id', factory=_career_factory)
+
+def get_player_career(slack_id):
+    """
+    :return: (CareerStats totals, list of (season, matches won, matches lost, games won, games lost)), or None
+    """
+    totals = _fetchone('SELECT p.slack_id, p.name, COALESCE(c.matches_won, 0), COALESCE(c.matches_lost, 0), '
+                       'COALESCE(c.games_won, 0), COALESCE(c.games_lost, 0) '
+                       'FROM player p LEFT JOIN career c ON c.player = p.slack_id WHERE p.slack_id = ?',
+                       (slack_id,), _career_factory)
+    if totals is None:
+        return None
+    seasons = _fetchall('SELECT season, matches_won, matches_lost, games_won, games_lost FROM career_season '
+                        'WHERE player = ? ORDER BY season', (slack_id,))
+    return totals, seasons
+
+def rebuild_career_stats():
+    """Recomputes both career tables from the match history, e.g. after fixing a season's best_of."""
+    with transaction() as c:
+        c.execute('DELETE FROM career_season')
+        c.execute('DELETE FROM career')
+        c.execute('INSERT INTO career_season ' + migrations.CAREER_RECOMPUTE.format(where='1'))
+        c.execute('INSERT INTO career ' + migrations.CAREER_TOTALS)
+
+def set_best_of(season, best_of):
+    with transaction():
+        _execute('UPDATE season SET best_of = ? WHERE season = ?', (best_of, season))
+        rebuild_career_stats()
+        rebuild_ratings()
+
+class Rating(collections.namedtuple('Rating', 'slack_id name rating matches')):
+    __slots__ = ()
+
+_rating_factory = _tuple_factory(Rating)
+
+def get_ratings():
+    """Every player's rating, highest first; players without a reported match are at ratings.START_RATING."""
+    return _fetchall('SELECT p.slack_id, p.name, COALESCE(r.rating, ?), COALESCE(r.matches, 0) '
+                     'FROM player p LEFT JOIN rating r ON r.player = p.slack_id ORDER BY 3 DESC, p.name',
+                     (ratings.START_RATING,), _rating_factory)
+
+def get_player_rating(slack_id):
+    """
+    :return: (Rating, place among all players by rating), or None for an unknown player
+    """
+    rating = _fetchone('SELECT p.slack_id, p.name, COALESCE(r.rating, ?), COALESCE(r.matches, 0) '
+                       'FROM player p LEFT JOIN rating r ON r.player = p.slack_id WHERE p.slack_id = ?',
+                       (ratings.START_RATING, slack_id), _rating_factory)
+    if rating is None:
+        return None
+    above = _fetchone('SELECT COUNT(*) FROM player p LEFT JOIN rating r ON r.player = p.slack_id '
+                      'WHERE COALESCE(r.rating, ?) > ?', (ratings.START_RATING, rating.rating))[0]
+    return rating, above + 1
+
+def rebuild_ratings():
+    """Replays all of the match history into the rating tables, e.g. after correcting an old result."""
+    with transaction() as c:
+        return ratings.rebuild(c)
+
+def get_groupings(season):
+    return [r[0] for r in _fetchall('SELECT DISTINCT grouping FROM standings WHERE season = ? ORDER BY grouping', (season,))]
+
+def get_standings(season, grouping):
+    """
+    A group's standings as gather_scores builds them, before tie breaks: dicts with player_id, m_w, m_l, s_w
+    and s_l, best record first. The group letter is matched case-insensitively.
+    """
+    rows = _fetchall('SELECT player, matches_won, matches_lost, sets_won, sets_lost FROM standings '
+                     'WHERE season = ? and grouping = ? '
+                     'ORDER BY matches_won DESC, matches_lost, sets_won DESC, sets_lost, rowid',
+                     (season, _normalize_grouping(grouping)))
+    return [{'player_id': r[0], 'm_w': r[1], 'm_l': r[2], 's_w': r[3], 's_l': r[4]} for r in rows]
+
+def _recompute_standings(season):
+    where = '1' if season is None else 'season = {:d}'.format(season)
+    return _fetchall(migrations.STANDINGS_RECOMPUTE.format(where=where))
+
+def verify_standings(season=None):
+    """
+    Compares the standings table to a full recompute from the match table.
+    :return: a list of (season, grouping, player, stored totals, recomputed totals) that disagree
+    """
+    where = '' if season is None else ' WHERE season = {:d}'.format(season)
+    stored = dict(((r[0], r[1], r[2]), tuple(r[3:])) for r in _fetchall('SELECT * FROM standings' + where))
+    recomputed = dict(((r[0], r[1], r[2]), tuple(r[3:])) for r in _recompute_standings(season))
+    mismatches = []
+    for key in sorted(set(stored) | set(recomputed), key=str):
+        if stored.get(key) != recomputed.get(key):
+            mismatches.append(key + (stored.get(key), recomputed.get(key)))
+    return mismatches
+
+def rebuild_standings(season=None):
+    """Replaces the standings table (or one season of it) with a full recompute. Returns what verify_standings found."""
+    with transaction() as c:
+        mismatches = verify_standings(season)
+        rows = _recompute_standings(season)
+        if season is None:
+            c.execute('DELETE FROM standings')
+        else:
+            c.execute('DELETE FROM standings WHERE season = ?', (season,))
+        c.executemany('INSERT INTO standings VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+        bump_data_version()
+    return mismatches
 
 def update_match(winner_name, loser_name, sets):
     winner = get_player_by_name(winner_name)
@@ -293,34 +596,77 @@ def update_match_by_id(winner_id, loser_id, sets):
     return _update_match(winner, loser, sets)
 
 def _update_match(winner, loser, sets):
+    # Used by the admin scripts, which may correct results that were already entered
     if winner is None or loser is None:
         print('Could not update match')
         return False
 
-    if sets not in [3,4,5]:
-        print('Sets must be best of 5')
-        return False
-
-    match = get_match_by_players(winner, loser)
-    if match is None:
+    result = enter_score(winner.slack_id, loser.slack_id, sets, overwrite=True)
+    if result.status == ScoreResult.INVALID:
+        print('Sets must fit the season\'s best of')
+    if not result:
         print('Could not update match')
         return False
-
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("UPDATE match SET winner='{}', sets={} WHERE player_1 = '{}' and player_2 = '{}' and season={}"\
-              .format(winner.slack_id, sets, match.player_1_id, match.player_2_id, match.season))
-    conn.commit()
-    conn.close()
     return True
 
-def get_current_season():
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT MAX(season) FROM match")
-    rows = c.fetchall()
-    conn.close()
-    current_season = rows[0][0]
+def _normalize_joining(joining):
+    return [(slack_id, name, _normalize_grouping(grouping)) for slack_id, name, grouping in joining]
+
+def preview_roster_change(joining=(), leaving=(), season=None, from_week=None):
+    """What change_roster would do, without changing anything (see roster.plan for the arguments)."""
+    if season is None:
+        season = get_current_season()
+    return roster.plan(get_connection(), season, _normalize_joining(joining), leaving, from_week)
+
+def change_roster(joining=(), leaving=(), season=None, from_week=None):
+    """
+    Adds, moves and removes players mid-season and reschedules their groups in one transaction.
+    :param joining: (slack_id, name, grouping) for each player joining a group
+    :param leaving: slack ids of players leaving the league
+    :return: the roster.RosterPlan that was applied; raises roster.RosterError without changing anything
+    """
+    if season is None:
+        season = get_current_season()
+    with transaction() as c:
+        plan = roster.plan(c, season, _normalize_joining(joining), leaving, from_week)
+        roster.apply(c, plan)
+        bump_data_version()
+    get_pool().after_commit(_player_directory.invalidate)
+    return plan
+
+class Season(collections.namedtuple('Season', 'season start_date weeks status best_of')):
+    __slots__ = ()
+
+    @classmethod
+    def from_db(cls, row):
+        weeks = [_parse_date(w) for w in json.loads(row[2])]
+        return _new(cls, (row[0], row[1], weeks, row[3], row[4]))
+
+_season_factory = lambda cursor, row: Season.from_db(row)
+
+def create_season(season, start_date, weeks, best_of=5):
+    """Records a new season as the active one. Call it in the same transaction that adds its matches."""
+    weeks = sorted(set(str(w) for w in weeks))
+    with transaction():
+        _execute("UPDATE season SET status = 'complete' WHERE status = 'active'")
+        _execute("INSERT INTO season VALUES (?, ?, ?, 'active', ?)", (season, str(start_date), json.dumps(weeks), best_of))
+        bump_data_version()
+    get_pool().after_commit(_current_season.invalidate)
+
+def get_season(season):
+    return _fetchone('SELECT * FROM season WHERE season = ?', (season,), _season_factory)
+
+def get_seasons():
+    return _fetchall('SELECT * FROM season ORDER BY season', factory=_season_factory)
+
+def _load_current_season():
+    current_season = _fetchone('SELECT MAX(season) FROM season')[0]
     if current_season is None:
         return 0
     return current_season
+
+# Resolved on nearly every command, but only changes when a season is created or cleared
+_current_season = _CachedValue(_load_current_season, max_age=5)
+
+def get_current_season():
+    return _current_season.get()
@@ -0,0 +1,235 @@
+import asyncio
+import collections
+import json
+import logging
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from supervisor import Supervisor
+
+# Event driven message handling for the bot. The loop watches the RTM socket with add_reader, so frames are
+# read the moment they arrive instead of on a once a second poll. Each message is queued on its channel;
+# a channel's messages are handled one at a time, in the order they came in (a score report before the
+# standings it prints), while different channels are handled side by side. Handlers are the bot's normal
+# synchronous methods, run on worker threads, at most MAX_HANDLERS at a time.
+#
+# The transport is anything with connect(), close(), fileno() and a non-blocking read() returning a list of events:
+# SlackTransport for the real thing, SocketTransport for json lines over a local socket in tests and benches.
+# A Supervisor owns the connection: heartbeats, reconnects and dropping messages already handled.
+
+MAX_HANDLERS = 4 # handlers running at once, across all channels
+
+class SlackTransport:
+    """The slackclient RTM websocket."""
+    can_reconnect = True
+
+    def __init__(self, slack_client):
+        self.slack_client = slack_client
+
+    def connect(self):
+        return self.slack_client.rtm_connect()
+
+    def fileno(self):
+        return self.slack_client.server.websocket.fileno()
+
+    def read(self):
+        return self.slack_client.rtm_read()
+
+    def close(self):
+        try:
+            self.slack_client.server.websocket.close()
+        except Exception:
+            pass # already gone
+
+    def ping(self, ping_id):
+        self.slack_client.server.send_to_websocket({'type': 'ping', 'id': ping_id})
+
+    def history(self, channel, oldest):
+        """Messages in channel after ts oldest, oldest first, shaped like RTM message events."""
+        response = self.slack_client.api_call('conversations.history', channel=channel, oldest=oldest, limit=100)
+        messages = response.get('messages', []) if response.get('ok') else []
+        return [dict(m, channel=channel) for m in reversed(messages)]
+
+class SocketTransport:
+    """
+    Events as json lines on a socket, for tests and benches. Pair it with socket.socketpair() and write frames
+    to the other end with send(). Closing the other end ends the dispatcher's run, unless reopen is given:
+    a function returning a new socket to carry on with, as a reconnect would.
+    """
+    def __init__(self, sock, reopen=None):
+        self.sock = sock
+        self.sock.setblocking(False)
+        self.reopen = reopen
+        self._buffer = b''
+        self.closed = False
+
+    @property
+    def can_reconnect(self):
+        return not self.closed or self.reopen is not None
+
+    @staticmethod
+    def send(sock, *events):
+        sock.sendall(b''.join(json.dumps(e).encode('utf-8') + b'\n' for e in events))
+
+    def connect(self):
+        if self.closed and self.reopen is not None:
+            self.sock = self.reopen()
+            self.sock.setblocking(False)
+            self._buffer = b''
+            self.closed = False
+        return not self.closed
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        self.sock.close()
+        self.closed = True
+
+    def ping(self, ping_id):
+        try:
+            SocketTransport.send(self.sock, {'type': 'ping', 'id': ping_id})
+        except OSError:
+            pass # a dead peer shows up as missed pongs
+
+    def read(self):
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                break
+            if not data:
+                self.closed = True
+                break
+            self._buffer += data
+        *lines, self._buffer = self._buffer.split(b'\n')
+        if self.closed and not lines:
+            raise ConnectionError('Socket transport closed')
+        return [json.loads(line) for line in lines if line]
+
+class Dispatcher:
+    """
+    Reads events from transport as they arrive and calls handle(event) for each one that filter_events lets
+    through, in per channel order.
+    :param handle: a synchronous function taking one event dict; it runs on a worker thread
+    :param filter_events: takes the list of events from one read and returns the ones to handle
+    """
+    def __init__(self, transport, handle, filter_events=None, max_handlers=MAX_HANDLERS, logger=None, supervisor=None):
+        self.transport = transport
+        self.handle = handle
+        self.filter_events = filter_events or (lambda events: events)
+        self.max_handlers = max_handlers
+        self.logger = logger or logging.getLogger('smashbot')
+        self.supervisor = supervisor or Supervisor(transport, logger=self.logger)
+        self._queues = {} # channel -> deque of events waiting behind the one being handled
+        self._workers = set() # the loop only keeps weak references to tasks
+        self._idle = None
+        self._stopped = None
+        self._semaphore = None
+        self._executor = None
+        self._loop = None
+        self._fd = None
+        self._reconnecting = False
+
+    async def run(self):
+        """Handles events until stop() is called or the transport can't reconnect. The transport must be connected."""
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._semaphore = asyncio.Semaphore(self.max_handlers)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_handlers, thread_name_prefix='handler')
+        self.supervisor.on_connected()
+        heartbeat = self._loop.create_task(self.supervisor.heartbeat(self._lost))
+        try:
+            self._watch()
+            self._on_readable() # anything that came in before we were watching
+            await self._stopped.wait()
+            await self.drain()
+        finally:
+            heartbeat.cancel()
+            self._unwatch()
+            self._executor.shutdown(wait=True)
+
+    def stop(self):
+        """Stops reading; run() returns once the queued messages are handled. Safe to call from any thread."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+
+    async def drain(self):
+        """Waits until every event read so far has been handled."""
+        await self._idle.wait()
+
+    def _watch(self):
+        self._fd = self.transport.fileno()
+        self._loop.add_reader(self._fd, self._on_readable)
+
+    def _unwatch(self):
+        if self._fd is not None:
+            self._loop.remove_reader(self._fd)
+            self._fd = None
+
+    def _on_readable(self):
+        try:
+            events = self.transport.read()
+        except Exception as e:
+            self._lost(e)
+            return
+        self._submit_all(self.supervisor.received(events or []))
+
+    def _submit_all(self, events):
+        for event in self.filter_events(events):
+            self.submit(event)
+
+    def _lost(self, reason):
+        # Stop reading the dead socket and reconnect in the background; queued messages keep being handled
+        if self._reconnecting:
+            return
+        self._reconnecting = True
+        self._unwatch()
+        self.supervisor.on_lost(reason)
+        self._loop.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        connected = await self.supervisor.reconnect()
+        self._reconnecting = False
+        if not connected:
+            if getattr(self.transport, 'can_reconnect', True):
+                self.logger.error('Giving up on reconnecting')
+            self._stopped.set()
+            return
+        self._watch()
+        self._submit_all(await self.supervisor.missed())
+        self._on_readable()
+
+    def submit(self, event):
+        """Queues one event behind the others from its channel."""
+        channel = event.get('channel')
+        queue = self._queues.get(channel)
+        if queue is not None:
+            queue.append(event)
+            return
+        self._queues[channel] = collections.deque([event])
+        self._idle.clear()
+        task = self._loop.create_task(self._work(channel))
+        self._workers.add(task)
+        task.add_done_callback(self._workers.discard)
+
+    async def _work(self, channel):
+        # One task per channel with something queued; it goes away when the channel's queue is empty
+        queue = self._queues[channel]
+        while queue:
+            event = queue[0]
+            async with self._semaphore:
+                try:
+                    await self._loop.run_in_executor(self._executor, self.handle, event)
+                except Exception as e:
+                    self.logger.error('Handler failed: {}'.format(e))
+            queue.popleft()
+        del self._queues[channel]
+        if not self._queues:
+            self._idle.set()
+
+def socket_pair():
+    """(SocketTransport, the socket to write events to) over a local socket pair."""
+    ours, theirs = socket.socketpair()
+    return SocketTransport(ours), theirs
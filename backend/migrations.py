@@ -0,0 +1,199 @@
+import datetime
+import json
+
+# Schema upgrades, applied in order and recorded in schema_version. Every step must be idempotent so a
+# database created before versioning existed (tables but no schema_version) upgrades cleanly.
+# Never edit a released step; append a new one instead.
+
+def _base_tables(c):
+    c.execute('CREATE TABLE IF NOT EXISTS player (slack_id TEXT PRIMARY KEY, name TEXT, grouping TEXT, active INT)')
+    c.execute('CREATE TABLE IF NOT EXISTS match ('
+              'player_1 TEXT, '
+              'player_2 TEXT, '
+              'winner TEXT, '
+              'week DATE, '
+              'grouping TEXT, '
+              'season INT, '
+              'sets INT, '
+              'FOREIGN KEY (player_1) REFERENCES player, '
+              'FOREIGN KEY (player_2) REFERENCES player, '
+              'FOREIGN KEY (winner) REFERENCES player)')
+
+def _match_indexes(c):
+    # (season, grouping) also serves MAX(season) and plain season filters
+    c.execute('CREATE INDEX IF NOT EXISTS match_season_grouping ON match (season, grouping)')
+    c.execute('CREATE INDEX IF NOT EXISTS match_week ON match (week)')
+    # Both orders so a pair lookup hits an index whichever player reported
+    c.execute('CREATE INDEX IF NOT EXISTS match_season_players ON match (season, player_1, player_2)')
+    c.execute('CREATE INDEX IF NOT EXISTS match_season_players_reversed ON match (season, player_2, player_1)')
+    c.execute('ANALYZE match')
+
+def _season_table(c):
+    c.execute('CREATE TABLE IF NOT EXISTS season ('
+              'season INT PRIMARY KEY, '
+              'start_date DATE, '
+              'weeks TEXT, ' # json list of the season's week dates
+              'status TEXT)')
+    weeks_by_season = {}
+    for season, week in c.execute('SELECT DISTINCT season, week FROM match ORDER BY season, week'):
+        weeks_by_season.setdefault(season, []).append(str(week))
+    c.executemany("INSERT OR IGNORE INTO season VALUES (?, ?, ?, 'complete')",
+                  [(season, weeks[0], json.dumps(weeks)) for season, weeks in weeks_by_season.items()])
+    c.execute("UPDATE season SET status = 'active' WHERE season = (SELECT MAX(season) FROM season)")
+
+# Full recompute of standings from the match table, used to backfill and to verify/rebuild it (db.rebuild_standings).
+# Rows come out in the order each player first appears in the group's matches, which is the order
+# match_making.gather_scores lists fully tied players in. {where} filters the match table.
+STANDINGS_RECOMPUTE = '''
+    SELECT season, grouping, player, SUM(won), SUM(lost), SUM(sets_won), SUM(sets_lost) FROM (
+        SELECT rowid * 2 AS seen, season, grouping, player_1 AS player,
+               CASE WHEN winner = player_1 THEN 1 ELSE 0 END AS won,
+               CASE WHEN winner IS NOT NULL AND winner != player_1 THEN 1 ELSE 0 END AS lost,
+               CASE WHEN winner IS NULL THEN 0 WHEN winner = player_1 THEN 3 ELSE MAX(sets - 3, 0) END AS sets_won,
+               CASE WHEN winner IS NULL THEN 0 WHEN winner = player_1 THEN MAX(sets - 3, 0) ELSE 3 END AS sets_lost
+        FROM match WHERE player_1 IS NOT NULL AND {where}
+        UNION ALL
+        SELECT rowid * 2 + 1, season, grouping, player_2,
+               CASE WHEN winner = player_2 THEN 1 ELSE 0 END,
+               CASE WHEN winner IS NOT NULL AND winner != player_2 THEN 1 ELSE 0 END,
+               CASE WHEN winner IS NULL THEN 0 WHEN winner = player_2 THEN 3 ELSE MAX(sets - 3, 0) END,
+               CASE WHEN winner IS NULL THEN 0 WHEN winner = player_2 THEN MAX(sets - 3, 0) ELSE 3 END
+        FROM match WHERE player_2 IS NOT NULL AND {where}
+    ) GROUP BY season, grouping, player ORDER BY season, grouping, MIN(seen)'''
+
+def _standings_table(c):
+    # One row per player per group per season, kept current by db.enter_score
+    c.execute('CREATE TABLE IF NOT EXISTS standings ('
+              'season INT, '
+              'grouping TEXT, '
+              'player TEXT, '
+              'matches_won INT, '
+              'matches_lost INT, '
+              'sets_won INT, '
+              'sets_lost INT, '
+              'PRIMARY KEY (season, grouping, player))')
+    c.execute('INSERT OR IGNORE INTO standings ' + STANDINGS_RECOMPUTE.format(where='1'))
+
+# Per player per season career totals. Games are the individual games inside a match; how many the winner
+# took depends on the season's format (best_of), which is what the old leaderboard code got wrong.
+CAREER_RECOMPUTE = '''
+    SELECT player, season, SUM(won), SUM(lost), SUM(games_won), SUM(games_lost) FROM (
+        SELECT m.player_1 AS player, m.season AS season,
+               CASE WHEN winner = player_1 THEN 1 ELSE 0 END AS won,
+               CASE WHEN winner = player_1 THEN 0 ELSE 1 END AS lost,
+               CASE WHEN winner = player_1 THEN COALESCE(s.best_of, 5) / 2 + 1
+                    ELSE MAX(sets - (COALESCE(s.best_of, 5) / 2 + 1), 0) END AS games_won,
+               CASE WHEN winner = player_1 THEN MAX(sets - (COALESCE(s.best_of, 5) / 2 + 1), 0)
+                    ELSE COALESCE(s.best_of, 5) / 2 + 1 END AS games_lost
+        FROM match m LEFT JOIN season s ON s.season = m.season
+        WHERE winner IS NOT NULL AND player_1 IS NOT NULL AND {where}
+        UNION ALL
+        SELECT m.player_2, m.season,
+               CASE WHEN winner = player_2 THEN 1 ELSE 0 END,
+               CASE WHEN winner = player_2 THEN 0 ELSE 1 END,
+               CASE WHEN winner = player_2 THEN COALESCE(s.best_of, 5) / 2 + 1
+                    ELSE MAX(sets - (COALESCE(s.best_of, 5) / 2 + 1), 0) END,
+               CASE WHEN winner = player_2 THEN MAX(sets - (COALESCE(s.best_of, 5) / 2 + 1), 0)
+                    ELSE COALESCE(s.best_of, 5) / 2 + 1 END
+        FROM match m LEFT JOIN season s ON s.season = m.season
+        WHERE winner IS NOT NULL AND player_2 IS NOT NULL AND {where}
+    ) GROUP BY player, season'''
+
+CAREER_TOTALS = '''
+    SELECT player, SUM(matches_won), SUM(matches_lost), SUM(games_won), SUM(games_lost)
+    FROM career_season GROUP BY player'''
+
+def _career_tables(c):
+    columns = [r[1] for r in c.execute('PRAGMA table_info(season)')]
+    if 'best_of' not in columns:
+        c.execute('ALTER TABLE season ADD COLUMN best_of INT DEFAULT 5')
+        # Early seasons were best of 3: a 2-0 (sets = 2) can only happen there
+        c.execute('UPDATE season SET best_of = 3 WHERE season IN '
+                  '(SELECT DISTINCT season FROM match WHERE winner IS NOT NULL AND sets = 2)')
+    c.execute('CREATE TABLE IF NOT EXISTS career_season ('
+              'player TEXT, '
+              'season INT, '
+              'matches_won INT, '
+              'matches_lost INT, '
+              'games_won INT, '
+              'games_lost INT, '
+              'PRIMARY KEY (player, season))')
+    c.execute('CREATE TABLE IF NOT EXISTS career ('
+              'player TEXT PRIMARY KEY, '
+              'matches_won INT, '
+              'matches_lost INT, '
+              'games_won INT, '
+              'games_lost INT)')
+    c.execute('INSERT OR IGNORE INTO career_season ' + CAREER_RECOMPUTE.format(where='1'))
+    c.execute('INSERT OR IGNORE INTO career ' + CAREER_TOTALS)
+
+# Ratings come from replaying the match history in Python (ratings.rebuild), which changes with the rating
+# rules, so this step only creates the tables; db fills them right after it is applied (see db._migrate).
+RATING_TABLES = 6
+
+def _rating_tables(c):
+    # Current Elo rating per player, and what each reported match (by match rowid) did to its two players
+    c.execute('CREATE TABLE IF NOT EXISTS rating ('
+              'player TEXT PRIMARY KEY, '
+              'rating REAL, '
+              'matches INT)')
+    c.execute('CREATE TABLE IF NOT EXISTS rating_change ('
+              'match INTEGER PRIMARY KEY, '
+              'winner TEXT, '
+              'loser TEXT, '
+              'winner_change REAL, '
+              'loser_change REAL)')
+
+def _data_version_table(c):
+    # One counter bumped by every write that changes what the bot shows (see response_cache)
+    c.execute('CREATE TABLE IF NOT EXISTS data_version (id INTEGER PRIMARY KEY CHECK (id = 0), version INT)')
+    c.execute('INSERT OR IGNORE INTO data_version VALUES (0, 0)')
+
+def _upper_case_groupings(c):
+    # Lookups compare grouping with a plain = so they can use the (season, grouping) indexes; db writes it upper case
+    c.execute('UPDATE player SET grouping = UPPER(grouping) WHERE grouping != UPPER(grouping)')
+    c.execute('UPDATE match SET grouping = UPPER(grouping) WHERE grouping != UPPER(grouping)')
+    # Two spellings of one group could both have a row for a player, so the standings are recomputed instead
+    if c.execute('SELECT 1 FROM standings WHERE grouping != UPPER(grouping) LIMIT 1').fetchone() is not None:
+        c.execute('DELETE FROM standings')
+        c.execute('INSERT INTO standings ' + STANDINGS_RECOMPUTE.format(where='1'))
+
+MIGRATIONS = [
+    (1, 'player and match tables', _base_tables),
+    (2, 'match indexes', _match_indexes),
+    (3, 'season table', _season_table),
+    (4, 'standings table', _standings_table),
+    (5, 'season format and career tables', _career_tables),
+    (RATING_TABLES, 'rating tables', _rating_tables),
+    (7, 'data version', _data_version_table),
+    (8, 'upper case groupings', _upper_case_groupings),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def get_version(conn):
+    conn.execute('CREATE TABLE IF NOT EXISTS schema_version (version INT PRIMARY KEY, description TEXT, applied_at TEXT)')
+    return conn.execute('SELECT MAX(version) FROM schema_version').fetchone()[0] or 0
+
+def migrate(manager, target=None):
+    """
+    Brings the database behind a ConnectionManager up to target (default: the latest version).
+    Each step runs in its own transaction together with its schema_version row.
+    :return: the list of versions that were applied
+    """
+    target = LATEST_VERSION if target is None else target
+    applied = []
+    with manager.transaction() as conn:
+        current = get_version(conn)
+    for version, description, step in MIGRATIONS:
+        if version <= current or version > target:
+            continue
+        with manager.transaction() as conn:
+            # Another process may have applied it while we waited for the write lock
+            if get_version(conn) >= version:
+                continue
+            step(conn)
+            conn.execute('INSERT INTO schema_version VALUES (?, ?, ?)',
+                         (version, description, datetime.datetime.now().isoformat()))
+        applied.append(version)
+    return applied
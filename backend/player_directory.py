@@ -0,0 +1,39 @@
+class PlayerDirectory:
+    """
+    Every player indexed by slack id and by name, for rendering code that looks players up once per cell.
+    Get one from db.get_player_directory(); it is rebuilt after player writes, so hold on to it for one
+    request or command rather than keeping it around.
+    """
+    def __init__(self, players):
+        self.players = list(players)
+        self._by_id = {}
+        self._by_name = {}
+        for player in self.players:
+            self._by_id.setdefault(player.slack_id, player)
+            self._by_name.setdefault(player.name, player) # first one wins, like get_player_by_name
+
+    def __len__(self):
+        return len(self.players)
+
+    def __iter__(self):
+        return iter(self.players)
+
+    def __contains__(self, slack_id):
+        return slack_id in self._by_id
+
+    def __getitem__(self, slack_id):
+        return self._by_id[slack_id]
+
+    def get(self, slack_id, default=None):
+        return self._by_id.get(slack_id, default)
+
+    def by_name(self, name, default=None):
+        return self._by_name.get(name, default)
+
+    def name(self, slack_id, default='Bye'):
+        """The player's name, or default for a bye (None) or an unknown id."""
+        player = self._by_id.get(slack_id)
+        return default if player is None else player.name
+
+    def active(self):
+        return [p for p in self.players if p.active]
@@ -0,0 +1,317 @@
+import os, sys
+sys.path.append(os.path.dirname(__file__))
+
+import collections
+import itertools
+import db
+import match_making
+import tie_breaker
+
+# Best and worst possible final places for every player in a group, and whether they have clinched promotion
+# or been eliminated from it (and the same for relegation).
+#
+# Places are decided by wins, so each bound is worked out over win counts alone. A player's best place comes
+# from them winning every open match, and their worst from losing every one (both only help or hurt them).
+# The question is then how few (or how many) others can be kept at or below (or pushed to or above) them,
+# which is a small assignment problem checked per set of players. That gives two ranges per player: whether
+# they finish above or below their tied rivals depends on the tie breaker. When the ranges leave that open,
+# and the group has few enough open matches, every result is played out exactly. Margins are only
+# enumerated for the players who end up tied.
+
+PROMOTED = 2 # the top two move up a group
+RELEGATED = 2 # and the bottom two move down
+EXACT_LIMIT = 8 # most open matches the exact fallback will play out (2^n winner combinations, well under a second)
+
+Outlook = collections.namedtuple('Outlook', 'player_id place best worst clinched eliminated safe relegated exact')
+Outlook.__doc__ = """
+A player's prospects. place is where they stand now; best and worst bound the final place (both exact when
+exact is set, otherwise best may be too optimistic and worst too pessimistic). clinched/eliminated are about
+promotion and safe/relegated about relegation; each is only set when it is certain.
+"""
+
+_UNLIMITED = 1 << 30
+
+def _assign(open_matches, capacity):
+    """
+    Gives each open match's win to one of its two players without going over capacity[player], moving earlier
+    wins around when that makes room (augmenting paths). Returns how many matches found a winner.
+    """
+    won = [[] for _ in capacity]
+    owner = [None] * len(open_matches)
+
+    def place(k, seen):
+        for q in open_matches[k]:
+            if q in seen:
+                continue
+            seen.add(q)
+            if len(won[q]) < capacity[q]:
+                won[q].append(k)
+                owner[k] = q
+                return True
+            for other in list(won[q]):
+                if place_elsewhere(other, q, seen):
+                    won[q].remove(other)
+                    won[q].append(k)
+                    owner[k] = q
+                    return True
+        return False
+
+    def place_elsewhere(k, current, seen):
+        i, j = open_matches[k]
+        q = j if current == i else i
+        if q == current or q in seen:
+            return False
+        seen.add(q)
+        if len(won[q]) < capacity[q]:
+            won[q].append(k)
+            owner[k] = q
+            return True
+        for other in list(won[q]):
+            if place_elsewhere(other, q, seen):
+                won[q].remove(other)
+                won[q].append(k)
+                owner[k] = q
+                return True
+        return False
+
+    return sum(1 for k in range(len(open_matches)) if place(k, set()))
+
+class _Group:
+    def __init__(self, group_matches):
+        # Byes have nobody to beat and take no place, so matches against one are left out
+        matches = [m for m in group_matches if m.player_1_id is not None and m.player_2_id is not None]
+        self.player_ids = []
+        index = {}
+        for m in matches:
+            for pid in (m.player_1_id, m.player_2_id):
+                if pid not in index:
+                    index[pid] = len(self.player_ids)
+                    self.player_ids.append(pid)
+        n = len(self.player_ids)
+        self.index = index
+        self.matches = matches
+        self.wins = [0] * n
+        self.losses = [0] * n
+        self.sets_won = [0] * n
+        self.sets_lost = [0] * n
+        self.total = [0] * n
+        self.open = [] # (i, j, match) for unplayed matches
+        for m in matches:
+            i, j = index[m.player_1_id], index[m.player_2_id]
+            self.total[i] += 1
+            self.total[j] += 1
+            if m.winner_id is None:
+                self.open.append((i, j, m))
+                continue
+            w, l = (i, j) if m.winner_id == m.player_1_id else (j, i)
+            extra = max(m.sets - 3, 0)
+            self.wins[w] += 1
+            self.losses[l] += 1
+            self.sets_won[w] += 3
+            self.sets_lost[l] += 3
+            self.sets_won[l] += extra
+            self.sets_lost[w] += extra
+
+    def _fixed(self, p, p_wins):
+        """Wins after p wins (or loses) all their open matches, and the open matches left between the others."""
+        wins = self.wins[:]
+        others = []
+        for i, j, _ in self.open:
+            if p in (i, j):
+                winner = p if p_wins else (j if i == p else i)
+                wins[winner] += 1
+            else:
+                others.append((i, j))
+        return wins, others
+
+    def _fewest_exceeding(self, wins, others, limit):
+        """Fewest players that must go over limit[q] wins (None: no limit, the player doesn't count)."""
+        candidates = [q for q in range(len(wins)) if limit[q] is not None]
+        forced = [q for q in candidates if wins[q] > limit[q]]
+        free = [q for q in candidates if q not in forced]
+        for size in range(len(free) + 1):
+            for extra in itertools.combinations(free, size):
+                over = set(forced).union(extra)
+                capacity = [_UNLIMITED if (limit[q] is None or q in over) else limit[q] - wins[q] for q in range(len(wins))]
+                if _assign(others, capacity) == len(others):
+                    return len(over)
+        return len(candidates)
+
+    def _most_reaching(self, wins, others, need):
+        """Most players that can all get to need[q] wins (None: the player doesn't count)."""
+        candidates = [q for q in range(len(wins)) if need[q] is not None]
+        for size in range(len(candidates), 0, -1):
+            for chosen in itertools.combinations(candidates, size):
+                capacity = [max(need[q] - wins[q], 0) if q in chosen else 0 for q in range(len(wins))]
+                if _assign(others, capacity) == sum(capacity):
+                    return size
+        return 0
+
+    def bounds(self, p):
+        """(best_low, best_high, worst_low, worst_high): best and worst places with ties going for / against p."""
+        n = len(self.player_ids)
+        others = [q for q in range(n) if q != p]
+        # Ranked above p: more wins, or as many wins and more matches played (order_players' losses descending)
+        wins, rest = self._fixed(p, True)
+        w = wins[p]
+        above_cap = [None] * n
+        level_cap = [None] * n
+        for q in others:
+            above_cap[q] = w if self.total[q] <= self.total[p] else w - 1
+            level_cap[q] = w - 1 if self.total[q] >= self.total[p] else w
+        best_low = 1 + self._fewest_exceeding(wins, rest, above_cap)
+        best_high = 1 + self._fewest_exceeding(wins, rest, level_cap)
+
+        wins, rest = self._fixed(p, False)
+        w = wins[p]
+        above_need = [None] * n
+        level_need = [None] * n
+        for q in others:
+            above_need[q] = w + 1 if self.total[q] <= self.total[p] else w
+            level_need[q] = w if self.total[q] >= self.total[p] else w + 1
+        worst_low = 1 + self._most_reaching(wins, rest, above_need)
+        worst_high = 1 + self._most_reaching(wins, rest, level_need)
+        return best_low, best_high, worst_low, worst_high
+
+    def exact_places(self, best, worst, goal_best, goal_worst):
+        """
+        True best and worst places, playing out every result. best/worst start at places known to be reachable
+        and goal_best/goal_worst at the bounds they can't pass; a tie is only broken (with the margins of the
+        tied players' open matches enumerated) when it could still move someone, and the search stops early
+        once everyone has reached their bound.
+        """
+        n = len(self.player_ids)
+        best, worst = best[:], worst[:]
+        Match = collections.namedtuple('Match', 'player_1_id player_2_id winner_id')
+        played = [Match(m.player_1_id, m.player_2_id, m.winner_id) for m in self.matches if m.winner_id is not None]
+        ties = {} # (bucket, results of its players' open matches) -> _tie_positions
+        for outcome in itertools.product((0, 1), repeat=len(self.open)):
+            if best == goal_best and worst == goal_worst:
+                break
+            wins, losses = self.wins[:], self.losses[:]
+            decided = []
+            for (i, j, m), second in zip(self.open, outcome):
+                w, l = (j, i) if second else (i, j)
+                wins[w] += 1
+                losses[l] += 1
+                decided.append((w, l))
+
+            buckets = {}
+            for q in range(n):
+                buckets.setdefault((wins[q], losses[q]), []).append(q)
+            h2h = None
+            place = 1
+            for record in sorted(buckets, reverse=True):
+                bucket = buckets[record]
+                last = place + len(bucket) - 1
+                if any(best[q] > place or worst[q] < last for q in bucket):
+                    if len(bucket) == 1:
+                        positions = {bucket[0]: (0, 0)}
+                    else:
+                        # A tie only depends on the results of matches its own players took part in, which
+                        # repeat across many outcomes
+                        relevant = tuple(d for d in decided if d[0] in bucket or d[1] in bucket)
+                        key = (tuple(bucket), relevant)
+                        positions = ties.get(key)
+                        if positions is None:
+                            if h2h is None:
+                                results = [Match(m.player_1_id, m.player_2_id, self.player_ids[w])
+                                           for (_, _, m), (w, _) in zip(self.open, decided)]
+                                h2h = tie_breaker.HeadToHead(self.player_ids, played + results)
+                            positions = ties[key] = self._tie_positions(bucket, relevant, h2h)
+                    for q, (first, final) in positions.items():
+                        best[q] = min(best[q], place + first)
+                        worst[q] = max(worst[q], place + final)
+                place = last + 1
+        return best, worst
+
+    def _tie_positions(self, bucket, decided, h2h):
+        """
+        (highest, lowest) position each player of a tied bucket can take, over the margins of the bucket's open
+        matches. Only the bucket's own sets matter to its tie breaker, so those are all that is enumerated.
+        """
+        members = dict((q, k) for k, q in enumerate(bucket))
+        states = {tuple((self.sets_won[q], self.sets_lost[q]) for q in bucket)}
+        for w, l in decided:
+            kw, kl = members.get(w), members.get(l)
+            if kw is None and kl is None:
+                continue
+            grown = set()
+            for state in states:
+                for extra in (0, 1, 2): # 3-0, 3-1, 3-2
+                    s = list(state)
+                    if kw is not None:
+                        s[kw] = (s[kw][0] + 3, s[kw][1] + extra)
+                    if kl is not None:
+                        s[kl] = (s[kl][0] + extra, s[kl][1] + 3)
+                    grown.add(tuple(s))
+            states = grown
+
+        # The tie breaker only compares sets between the tied players, so states that rank them the same way
+        # are broken the same way
+        patterns = set()
+        for state in states:
+            won = sorted(set(s[0] for s in state))
+            lost = sorted(set(s[1] for s in state))
+            patterns.add(tuple((won.index(s[0]), lost.index(s[1])) for s in state))
+
+        size = len(bucket)
+        positions = dict((q, (size - 1, 0)) for q in bucket)
+        for state in patterns:
+            players = [{'player_id': self.player_ids[q], 'q': q, 's_w': state[k][0], 's_l': state[k][1]}
+                       for k, q in enumerate(bucket)]
+            players.sort(key=lambda p: (-p['s_w'], p['s_l']))
+            for position, p in enumerate(tie_breaker.resolve_tie(players, [], h2h)):
+                first, final = positions[p['q']]
+                positions[p['q']] = (min(first, position), max(final, position))
+            if all(first == 0 and final == size - 1 for first, final in positions.values()):
+                break
+        return positions
+
+def predict_group(group_matches, promoted=PROMOTED, relegated=RELEGATED, exact_limit=EXACT_LIMIT):
+    """
+    Outlooks for every player in a group, in current standings order.
+    :param group_matches: all of the group's matches for the season, played or not
+    """
+    group = _Group(group_matches)
+    n = len(group.player_ids)
+    standings = [p for p in match_making.gather_scores(group.matches) if p['player_id'] in group.index]
+
+    ranges = [group.bounds(p) for p in range(n)]
+    exact = all(best_low == best_high and worst_low == worst_high for best_low, best_high, worst_low, worst_high in ranges)
+    if exact:
+        best = [r[0] for r in ranges]
+        worst = [r[3] for r in ranges]
+    elif len(group.open) <= exact_limit:
+        # Start from what is certainly reachable (ties going the wrong way) and stop at the optimistic bounds
+        best, worst = group.exact_places([r[1] for r in ranges], [r[2] for r in ranges],
+                                         [r[0] for r in ranges], [r[3] for r in ranges])
+        exact = True
+    else:
+        best = [r[0] for r in ranges]
+        worst = [r[3] for r in ranges]
+
+    outlooks = []
+    for place, player in enumerate(standings, 1):
+        q = group.index[player['player_id']]
+        known = exact or (ranges[q][0] == ranges[q][1] and ranges[q][2] == ranges[q][3])
+        outlooks.append(Outlook(
+            player_id=player['player_id'],
+            place=place,
+            best=best[q],
+            worst=worst[q],
+            clinched=worst[q] <= promoted,
+            eliminated=best[q] > promoted,
+            safe=worst[q] <= n - relegated,
+            relegated=best[q] > n - relegated,
+            exact=known))
+    return outlooks
+
+def predict_season(season=None, **kwargs):
+    """predict_group for every group of a season, as {grouping: [Outlook]}."""
+    if season is None:
+        season = db.get_current_season()
+    by_group = {}
+    for m in db.get_matches_for_season(season):
+        by_group.setdefault(m.grouping, []).append(m)
+    return dict((grouping, predict_group(matches, **kwargs)) for grouping, matches in sorted(by_group.items()))
@@ -0,0 +1,105 @@
+import logging
+import re
+import sys
+import threading
+import time
+
+# Opt-in query instrumentation for the connection layer (see db.enable_query_stats). Every statement run on an
+# instrumented connection is counted twice: under its shape (the SQL with literals and whitespace normalized)
+# and under the outermost db.py function it ran for, so an N+1 loop in a caller shows up as one function
+# with a call count far above its callers'.
+
+_WHITESPACE = re.compile(r'\s+')
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LISTS = re.compile(r'\?(?:\s*,\s*\?)+')
+
+def statement_shape(sql):
+    shape = _WHITESPACE.sub(' ', sql).strip()
+    shape = _LITERALS.sub('?', shape)
+    return _PLACEHOLDER_LISTS.sub('?, ...', shape)
+
+def _calling_function():
+    # Outermost frame in the db module is the public function the caller used; fall back to the
+    # nearest frame outside this module and connection.py (migrations, scripts using raw connections)
+    frame = sys._getframe(2)
+    outermost_db = None
+    fallback = None
+    while frame is not None:
+        module = frame.f_globals.get('__name__')
+        if module == 'db':
+            outermost_db = frame
+        elif fallback is None and module not in ('connection', __name__):
+            fallback = frame
+        frame = frame.f_back
+    frame = outermost_db or fallback
+    if frame is None:
+        return '?'
+    return '{}.{}'.format(frame.f_globals.get('__name__'), frame.f_code.co_name)
+
+class _Call:
+    """One execution of a statement; fetches made later on the same cursor add to it."""
+    __slots__ = ('sql', 'shape', 'function', 'seconds', 'logged')
+
+    def __init__(self, sql, shape, function):
+        self.sql = sql
+        self.shape = shape
+        self.function = function
+        self.seconds = 0.0
+        self.logged = False
+
+class QueryStats:
+    """
+    Aggregates calls, rows and wall time per statement shape and per db function, and logs any single
+    execution slower than slow_ms to the smashbot logger.
+    """
+    def __init__(self, slow_ms=None, logger=None):
+        self.slow_seconds = slow_ms / 1000.0 if slow_ms is not None else None
+        self.logger = logger or logging.getLogger('smashbot')
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.statements = {}
+            self.functions = {}
+            self.slow_queries = 0
+
+    def begin(self, sql):
+        return _Call(sql, statement_shape(sql), _calling_function())
+
+    def record(self, call, rows, seconds, new_call=False):
+        """Adds rows and time to a call; new_call counts it as an execution."""
+        call.seconds += seconds
+        with self._lock:
+            for table, key in ((self.statements, call.shape), (self.functions, call.function)):
+                entry = table.get(key)
+                if entry is None:
+                    entry = table[key] = [0, 0, 0.0]
+                if new_call:
+                    entry[0] += 1
+                entry[1] += rows
+                entry[2] += seconds
+            slow = self.slow_seconds is not None and not call.logged and call.seconds >= self.slow_seconds
+            if slow:
+                call.logged = True
+                self.slow_queries += 1
+        if slow:
+            self.logger.warning('Slow query: %.1f ms in %s: %s', call.seconds * 1000, call.function, call.shape)
+
+    def snapshot(self):
+        """A plain dict of everything recorded since the last reset, slowest first."""
+        def table(entries):
+            rows = [(key, {'calls': calls, 'rows': rows, 'total_ms': round(seconds * 1000, 3),
+                           'mean_ms': round(seconds * 1000 / calls, 3) if calls else 0.0})
+                    for key, (calls, rows, seconds) in entries.items()]
+            rows.sort(key=lambda r: r[1]['total_ms'], reverse=True)
+            return dict(rows)
+        with self._lock:
+            return {
+                'since': self.started,
+                'slow_threshold_ms': self.slow_seconds * 1000 if self.slow_seconds is not None else None,
+                'slow_queries': self.slow_queries,
+                'functions': table(self.functions),
+                'statements': table(self.statements),
+            }
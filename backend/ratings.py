@@ -0,0 +1,104 @@
+import collections
+
+# Elo ratings over every reported match of every season. The rating table holds each player's current rating
+# and rating_change what each match did to its two players, so a score can be added (or taken back for a
+# correction) with a couple of row reads and writes inside enter_score's transaction. rebuild() replays the
+# whole history in week order from a streaming cursor, holding only one rating per player in memory.
+#
+# A player's first PROVISIONAL_MATCHES move them faster (a bigger K, as Glicko would for an uncertain
+# rating), and a result counts for more the more lopsided it was.
+
+START_RATING = 1500.0
+K = 32
+PROVISIONAL_K = 48
+PROVISIONAL_MATCHES = 10
+REBUILD_BATCH = 500 # matches fetched (and changes written) at a time by rebuild
+
+def expected_score(rating, opponent):
+    """Chance a player rated rating beats one rated opponent."""
+    return 1 / (1 + 10 ** ((opponent - rating) / 400))
+
+def k_factor(matches):
+    return PROVISIONAL_K if matches < PROVISIONAL_MATCHES else K
+
+def rating_changes(winner, loser, winner_matches, loser_matches, sets, best_of):
+    """
+    (winner's change, loser's change) for one result. sets is games played, as in the match table; a sweep
+    counts 4/3 as much as a 3-1 in a best of 5 and a 3-2 2/3.
+    """
+    to_win = best_of // 2 + 1
+    loser_games = min(max(sets - to_win, 0), to_win - 1)
+    margin = (to_win - loser_games + 1) / to_win
+    surprise = 1 - expected_score(winner, loser)
+    return k_factor(winner_matches) * margin * surprise, -k_factor(loser_matches) * margin * surprise
+
+def _current(c, player):
+    row = c.execute('SELECT rating, matches FROM rating WHERE player = ?', (player,)).fetchone()
+    return (START_RATING, 0) if row is None else row
+
+def apply_result(c, match_rowid, winner, loser, sets, best_of):
+    """Rates one reported match (match_rowid is its rowid in the match table) on connection c."""
+    winner_rating, winner_matches = _current(c, winner)
+    loser_rating, loser_matches = _current(c, loser)
+    winner_change, loser_change = rating_changes(winner_rating, loser_rating, winner_matches, loser_matches, sets, best_of)
+    c.execute('INSERT OR REPLACE INTO rating VALUES (?, ?, ?)', (winner, winner_rating + winner_change, winner_matches + 1))
+    c.execute('INSERT OR REPLACE INTO rating VALUES (?, ?, ?)', (loser, loser_rating + loser_change, loser_matches + 1))
+    c.execute('INSERT OR REPLACE INTO rating_change VALUES (?, ?, ?, ?, ?)',
+              (match_rowid, winner, loser, winner_change, loser_change))
+
+def undo_result(c, match_rowid):
+    """
+    Takes back what a match did to its players' ratings, before a corrected result is applied. Results
+    rated in between keep the changes they got; rebuild() gives the exact ratings after a correction.
+    """
+    row = c.execute('SELECT winner, loser, winner_change, loser_change FROM rating_change WHERE match = ?',
+                    (match_rowid,)).fetchone()
+    if row is None:
+        return
+    winner, loser, winner_change, loser_change = row
+    c.execute('UPDATE rating SET rating = rating - ?, matches = matches - 1 WHERE player = ?', (winner_change, winner))
+    c.execute('UPDATE rating SET rating = rating - ?, matches = matches - 1 WHERE player = ?', (loser_change, loser))
+    c.execute('DELETE FROM rating_change WHERE match = ?', (match_rowid,))
+
+def rebuild(c):
+    """Replays every reported match in week order (report order within a week) into empty rating tables."""
+    c.execute('DELETE FROM rating')
+    c.execute('DELETE FROM rating_change')
+    best_of = dict((season, b or 5) for season, b in c.execute('SELECT season, best_of FROM season'))
+    ratings = {} # player -> [rating, matches]
+    matches = c.execute('SELECT rowid, player_1, player_2, winner, sets, season FROM match '
+                        'WHERE winner IS NOT NULL AND player_1 IS NOT NULL AND player_2 IS NOT NULL '
+                        'ORDER BY week, rowid')
+    while True:
+        rows = matches.fetchmany(REBUILD_BATCH)
+        if not rows:
+            break
+        changes = []
+        for rowid, player_1, player_2, winner, sets, season in rows:
+            if winner not in (player_1, player_2) or player_1 == player_2:
+                continue
+            loser = player_2 if winner == player_1 else player_1
+            w = ratings.setdefault(winner, [START_RATING, 0])
+            l = ratings.setdefault(loser, [START_RATING, 0])
+            winner_change, loser_change = rating_changes(w[0], l[0], w[1], l[1], sets, best_of.get(season, 5))
+            w[0] += winner_change
+            l[0] += loser_change
+            w[1] += 1
+            l[1] += 1
+            changes.append((rowid, winner, loser, winner_change, loser_change))
+        c.executemany('INSERT INTO rating_change VALUES (?, ?, ?, ?, ?)', changes)
+    c.executemany('INSERT INTO rating VALUES (?, ?, ?)', [(p, r, m) for p, (r, m) in ratings.items()])
+    return len(ratings)
+
+def seed_groups(player_ids, ratings, group_sizes):
+    """
+    Splits players into groups by rating, best first: {grouping letter: [slack ids]}. ratings maps slack id
+    to rating (unrated players start at START_RATING); group_sizes is how many go in each group, in order.
+    """
+    ranked = sorted(player_ids, key=lambda p: ratings.get(p, START_RATING), reverse=True)
+    groups = collections.OrderedDict()
+    start = 0
+    for g, size in enumerate(group_sizes):
+        groups[chr(ord('A') + g)] = ranked[start:start + size]
+        start += size
+    return groups
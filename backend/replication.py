@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+# Copies the live database to a replica directory (a mounted share or anything synced to the server).
+# A snapshot is taken with sqlite's online backup API, which under WAL holds only a read snapshot, so the bot
+# keeps writing while it runs. Only pages that differ from the last shipped copy are written to the replica,
+# and the result is checked against the snapshot's checksum before the manifest marks it good.
+
+MANIFEST_NAME = 'manifest.json'
+
+class ReplicationError(Exception):
+    pass
+
+def snapshot(source_path, dest_path):
+    """Writes a transactionally consistent copy of source_path to dest_path without blocking writers."""
+    source = sqlite3.connect(source_path)
+    dest = sqlite3.connect(dest_path)
+    try:
+        # One step: a multi-step backup restarts whenever another connection writes in between
+        source.backup(dest)
+    finally:
+        dest.close()
+        source.close()
+
+def _page_size(path):
+    with open(path, 'rb') as f:
+        header = f.read(100)
+    size = int.from_bytes(header[16:18], 'big')
+    return 65536 if size == 1 else size
+
+def _page_hashes(path, page_size):
+    hashes = []
+    whole = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            page = f.read(page_size)
+            if not page:
+                break
+            whole.update(page)
+            hashes.append(hashlib.blake2b(page, digest_size=16).hexdigest())
+    return hashes, whole.hexdigest()
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def read_manifest(target_dir):
+    try:
+        with open(os.path.join(target_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+def _write_manifest(target_dir, manifest):
+    temp_path = os.path.join(target_dir, MANIFEST_NAME + '.tmp')
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, os.path.join(target_dir, MANIFEST_NAME))
+
+def _ship_pages(snapshot_path, replica_path, page_size, changed, size):
+    mode = 'r+b' if os.path.exists(replica_path) else 'w+b'
+    written = 0
+    with open(snapshot_path, 'rb') as src, open(replica_path, mode) as dst:
+        for index in changed:
+            src.seek(index * page_size)
+            page = src.read(page_size)
+            dst.seek(index * page_size)
+            dst.write(page)
+            written += len(page)
+        dst.truncate(size)
+        dst.flush()
+        os.fsync(dst.fileno())
+    return written
+
+def replicate(source_path, target_dir, name=None):
+    """
+    Ships a consistent snapshot of source_path to target_dir/name, writing only the pages that changed since
+    the last run. A run that dies midway leaves the manifest marked incomplete, and the next run copies every page.
+    :return: dict of stats (pages, pages_changed, bytes_written, seconds, sha256)
+    """
+    start = time.monotonic()
+    name = name or os.path.basename(source_path)
+    os.makedirs(target_dir, exist_ok=True)
+    replica_path = os.path.join(target_dir, name)
+
+    staging = tempfile.mkdtemp()
+    try:
+        snapshot_path = os.path.join(staging, name)
+        snapshot(source_path, snapshot_path)
+        page_size = _page_size(snapshot_path)
+        hashes, checksum = _page_hashes(snapshot_path, page_size)
+        size = os.path.getsize(snapshot_path)
+
+        manifest = read_manifest(target_dir)
+        previous = []
+        if manifest is not None and manifest.get('complete') and manifest.get('name') == name \
+                and manifest.get('page_size') == page_size and os.path.exists(replica_path) \
+                and os.path.getsize(replica_path) == manifest.get('size'):
+            previous = manifest['pages']
+        changed = [i for i, h in enumerate(hashes) if i >= len(previous) or previous[i] != h]
+
+        _write_manifest(target_dir, {'name': name, 'complete': False})
+        written = _ship_pages(snapshot_path, replica_path, page_size, changed, size)
+
+        if file_checksum(replica_path) != checksum:
+            raise ReplicationError('Replica checksum does not match the snapshot')
+        _write_manifest(target_dir, {
+            'name': name,
+            'complete': True,
+            'page_size': page_size,
+            'size': size,
+            'sha256': checksum,
+            'pages': hashes,
+            'created': time.time(),
+        })
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    return {
+        'pages': len(hashes),
+        'pages_changed': len(changed),
+        'bytes_written': written,
+        'seconds': time.monotonic() - start,
+        'sha256': checksum,
+    }
+
+def verify_replica(target_dir):
+    """True if the replica in target_dir is complete and matches the checksum its manifest recorded."""
+    manifest = read_manifest(target_dir)
+    if manifest is None or not manifest.get('complete'):
+        return False
+    replica_path = os.path.join(target_dir, manifest['name'])
+    if not os.path.exists(replica_path):
+        return False
+    return file_checksum(replica_path) == manifest['sha256']
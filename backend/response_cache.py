@@ -0,0 +1,57 @@
+import collections
+import threading
+
+# Finished reply text for the bot's read-only commands (group standings, the week's matches), keyed by what
+# the text depends on plus db.get_data_version(). Every write that changes scores, rosters or seasons bumps
+# the version, so an entry can never be served after the data under it changed; entries for old versions
+# are never asked for again and fall off the end of the LRU. A hit costs a dict lookup: no queries, no tie
+# breaking, no formatting.
+
+MAX_ENTRIES = 512
+
+class ResponseCache:
+    """A size bounded LRU of built responses, safe to share between handler threads."""
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, build):
+        """
+        The cached value for key, or build() (stored under key) on a miss. key should end with the data version
+        the value was built from. Two threads missing on the same key at once may both build it.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        value = build()
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Counters for monitoring, as a dict."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
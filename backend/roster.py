@@ -0,0 +1,202 @@
+import collections
+import json
+
+# Mid-season roster changes: any number of players joining, leaving or changing group in one go. plan()
+# works out the smallest change to the season's schedule, reading the season once: a leaving player's open
+# matches are handed to a newcomer who still needs that opponent (or voided when nobody does), a remaining
+# player's open bye is filled by a newcomer, and only the pairings left over become new matches, each in the
+# eligible week where both players have the fewest matches. apply() writes a plan with a handful of
+# executemany calls, in the caller's transaction, so the preview and the change can't disagree.
+
+RosterPlan = collections.namedtuple('RosterPlan', 'season new_players moved deactivated added voided reassigned')
+RosterPlan.__doc__ = """
+new_players: (slack_id, name, grouping) to create; moved: (slack_id, grouping) for existing players joining a
+group (and made active); deactivated: slack ids leaving the league. added: (player_1, player_2, week,
+grouping) matches to create; voided: (rowid, ScheduledMatch) open matches to delete; reassigned: (rowid,
+ScheduledMatch before, ScheduledMatch after) open matches handed to a newcomer.
+"""
+
+ScheduledMatch = collections.namedtuple('ScheduledMatch', 'player_1 player_2 week grouping')
+
+class RosterError(Exception):
+    pass
+
+def _season_matches(c, season):
+    """{grouping: [(rowid, player_1, player_2, winner, week)]} in rowid order; weeks are ISO strings."""
+    groups = collections.OrderedDict()
+    for rowid, p1, p2, winner, week, grouping in c.execute(
+            'SELECT rowid, player_1, player_2, winner, CAST(week AS TEXT), grouping FROM match '
+            'WHERE season = ? ORDER BY rowid', (season,)):
+        groups.setdefault(grouping, []).append((rowid, p1, p2, winner, week))
+    return groups
+
+def _season_weeks(c, season, groups):
+    row = c.execute('SELECT weeks FROM season WHERE season = ?', (season,)).fetchone()
+    if row is not None and row[0]:
+        return sorted(json.loads(row[0]))
+    return sorted(set(week for rows in groups.values() for *_, week in rows))
+
+def plan(c, season, joining=(), leaving=(), from_week=None):
+    """
+    The schedule changes for a batch of roster changes in season, read on connection c.
+    :param joining: (slack_id, name, grouping); name is only used for players who don't exist yet. A player
+                    already scheduled in another group moves: their open matches there are handed on or voided
+    :param leaving: slack ids leaving the league for the rest of the season; played matches stand
+    :param from_week: the first week new matches may go in (default: the whole season, as add_player_to_group
+                      did)
+    :return: a RosterPlan
+    """
+    groups = _season_matches(c, season)
+    weeks = [w for w in _season_weeks(c, season, groups) if from_week is None or w >= str(from_week)]
+    members = {} # slack id -> grouping this season
+    for grouping, rows in groups.items():
+        for _, p1, p2, _, _ in rows:
+            for pid in (p1, p2):
+                if pid is not None:
+                    members.setdefault(pid, grouping)
+
+    known = dict((r[0], r[1:]) for r in c.execute('SELECT slack_id, grouping, active FROM player'))
+    departures = {} # slack id -> the group they leave
+    newcomers = collections.OrderedDict() # grouping -> [slack ids]
+    new_players, moved = [], []
+    for slack_id in leaving:
+        if slack_id not in members:
+            raise RosterError('{} is not scheduled in season {}'.format(slack_id, season))
+        departures[slack_id] = members[slack_id]
+    joining_ids = set()
+    for slack_id, name, grouping in joining:
+        if slack_id in joining_ids or slack_id in departures:
+            raise RosterError('{} is in the batch twice'.format(slack_id))
+        joining_ids.add(slack_id)
+        if members.get(slack_id) == grouping:
+            raise RosterError('{} is already scheduled in group {}'.format(slack_id, grouping))
+        if slack_id in members:
+            departures[slack_id] = members[slack_id]
+        if slack_id not in known:
+            if not name:
+                raise RosterError('{} is a new player and needs a name'.format(slack_id))
+            new_players.append((slack_id, name, grouping))
+        elif known[slack_id] != (grouping, 1):
+            moved.append((slack_id, grouping))
+        newcomers.setdefault(grouping, []).append(slack_id)
+    if newcomers and not weeks:
+        raise RosterError('Season {} has no weeks left to schedule'.format(season))
+    deactivated = [pid for pid in leaving if known.get(pid, (None, 0))[1]]
+
+    added, voided, reassigned = [], [], []
+    for grouping in sorted(set(groups) | set(newcomers)):
+        rows = groups.get(grouping, [])
+        leavers = set(pid for pid, g in departures.items() if g == grouping)
+        joiners = newcomers.get(grouping, [])
+        staying = [pid for pid in _in_order(rows) if pid not in leavers]
+        needed = collections.OrderedDict() # remaining opponent -> newcomers still to meet them
+        for t, pid in enumerate(joiners):
+            for other in staying + joiners[:t]:
+                needed.setdefault(other, []).append(pid)
+
+        loads = collections.Counter() # (player, week) -> matches
+        handed = [] # (rowid, before, opponent, week) open rows that could go to a newcomer
+        for rowid, p1, p2, winner, week in rows:
+            before = ScheduledMatch(p1, p2, week, grouping)
+            open_match = winner is None
+            if open_match and (p1 in leavers or p2 in leavers):
+                opponent = p2 if p1 in leavers else p1
+                if opponent is None or opponent in leavers or week not in weeks:
+                    voided.append((rowid, before))
+                else:
+                    handed.append((rowid, before, opponent, week))
+            elif open_match and p2 is None and week in weeks and p1 in needed:
+                handed.append((rowid, before, p1, week)) # an open bye a newcomer can fill
+            else:
+                for pid in (p1, p2):
+                    if pid is not None:
+                        loads[(pid, week)] += 1
+
+        for rowid, before, opponent, week in handed:
+            takers = needed.get(opponent, [])
+            if not takers:
+                if before.player_2 is not None: # an unused bye just stays
+                    voided.append((rowid, before))
+                continue
+            joiner = min(takers, key=lambda pid: loads[(pid, week)])
+            takers.remove(joiner)
+            if before.player_2 is None or before.player_1 == opponent:
+                after = before._replace(player_2=joiner)
+            else:
+                after = before._replace(player_1=joiner)
+            reassigned.append((rowid, before, after))
+            loads[(opponent, week)] += 1
+            loads[(joiner, week)] += 1
+
+        for opponent, takers in needed.items():
+            for joiner in takers:
+                week = min(weeks, key=lambda w: (max(loads[(joiner, w)], loads[(opponent, w)]),
+                                                 loads[(joiner, w)] + loads[(opponent, w)], w))
+                added.append(ScheduledMatch(joiner, opponent, week, grouping))
+                loads[(joiner, week)] += 1
+                loads[(opponent, week)] += 1
+
+    return RosterPlan(season, new_players, moved, deactivated, added, voided, reassigned)
+
+def _in_order(rows):
+    """A group's players in the order they first appear in its matches."""
+    seen = collections.OrderedDict()
+    for _, p1, p2, _, _ in rows:
+        for pid in (p1, p2):
+            if pid is not None:
+                seen.setdefault(pid, None)
+    return list(seen)
+
+def apply(c, plan):
+    """Writes a RosterPlan on connection c, which should have a transaction open (see db.change_roster)."""
+    c.executemany('INSERT INTO player VALUES (?, ?, ?, 1)', plan.new_players)
+    c.executemany('UPDATE player SET grouping = ?, active = 1 WHERE slack_id = ?',
+                  [(grouping, slack_id) for slack_id, grouping in plan.moved])
+    c.executemany('UPDATE player SET active = 0 WHERE slack_id = ?', [(pid,) for pid in plan.deactivated])
+    c.executemany('DELETE FROM match WHERE rowid = ?', [(rowid,) for rowid, _ in plan.voided])
+    c.executemany('UPDATE match SET player_1 = ?, player_2 = ? WHERE rowid = ? and winner IS NULL',
+                  [(after.player_1, after.player_2, rowid) for rowid, _, after in plan.reassigned])
+    c.executemany('INSERT INTO match VALUES (?, ?, null, ?, ?, ?, 0)',
+                  [(m.player_1, m.player_2, m.week, m.grouping, plan.season) for m in plan.added])
+
+    # Newcomers get an empty standings row; players left with no match in a group lose theirs
+    joined = [(plan.season, m.grouping, pid) for m in plan.added for pid in (m.player_1, m.player_2)]
+    joined += [(plan.season, after.grouping, pid) for _, _, after in plan.reassigned for pid in (after.player_1, after.player_2)
+               if pid is not None]
+    c.executemany('INSERT OR IGNORE INTO standings VALUES (?, ?, ?, 0, 0, 0, 0)', joined)
+    touched = set((m.grouping, pid) for _, m in plan.voided for pid in (m.player_1, m.player_2) if pid is not None)
+    touched |= set((before.grouping, pid) for _, before, _ in plan.reassigned for pid in (before.player_1, before.player_2)
+                   if pid is not None)
+    c.executemany('DELETE FROM standings WHERE season = ? and grouping = ? and player = ? and NOT EXISTS '
+                  '(SELECT 1 FROM match WHERE season = ? and grouping = ? and (player_1 = ? or player_2 = ?))',
+                  [(plan.season, g, pid, plan.season, g, pid, pid) for g, pid in sorted(touched)])
+
+def describe(plan, players):
+    """
+    The plan as lines of text for a preview: + new matches, - voided ones, ~ reassigned ones.
+    :param players: a PlayerDirectory; newcomers not in it yet show up by their slack id
+    """
+    names = dict((slack_id, name) for slack_id, name, _ in plan.new_players)
+
+    def name(pid):
+        if pid is None:
+            return 'Bye'
+        return names.get(pid) or players.name(pid, pid)
+
+    def pairing(m):
+        return '{} vs {}'.format(name(m.player_1), name(m.player_2))
+
+    lines = []
+    for slack_id, player_name, grouping in plan.new_players:
+        lines.append('new player {} in group {}'.format(player_name, grouping))
+    for slack_id, grouping in plan.moved:
+        lines.append('{} joins group {}'.format(name(slack_id), grouping))
+    for slack_id in plan.deactivated:
+        lines.append('{} leaves the league'.format(name(slack_id)))
+    for m in sorted(plan.added, key=lambda m: (m.grouping, m.week)):
+        lines.append('+ {} {} {}'.format(m.grouping, m.week, pairing(m)))
+    for _, m in sorted(plan.voided, key=lambda v: (v[1].grouping, v[1].week)):
+        lines.append('- {} {} {}'.format(m.grouping, m.week, pairing(m)))
+    for _, before, after in sorted(plan.reassigned, key=lambda r: (r[1].grouping, r[1].week)):
+        lines.append('~ {} {} {} -> {}'.format(before.grouping, before.week, pairing(before), pairing(after)))
+    return lines
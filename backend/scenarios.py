@@ -0,0 +1,221 @@
+import os, sys
+sys.path.append(os.path.dirname(__file__))
+
+import collections
+import concurrent.futures
+import hashlib
+import json
+import time
+import tie_breaker
+
+# Every way a group's open matches can go, counted exactly: for each player, in how many scenarios they finish
+# in each place. A scenario is a winner bitmask (bit b set: player 2 won open match b) plus how many games
+# the loser took in each match (best_of // 2 + 1 margins a match). Winner masks are walked in Gray code
+# order, so each step flips one result and updates two records instead of recounting. Margins only matter to
+# players tied on a record, so a mask whose records are all different counts all of its margin combinations
+# at once. For a tied bucket only the margins of its own players' matches are played out, cached by those
+# matches' winners; a player's histogram doesn't depend on how other buckets are split, so buckets are
+# counted one at a time. Chunks of the winner masks run on a ProcessPoolExecutor, and their histograms are
+# merged (and checkpointed, so a long run can pick up where it stopped).
+
+CHUNKS = 256 # the winner masks are split into at most this many chunks
+
+_Spec = collections.namedtuple('_Spec', 'player_ids wins losses sets_won sets_lost open h2h to_win')
+
+Enumeration = collections.namedtuple('Enumeration', 'player_ids histograms scenarios seconds scenarios_per_second')
+Enumeration.__doc__ = """
+histograms maps each player to a list of scenario counts by final place (index 0 is first). scenarios is how
+many scenarios there are in all; seconds and scenarios_per_second cover the work done by this call (chunks
+loaded from a checkpoint are not counted).
+"""
+
+def group_spec(group_matches, best_of=5):
+    """The group's played results and open matches, as plain lists a worker process can take."""
+    matches = [m for m in group_matches if m.player_1_id is not None and m.player_2_id is not None]
+    player_ids = []
+    index = {}
+    for m in matches:
+        for pid in (m.player_1_id, m.player_2_id):
+            if pid not in index:
+                index[pid] = len(player_ids)
+                player_ids.append(pid)
+    n = len(player_ids)
+    wins, losses, sets_won, sets_lost = [0] * n, [0] * n, [0] * n, [0] * n
+    h2h = [[0] * n for _ in range(n)]
+    open_matches = []
+    for m in matches:
+        i, j = index[m.player_1_id], index[m.player_2_id]
+        if m.winner_id is None:
+            open_matches.append((i, j))
+            continue
+        w, l = (i, j) if m.winner_id == m.player_1_id else (j, i)
+        extra = max(m.sets - 3, 0)
+        wins[w] += 1
+        losses[l] += 1
+        sets_won[w] += 3
+        sets_lost[l] += 3
+        sets_won[l] += extra
+        sets_lost[w] += extra
+        if m.winner_id in (m.player_1_id, m.player_2_id):
+            h2h[w][l] += 1
+    return _Spec(player_ids, wins, losses, sets_won, sets_lost, open_matches, h2h, best_of // 2 + 1)
+
+def _fingerprint(spec):
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()
+
+def _count_chunk(spec, start, stop):
+    """Histograms (one list of counts per player) over winner masks with Gray code index start..stop - 1."""
+    n, k = len(spec.player_ids), len(spec.open)
+    histograms = [[0] * n for _ in range(n)]
+    every_margin = spec.to_win ** k
+    cache = {}
+    mask = start ^ (start >> 1)
+    wins, losses = spec.wins[:], spec.losses[:]
+    for b, (i, j) in enumerate(spec.open):
+        w, l = (j, i) if mask >> b & 1 else (i, j)
+        wins[w] += 1
+        losses[l] += 1
+
+    for index in range(start, stop):
+        if index > start:
+            # Gray code index and index - 1 differ in the bit of index's lowest set bit
+            b = (index & -index).bit_length() - 1
+            mask ^= 1 << b
+            i, j = spec.open[b]
+            w, l = (j, i) if mask >> b & 1 else (i, j)
+            wins[w] += 1
+            losses[l] += 1
+            wins[l] -= 1
+            losses[w] -= 1
+
+        buckets = {}
+        for q in range(n):
+            buckets.setdefault((wins[q], losses[q]), []).append(q)
+        place = 0
+        tied = []
+        for record in sorted(buckets, reverse=True):
+            bucket = buckets[record]
+            if len(bucket) == 1:
+                histograms[bucket[0]][place] += every_margin
+            else:
+                tied.append((place, tuple(bucket)))
+            place += len(bucket)
+        for place, bucket in tied:
+            # Only the margins of matches the bucket's own players took part in can reorder it; every
+            # combination of the others' margins counts the same
+            relevant = tuple((b, mask >> b & 1) for b, (i, j) in enumerate(spec.open) if i in bucket or j in bucket)
+            key = (bucket, relevant)
+            counts = cache.get(key)
+            if counts is None:
+                counts = cache[key] = _tied_positions(spec, bucket, relevant)
+            scale = spec.to_win ** (k - len(relevant))
+            for (q, position), count in counts.items():
+                histograms[q][place + position] += count * scale
+    return histograms
+
+def _tied_positions(spec, bucket, relevant):
+    """
+    {(player, position in the bucket): margin combinations} over the margins of the relevant matches. Set
+    counts are folded match by match with a count per distinct state, and the tie breaker only compares the
+    tied players' sets with each other, so states that rank them the same way are broken once.
+    """
+    slot = dict((q, t) for t, q in enumerate(bucket))
+    h2h_rows = [row[:] for row in spec.h2h]
+    decided = []
+    for b, second in relevant:
+        i, j = spec.open[b]
+        w, l = (j, i) if second else (i, j)
+        h2h_rows[w][l] += 1
+        decided.append((slot.get(w), slot.get(l)))
+
+    states = collections.Counter({tuple((spec.sets_won[q], spec.sets_lost[q]) for q in bucket): 1})
+    for w, l in decided:
+        grown = collections.Counter()
+        for state, count in states.items():
+            for taken in range(spec.to_win):
+                extra = max(spec.to_win + taken - 3, 0)
+                s = list(state)
+                if w is not None:
+                    s[w] = (s[w][0] + 3, s[w][1] + extra)
+                if l is not None:
+                    s[l] = (s[l][0] + extra, s[l][1] + 3)
+                grown[tuple(s)] += count
+        states = grown
+
+    patterns = collections.Counter()
+    for state, count in states.items():
+        won = sorted(set(s[0] for s in state))
+        lost = sorted(set(s[1] for s in state))
+        patterns[tuple((won.index(s[0]), lost.index(s[1])) for s in state)] += count
+
+    h2h = tie_breaker.HeadToHead.from_counts(spec.player_ids, h2h_rows, [[0] * len(spec.player_ids) for _ in spec.player_ids])
+    counts = collections.Counter()
+    for pattern, count in patterns.items():
+        players = [{'player_id': spec.player_ids[q], 'q': q, 's_w': s[0], 's_l': s[1]} for q, s in zip(bucket, pattern)]
+        players.sort(key=lambda p: (-p['s_w'], p['s_l'])) # the order gather_scores hands them over in
+        for position, p in enumerate(tie_breaker.resolve_tie(players, [], h2h)):
+            counts[(p['q'], position)] += count
+    return counts
+
+def _read_checkpoint(path, fingerprint, chunk_size):
+    if path is None or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        saved = json.load(f)
+    if saved.get('fingerprint') != fingerprint or saved.get('chunk_size') != chunk_size:
+        return None # a different group or different results since; start over
+    return saved
+
+def _write_checkpoint(path, saved):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(saved, f)
+    os.replace(temp_path, path)
+
+def enumerate_group(group_matches, best_of=5, workers=None, checkpoint=None, chunks=CHUNKS):
+    """
+    Exact placement histograms for a group (byes left out).
+    :param workers: processes to use (None: one per core, 1: run in this process)
+    :param checkpoint: a json file that finished chunks are saved to and resumed from
+    """
+    spec = group_spec(group_matches, best_of)
+    n, k = len(spec.player_ids), len(spec.open)
+    masks = 1 << k
+    chunk_size = max(1, -(-masks // chunks))
+    bounds = [(start, min(start + chunk_size, masks)) for start in range(0, masks, chunk_size)]
+    fingerprint = _fingerprint(spec)
+
+    saved = _read_checkpoint(checkpoint, fingerprint, chunk_size)
+    if saved is None:
+        saved = {'fingerprint': fingerprint, 'chunk_size': chunk_size, 'done': [], 'histograms': [[0] * n for _ in range(n)]}
+    done = set(saved['done'])
+    pending = [c for c in range(len(bounds)) if c not in done]
+    histograms = saved['histograms']
+
+    def merge(c, chunk_histograms):
+        for q in range(n):
+            for p in range(n):
+                histograms[q][p] += chunk_histograms[q][p]
+        saved['done'].append(c)
+        if checkpoint is not None:
+            _write_checkpoint(checkpoint, saved)
+
+    started = time.perf_counter()
+    if workers == 1:
+        for c in pending:
+            merge(c, _count_chunk(spec, *bounds[c]))
+    elif pending:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = dict((executor.submit(_count_chunk, spec, *bounds[c]), c) for c in pending)
+            for future in concurrent.futures.as_completed(futures):
+                merge(futures[future], future.result())
+    seconds = time.perf_counter() - started
+
+    per_mask = spec.to_win ** k
+    counted = sum(bounds[c][1] - bounds[c][0] for c in pending) * per_mask
+    return Enumeration(
+        player_ids=spec.player_ids,
+        histograms=dict(zip(spec.player_ids, histograms)),
+        scenarios=masks * per_mask,
+        seconds=seconds,
+        scenarios_per_second=counted / seconds if seconds > 0 else 0.0)
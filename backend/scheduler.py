@@ -0,0 +1,190 @@
+import datetime
+import random
+
+# Round robin schedules. The circle method gives round r's pairings by index arithmetic, so a schedule for n
+# players is built in O(n^2) without rotating lists. For an odd group without byes, the last two rounds are
+# folded into the others: each of their matches takes the place of a bye, paired off by a bipartite matching
+# (bye weeks on one side, the folded matches of their bye player on the other), and the single match left
+# over goes in the first week with room for both players. validate() checks the result before anyone sees it.
+
+MAX_PER_WEEK = 2 # folding byes away gives every player one week with two matches
+RELABEL_ATTEMPTS = 20 # shuffles tried when no choice of first round avoids last season's week 1 pairings
+
+class ScheduleError(Exception):
+    pass
+
+def circle_rounds(slots):
+    """
+    The circle method for an even number of slots: slots - 1 rounds of (i, j) index pairs, every pair once.
+    Slot slots - 1 stays put and meets slot r in round r; everyone else turns around it.
+    """
+    turning = slots - 1
+    rounds = []
+    for r in range(turning):
+        pairs = [(turning, r) if r % 2 else (r, turning)] # alternate sides for the fixed slot
+        for i in range(1, slots // 2):
+            pairs.append(((r + i) % turning, (r - i) % turning))
+        rounds.append(pairs)
+    return rounds
+
+def week_dates(start_date, count, skip_weeks=()):
+    """count weekly dates from start_date, leaving out any in skip_weeks."""
+    skip = set(skip_weeks)
+    dates = []
+    week = start_date
+    while len(dates) < count:
+        if week not in skip:
+            dates.append(week)
+        week += datetime.timedelta(weeks=1)
+    return dates
+
+def _match_byes(bye_weeks, folded):
+    """
+    Pairs each bye week with a folded match its bye player is in (Kuhn's augmenting paths).
+    :param bye_weeks: the bye player of each week
+    :param folded: the (i, j) matches of the folded rounds
+    :return: {week: index into folded}
+    """
+    by_player = {}
+    for k, (i, j) in enumerate(folded):
+        by_player.setdefault(i, []).append(k)
+        by_player.setdefault(j, []).append(k)
+    week_of = {} # folded match -> week
+
+    def augment(week, seen):
+        for k in by_player.get(bye_weeks[week], []):
+            if k in seen:
+                continue
+            seen.add(k)
+            if k not in week_of or augment(week_of[k], seen):
+                week_of[k] = week
+                return True
+        return False
+
+    for week in range(len(bye_weeks)):
+        if not augment(week, set()):
+            raise ScheduleError('No folded match for the bye in week {}'.format(week + 1))
+    return dict((week, k) for k, week in week_of.items())
+
+def _fold_byes(rounds, bye, max_per_week):
+    """Weeks of (i, j) pairs with no byes, two rounds shorter (see the module comment)."""
+    if max_per_week < 2:
+        raise ScheduleError('An odd group without byes needs room for two matches a week')
+    kept, dropped = rounds[:-2], rounds[-2:]
+    weeks = [[p for p in pairs if bye not in p] for pairs in kept]
+    bye_weeks = [next(i if j == bye else j for i, j in pairs if bye in (i, j)) for pairs in kept]
+    folded = [p for pairs in dropped for p in pairs if bye not in p]
+    filled = _match_byes(bye_weeks, folded)
+    for week, k in filled.items():
+        weeks[week].append(folded[k])
+
+    loads = [dict() for _ in weeks]
+    for week, pairs in enumerate(weeks):
+        for i, j in pairs:
+            loads[week][i] = loads[week].get(i, 0) + 1
+            loads[week][j] = loads[week].get(j, 0) + 1
+    for k in set(range(len(folded))) - set(filled.values()):
+        i, j = folded[k]
+        week = next((w for w, load in enumerate(loads) if load.get(i, 0) < max_per_week and load.get(j, 0) < max_per_week), None)
+        if week is None:
+            raise ScheduleError('No week has room for the last folded match')
+        weeks[week].append((i, j))
+        loads[week][i] = loads[week].get(i, 0) + 1
+        loads[week][j] = loads[week].get(j, 0) + 1
+    return weeks
+
+def _index_weeks(count, include_byes, max_per_week, first_round):
+    """Weeks of index pairs for count players, starting from circle round first_round; index count is the bye."""
+    slots = count + count % 2
+    rounds = circle_rounds(slots)
+    rounds = rounds[first_round:] + rounds[:first_round]
+    if count % 2 and not include_byes:
+        return _fold_byes(rounds, count, max_per_week)
+    return rounds
+
+def validate(schedule, players, max_per_week=None, include_byes=False):
+    """
+    Raises ScheduleError unless every pair of players meets exactly once (and nobody meets themselves),
+    nobody plays more than max_per_week matches in a week, and byes only appear when include_byes is set.
+    :param schedule: match dicts as schedule_group returns them
+    """
+    index = dict((id(p), i) for i, p in enumerate(players))
+    seen = set()
+    loads = {}
+    for m in schedule:
+        p1, p2 = m['player_1'], m['player_2']
+        if p1 is None or p2 is None:
+            if not include_byes:
+                raise ScheduleError('Unexpected bye in week {}'.format(m['week']))
+            continue
+        if id(p1) not in index or id(p2) not in index:
+            raise ScheduleError('Match against someone outside the group in week {}'.format(m['week']))
+        i, j = index[id(p1)], index[id(p2)]
+        if i == j:
+            raise ScheduleError('Player scheduled against themselves in week {}'.format(m['week']))
+        pair = (min(i, j), max(i, j))
+        if pair in seen:
+            raise ScheduleError('Pair scheduled twice: {} and {}'.format(p1, p2))
+        seen.add(pair)
+        for player in (i, j):
+            key = (player, m['week'])
+            loads[key] = loads.get(key, 0) + 1
+            if max_per_week is not None and loads[key] > max_per_week:
+                raise ScheduleError('More than {} matches for {} in week {}'.format(max_per_week, players[player], m['week']))
+    n = len(players)
+    if len(seen) != n * (n - 1) // 2:
+        raise ScheduleError('{} of {} pairs scheduled'.format(len(seen), n * (n - 1) // 2))
+
+def schedule_group(players, start_date, skip_weeks=(), include_byes=False, max_per_week=MAX_PER_WEEK,
+                   avoid_pairs=(), key=None, rng=None):
+    """
+    A validated round robin for players as match dicts ({'player_1', 'player_2', 'week'}, player_2 None for
+    a bye), in week order.
+    :param avoid_pairs: pairs (frozensets of key(player)) to keep out of the first week, e.g. last season's
+                        week 1; a best effort, the schedule with the fewest of them is used
+    :param key: what avoid_pairs holds for a player (default: the player itself)
+    """
+    players = list(players)
+    count = len(players)
+    if count < 2:
+        return []
+    key = key or (lambda p: p)
+    avoid = set(frozenset(p) for p in avoid_pairs)
+    rng = rng or random.Random()
+
+    def conflicts(order, weeks):
+        # Index count is the bye slot, which has no player to look up
+        return sum(1 for i, j in weeks[0] if i != count and j != count and frozenset((key(order[i]), key(order[j]))) in avoid)
+
+    order = players
+    weeks = _index_weeks(count, include_byes, max_per_week, 0)
+    if avoid and conflicts(order, weeks):
+        best = None
+        for attempt in range(RELABEL_ATTEMPTS + 1):
+            if attempt:
+                order = players[:]
+                rng.shuffle(order)
+            # Any round can open the season
+            for first_round in range(count - 1 + count % 2):
+                candidate = _index_weeks(count, include_byes, max_per_week, first_round)
+                found = conflicts(order, candidate)
+                if best is None or found < best[0]:
+                    best = (found, order, candidate)
+                if not found:
+                    break
+            if best[0] == 0:
+                break
+        _, order, weeks = best
+
+    dates = week_dates(start_date, len(weeks), skip_weeks)
+    schedule = []
+    for date, pairs in zip(dates, weeks):
+        for i, j in pairs:
+            if j == count: # the bye slot
+                schedule.append({'player_1': order[i], 'player_2': None, 'week': date})
+            elif i == count:
+                schedule.append({'player_1': order[j], 'player_2': None, 'week': date})
+            else:
+                schedule.append({'player_1': order[i], 'player_2': order[j], 'week': date})
+    validate(schedule, players, max_per_week, include_byes)
+    return schedule
@@ -0,0 +1,176 @@
+import os, sys
+sys.path.append(os.path.dirname(__file__))
+
+import csv
+import html
+import io
+import db
+import match_making
+import standings_engine
+
+# The season page: standings for every group side by side, then each group's schedule by week.
+# SeasonReport works everything out in one pass over the season's matches, and render() streams it through
+# a writer, so adding a format only means adding a writer.
+
+STANDINGS_COLUMNS = 6 # groups per standings table before it continues in another
+
+class SeasonReport:
+    def __init__(self, season, matches, players):
+        self.season = season
+        self.players = players
+        by_group = {}
+        weeks = set()
+        for m in matches:
+            by_group.setdefault(m.grouping, []).append(m)
+            weeks.add(m.week)
+        self.groupings = sorted(by_group)
+        self.weeks = sorted(weeks)
+        season_standings = standings_engine.season_standings(matches)
+        self.standings = dict((grouping, season_standings.group(grouping)) for grouping in self.groupings)
+        self.schedule = {} # grouping -> {week: [matches in that week, in schedule order]}
+        for grouping, group_matches in by_group.items():
+            by_week = dict((week, []) for week in self.weeks)
+            for m in group_matches:
+                by_week[m.week].append(m)
+            self.schedule[grouping] = by_week
+
+    @classmethod
+    def load(cls, season=None):
+        if season is None:
+            season = db.get_current_season()
+        return cls(season, db.get_matches_for_season(season), db.get_player_directory())
+
+    def standings_tables(self, columns=STANDINGS_COLUMNS):
+        """Yields (groupings, rows) per standings table; each row holds one cell per grouping."""
+        rows = max([len(s) for s in self.standings.values()] or [0])
+        for start in range(0, len(self.groupings), columns):
+            groupings = self.groupings[start:start + columns]
+            yield groupings, [[self._standing_cell(grouping, i) for grouping in groupings] for i in range(rows)]
+
+    def _standing_cell(self, grouping, i):
+        standings = self.standings[grouping]
+        if i >= len(standings):
+            return ()
+        p = standings[i]
+        return (self.players.name(p['player_id']) + ' ' + str(p['m_w']) + '-' + str(p['m_l']),)
+
+    def schedule_rows(self, grouping):
+        """
+        Rows of the group's week grid. Row i holds each week's i-th match, stopping at the first week that has
+        fewer than i + 1 matches, and there are as many rows as the first week has matches.
+        """
+        by_week = self.schedule[grouping]
+        for i in range(len(by_week[self.weeks[0]])):
+            row = []
+            for week in self.weeks:
+                if i >= len(by_week[week]):
+                    break
+                m = by_week[week][i]
+                row.append((match_making.get_player_print(self.players, m.player_1_id, m),
+                            match_making.get_player_print(self.players, m.player_2_id, m)))
+            yield row
+
+def render(report, writer, columns=STANDINGS_COLUMNS):
+    first = True
+    for groupings, rows in report.standings_tables(columns):
+        writer.heading('Standings' if first else 'Standings Cont.', separate=False)
+        writer.table([('Group ' + g,) for g in groupings], rows)
+        first = False
+    for grouping in report.groupings:
+        writer.heading('Group ' + grouping, separate=True)
+        writer.table([(str(week),) for week in report.weeks], report.schedule_rows(grouping))
+
+# Writers get cells as tuples of lines; an empty tuple is an empty cell.
+
+class ConfluenceWriter:
+    """Confluence wiki markup, the format pasted into the league page."""
+    def __init__(self, out):
+        self.out = out
+
+    def _cell(self, lines):
+        return '\\\\'.join(lines) if lines else ' '
+
+    def heading(self, text, separate):
+        self.out.write(('\n' if separate else '') + 'h2. ' + text + '\n')
+
+    def table(self, header, rows):
+        write = self.out.write
+        write('||' + '||'.join(self._cell(c) for c in header) + '||\n')
+        for row in rows:
+            write('|' + ''.join(self._cell(c) + '|' for c in row) + '\n')
+
+class MarkdownWriter:
+    def __init__(self, out):
+        self.out = out
+
+    def _cell(self, lines):
+        return '<br>'.join(line.replace('|', '\\|') for line in lines) if lines else ' '
+
+    def heading(self, text, separate):
+        self.out.write('## ' + text + '\n\n')
+
+    def table(self, header, rows):
+        write = self.out.write
+        write('| ' + ' | '.join(self._cell(c) for c in header) + ' |\n')
+        write('|' + '---|' * len(header) + '\n')
+        for row in rows:
+            # Markdown rows need every column, so short schedule rows are padded
+            cells = [self._cell(c) for c in row] + [' '] * (len(header) - len(row))
+            write('| ' + ' | '.join(cells) + ' |\n')
+        write('\n')
+
+class HtmlWriter:
+    def __init__(self, out):
+        self.out = out
+
+    def _cell(self, tag, lines):
+        return '<' + tag + '>' + '<br>'.join(html.escape(line) for line in lines) + '</' + tag + '>'
+
+    def heading(self, text, separate):
+        self.out.write('<h2>' + html.escape(text) + '</h2>\n')
+
+    def table(self, header, rows):
+        write = self.out.write
+        write('<table>\n<tr>' + ''.join(self._cell('th', c) for c in header) + '</tr>\n')
+        for row in rows:
+            write('<tr>' + ''.join(self._cell('td', c) for c in row) + '</tr>\n')
+        write('</table>\n')
+
+class CsvWriter:
+    """One block per table: a title row, the header row, then the rows, with a blank row between blocks."""
+    def __init__(self, out):
+        self.writer = csv.writer(out)
+        self.first = True
+
+    def heading(self, text, separate):
+        if not self.first:
+            self.writer.writerow([])
+        self.first = False
+        self.writer.writerow([text])
+
+    def table(self, header, rows):
+        self.writer.writerow([' / '.join(c) for c in header])
+        for row in rows:
+            self.writer.writerow([' / '.join(c) for c in row])
+
+WRITERS = {
+    'confluence': ConfluenceWriter,
+    'markdown': MarkdownWriter,
+    'html': HtmlWriter,
+    'csv': CsvWriter,
+}
+
+def render_season(season=None, fmt='confluence', out=None, columns=STANDINGS_COLUMNS):
+    """
+    Renders a season's report in fmt (a key of WRITERS) to the file-like out.
+    :return: the report as a string when no out is given
+    """
+    if fmt not in WRITERS:
+        raise ValueError('Unknown report format: ' + fmt)
+    report = SeasonReport.load(season)
+    if out is not None:
+        render(report, WRITERS[fmt](out), columns)
+        return None
+    buffer = io.StringIO()
+    render(report, WRITERS[fmt](buffer), columns)
+    return buffer.getvalue()
@@ -0,0 +1,300 @@
+import os, sys
+sys.path.append(os.path.dirname(__file__))
+
+import collections
+import math
+import numpy as np
+import db
+import standings_engine
+from predictor import PROMOTED, RELEGATED
+
+# Monte Carlo odds of promotion and relegation. Every unplayed match of a season is played out game by game
+# from each player's career share of games won, many runs at a time: a batch of runs is one set of NumPy
+# arrays, tallied with bincount and ordered with a row-wise lexsort like standings_engine orders a season.
+# The order inside a bucket of players on the same record only matters where the bucket straddles a
+# promotion or relegation line, so those are the only ties broken, with tie_breaker's rules stepped through
+# for all of them together.
+
+PRIOR_GAMES = 10 # even games every record starts with, so a new player is taken as a coin flip
+BATCH_CELLS = 2000000 # runs x matches sampled at once; bounds the memory of a batch
+RUNS = 10000 # default number of simulated seasons, well under a second for six groups of eight
+MAX_RUNS = 200000 # most runs the api will do for one request
+
+Odds = collections.namedtuple('Odds', 'player_id place promotion relegation')
+Odds.__doc__ = """
+A player's chances over the simulated runs: promotion is the share of runs they finished in the top
+PROMOTED places of their group, relegation the share they finished in the bottom RELEGATED. place is where
+they stand now.
+"""
+
+def game_rates(career_stats, prior=PRIOR_GAMES):
+    """Each player's share of games won, as {slack_id: rate}, from db.get_career_stats()."""
+    return dict((s.slack_id, (s.games_won + prior / 2) / (s.games_won + s.games_lost + prior)) for s in career_stats)
+
+def game_probability(a, b):
+    """Chance a player winning a share a of their games takes a game from one winning b (log5)."""
+    return a * (1 - b) / (a * (1 - b) + b * (1 - a))
+
+class _League:
+    """A season's schedule as arrays, with the played results tallied once and the open matches to sample."""
+    def __init__(self, matches, rates, best_of):
+        # Byes are never played and take no place
+        matches = [m for m in matches if m.player_1_id is not None and m.player_2_id is not None]
+        self.matches = matches
+        self.arrays = arrays = standings_engine.match_arrays(matches)
+        self.best_of = best_of
+        slots = len(arrays.slot_player)
+        self.slots = slots
+
+        # Runs are sorted group by group, so each group's places are a fixed range of columns
+        self.sizes = np.bincount(arrays.slot_group, minlength=len(arrays.groupings))
+        self.group_start = np.r_[0, np.cumsum(self.sizes)[:-1]]
+        column_group = np.repeat(np.arange(len(self.sizes)), self.sizes)
+        self.column_group = column_group
+        self.column_place = np.arange(slots) - self.group_start[column_group] # 0-based place in the group
+
+        played = arrays.winner != standings_engine.UNPLAYED
+        first_won = arrays.winner == standings_engine.P1_WON
+        winner = np.where(first_won, arrays.player, arrays.opponent)[played]
+        loser = np.where(first_won, arrays.opponent, arrays.player)[played]
+        extra = np.maximum(arrays.sets[played] - 3, 0)
+        self.m_w = np.bincount(winner, minlength=slots)
+        self.m_l = np.bincount(loser, minlength=slots)
+        self.s_w = np.bincount(winner, weights=np.full(len(winner), 3), minlength=slots) + np.bincount(loser, weights=extra, minlength=slots)
+        self.s_l = np.bincount(loser, weights=np.full(len(loser), 3), minlength=slots) + np.bincount(winner, weights=extra, minlength=slots)
+
+        # Head to head winners of every match (-1: nobody); open ones are filled in per run
+        self.winners = np.full(len(matches), -1, dtype=np.int64)
+        self.winners[arrays.winner == standings_engine.P1_WON] = arrays.player[arrays.winner == standings_engine.P1_WON]
+        self.winners[arrays.winner == standings_engine.P2_WON] = arrays.opponent[arrays.winner == standings_engine.P2_WON]
+        self.open = np.flatnonzero(arrays.winner == standings_engine.UNPLAYED)
+        rate = np.array([rates.get(pid, 0.5) for pid in arrays.slot_player], dtype=np.float64)
+        self.game_chance = game_probability(rate[arrays.player[self.open]], rate[arrays.opponent[self.open]])
+
+        # Matches between each pair of players, padded with -1, for the head to head counts
+        pairs = {}
+        for k, (a, b) in enumerate(zip(arrays.player.tolist(), arrays.opponent.tolist())):
+            pairs.setdefault((min(a, b), max(a, b)), []).append(k)
+        self.pair_index = np.full((slots, slots), -1, dtype=np.int64)
+        width = max([len(ks) for ks in pairs.values()] or [1])
+        self.pair_matches = np.full((len(pairs) + 1, width), -1, dtype=np.int64) # last row: no matches
+        for p, ((a, b), ks) in enumerate(pairs.items()):
+            self.pair_index[a, b] = self.pair_index[b, a] = p
+            self.pair_matches[p, :len(ks)] = ks
+
+    def sample(self, runs, rng):
+        """Results of the open matches: (first player won, games played), each runs x open."""
+        to_win = self.best_of // 2 + 1
+        # One draw per match against the chance of each result: the first player winning with their opponent
+        # taking 0, 1, ... games, then the same the other way around (a negative binomial either way)
+        q = self.game_chance[:, None]
+        taken = np.arange(to_win)
+        # (to_win - 1 + t choose t), without math.comb (Python 3.8+)
+        ways = np.array([math.factorial(to_win - 1 + t) // (math.factorial(t) * math.factorial(to_win - 1))
+                         for t in taken.tolist()], dtype=np.float64)
+        chances = np.hstack([ways * q ** to_win * (1 - q) ** taken, ways * (1 - q) ** to_win * q ** taken])
+        thresholds = np.cumsum(chances, axis=1)[:, :-1].astype(np.float32)
+        draw = rng.random((runs, len(self.open)), dtype=np.float32)
+        result = (draw[:, :, None] >= thresholds).sum(axis=2, dtype=np.int8)
+        first_won = result < to_win
+        return first_won, to_win + np.where(first_won, result, result - to_win)
+
+    def head_to_head_wins(self, winners, runs, a, b):
+        """Matches a[i] won against b[i] in run runs[i]."""
+        ks = self.pair_matches[self.pair_index[a, b]]
+        won = winners[runs[:, None], np.maximum(ks, 0)] == a[:, None]
+        return (won & (ks >= 0)).sum(axis=1)
+
+    def play(self, runs, rng, promoted, relegated):
+        """Plays out runs seasons; returns how often each slot finished promoted and relegated."""
+        arrays, slots = self.arrays, self.slots
+        first_won, played = self.sample(runs, rng)
+        p1, p2 = arrays.player[self.open], arrays.opponent[self.open]
+        winner = np.where(first_won, p1, p2)
+        loser = np.where(first_won, p2, p1)
+        extra = np.maximum(played - 3, 0)
+
+        offset = (np.arange(runs) * slots)[:, None]
+        def tally(index, weights=None):
+            counts = np.bincount((index + offset).ravel(), weights=None if weights is None else weights.ravel(), minlength=runs * slots)
+            return counts.reshape(runs, slots)
+        won, lost = tally(winner), tally(loser)
+        m_w, m_l = self.m_w + won, self.m_l + lost
+        s_w = (self.s_w + 3 * won + tally(loser, extra)).astype(np.int64)
+        s_l = (self.s_l + 3 * lost + tally(winner, extra)).astype(np.int64)
+
+        # Each run ordered like standings_engine: group, wins and losses descending, then the set order
+        # gather_scores hands the tie breaker, then first appearance
+        order = self._order(m_w, m_l, s_w, s_l)
+        record_w = np.take_along_axis(m_w, order, axis=1)
+        record_l = np.take_along_axis(m_l, order, axis=1)
+        same = (self.column_group[1:] == self.column_group[:-1]) & (record_w[:, 1:] == record_w[:, :-1]) & (record_l[:, 1:] == record_l[:, :-1])
+
+        contested = self._contested(same, promoted, relegated)
+        if len(contested):
+            winners = np.broadcast_to(self.winners, (runs, len(self.winners))).copy()
+            winners[:, self.open] = winner
+            self._break_ties(order, contested, winners, s_w, s_l)
+
+        places = self.column_place
+        sizes = self.sizes[self.column_group]
+        up = order[:, places < promoted]
+        down = order[:, places >= sizes - relegated]
+        return np.bincount(up.ravel(), minlength=slots), np.bincount(down.ravel(), minlength=slots)
+
+    def _order(self, m_w, m_l, s_w, s_l):
+        """Row-wise sort of every run; the keys are packed into one integer when they fit, which sorts far faster."""
+        keys = [(self.arrays.slot_group, False), (m_w, True), (m_l, True), (s_w, True), (s_l, False)]
+        packed = np.zeros(m_w.shape, dtype=np.int64)
+        bits = 0
+        for values, descending in keys:
+            top = int(values.max()) if values.size else 0
+            width = max(top, 1).bit_length()
+            bits += width
+            packed = (packed << width) | ((top - values) if descending else values)
+        if bits <= 62:
+            return np.argsort(packed, axis=1, kind='stable')
+        slot = np.broadcast_to(np.arange(self.slots), m_w.shape)
+        group = np.broadcast_to(self.arrays.slot_group, m_w.shape)
+        return np.lexsort((slot, s_l, -s_w, -m_l, -m_w, group), axis=-1)
+
+    def _contested(self, same, promoted, relegated):
+        """(run, start, end) of every tied bucket that straddles a promotion or relegation line."""
+        runs, width = same.shape[0], same.shape[1] + 1
+        cuts = []
+        for g, size in enumerate(self.sizes.tolist()):
+            for line in (promoted, size - relegated):
+                if 0 < line < size:
+                    cuts.append(self.group_start[g] + line - 1) # between this column and the next
+        if not cuts or width < 2:
+            return np.empty((0, 3), dtype=np.int64)
+        hit_run, hit_cut = np.nonzero(same[:, cuts])
+        if not len(hit_run):
+            return np.empty((0, 3), dtype=np.int64)
+        column = np.arange(width)
+        starts = np.maximum.accumulate(np.where(np.c_[np.ones(runs, dtype=bool), ~same], column, 0), axis=1)
+        ends = np.minimum.accumulate(np.where(np.c_[~same, np.ones(runs, dtype=bool)], column, width)[:, ::-1], axis=1)[:, ::-1] + 1
+        at = np.asarray(cuts)[hit_cut]
+        # A bucket can straddle both lines; keep it once
+        start = starts[hit_run, at]
+        first = np.unique(hit_run * width + start, return_index=True)[1]
+        return np.c_[hit_run[first], start[first], ends[hit_run[first], at[first]]]
+
+    def _break_ties(self, order, contested, winners, s_w, s_l):
+        """
+        tie_breaker's rules run on every contested bucket at once, one elimination step at a time. Each step
+        takes one player out of every bucket still holding more than one, to the top or the bottom of what
+        is left, exactly as _resolve_tie picks them. Every match has been played by the end of a run, so a
+        player with no head to head wins left always qualifies for the second rule.
+        """
+        run, start, end = contested[:, 0], contested[:, 1], contested[:, 2]
+        size = end - start
+        buckets, width = len(contested), int(size.max())
+        present = np.arange(width) < size[:, None]
+        tied = order[run[:, None], np.minimum(start[:, None] + np.arange(width), self.slots - 1)]
+        sets_won = s_w[run[:, None], tied]
+        sets_lost = s_l[run[:, None], tied]
+        pairs = np.broadcast_to(present[:, :, None] & present[:, None, :] & ~np.eye(width, dtype=bool), (buckets, width, width))
+        b, i, j = np.nonzero(pairs)
+        wins = np.zeros((buckets, width, width), dtype=np.int64)
+        wins[b, i, j] = self.head_to_head_wins(winners, run[b], tied[b, i], tied[b, j])
+
+        alive = present.copy()
+        position = np.zeros((buckets, width), dtype=np.int64)
+        top = np.zeros(buckets, dtype=np.int64)
+        bottom = size - 1
+        # Head to head wins against the players still in the bucket, taken down as players leave it
+        won = wins.sum(axis=2)
+        left = size.copy()
+        for _ in range(width - 1):
+            active = np.flatnonzero(left > 1)
+            if not len(active):
+                break
+            pick, up = _pick(alive[active], won[active], left[active], sets_won[active], sets_lost[active])
+            position[active, pick] = np.where(up, top[active], bottom[active])
+            top[active] += up
+            bottom[active] -= ~up
+            alive[active, pick] = False
+            won[active] -= wins[active, :, pick]
+            left[active] -= 1
+        last_b, last_i = np.nonzero(alive)
+        position[last_b, last_i] = top[last_b]
+
+        rows = np.broadcast_to(run[:, None], (buckets, width))[present]
+        order[rows, (start[:, None] + position)[present]] = tied[present]
+
+def _first(mask):
+    return mask.any(axis=1), mask.argmax(axis=1)
+
+def _unique_extreme(alive, values, largest):
+    """Like tie_breaker._unique_extreme for every bucket: (found, position of the only player at the extreme)."""
+    if largest:
+        values = np.where(alive, values, np.iinfo(values.dtype).min)
+        extreme = values.max(axis=1)
+    else:
+        values = np.where(alive, values, np.iinfo(values.dtype).max)
+        extreme = values.min(axis=1)
+    hits = alive & (values == extreme[:, None])
+    return hits.sum(axis=1) == 1, hits.argmax(axis=1)
+
+def _pick(alive, won, left, sets_won, sets_lost):
+    """The player each bucket takes out next and whether they go up, following _resolve_tie's rule order."""
+    rules = [
+        (_first(alive & (won == (left - 1)[:, None])), True), # beat everyone left
+        (_first(alive & (won == 0)), False), # beat nobody left
+        (_unique_extreme(alive, sets_won, True), True),
+        (_unique_extreme(alive, sets_won, False), False),
+        (_unique_extreme(alive, sets_lost, False), True),
+        (_unique_extreme(alive, sets_lost, True), False),
+        (_first(alive), True), # whoever is first
+    ]
+    pick = np.zeros(len(alive), dtype=np.int64)
+    up = np.zeros(len(alive), dtype=bool)
+    decided = np.zeros(len(alive), dtype=bool)
+    for (found, position), goes_up in rules:
+        take = found & ~decided
+        pick[take] = position[take]
+        up[take] = goes_up
+        decided |= take
+    return pick, up
+
+def simulate(matches, rates, n_runs, best_of=5, seed=None, promoted=PROMOTED, relegated=RELEGATED):
+    """
+    Odds for every group in a list of matches, as {grouping: [Odds]} in current standings order.
+    :param rates: game_rates() for the players; anyone missing is taken as a coin flip
+    """
+    league = _League(matches, rates, best_of)
+    rng = np.random.default_rng(seed)
+    up = np.zeros(league.slots, dtype=np.int64)
+    down = np.zeros(league.slots, dtype=np.int64)
+    batch = max(1, min(n_runs, BATCH_CELLS // max(len(league.open) * best_of, 1)))
+    done = 0
+    while done < n_runs:
+        runs = min(batch, n_runs - done)
+        batch_up, batch_down = league.play(runs, rng, promoted, relegated)
+        up += batch_up
+        down += batch_down
+        done += runs
+
+    arrays = league.arrays
+    standings = standings_engine.season_standings(league.matches)
+    odds = {}
+    for g, grouping in enumerate(arrays.groupings):
+        slots = dict((arrays.slot_player[s], s) for s in np.flatnonzero(arrays.slot_group == g).tolist())
+        ranked = [p['player_id'] for p in standings.group(grouping)]
+        ranked += [pid for pid in slots if pid not in ranked]
+        odds[grouping] = [Odds(pid, place, float(up[slots[pid]]) / max(n_runs, 1), float(down[slots[pid]]) / max(n_runs, 1))
+                          for place, pid in enumerate(ranked, 1)]
+    return odds
+
+def simulate_season(season=None, n_runs=RUNS, seed=None, grouping=None, **kwargs):
+    """simulate() for a season in the database (or just one of its groups), with everyone's career game rates."""
+    if season is None:
+        season = db.get_current_season()
+    record = db.get_season(season)
+    best_of = record.best_of if record is not None and record.best_of else 5
+    if grouping is None:
+        matches = db.get_matches_for_season(season)
+    else:
+        matches = db.get_matches_for_group(season, grouping)
+    return simulate(matches, game_rates(db.get_career_stats()), n_runs, best_of, seed, **kwargs)
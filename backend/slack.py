@@ -7,15 +7,7 @@ import time, datetime, bot_config
 
 slack_client = Slacker(bot_config.get_slack_api_key())
 
-def get_players_dictionary():
-    players = db.get_players()
-    players_dictionary = dict()
-    for player in players:
-        players_dictionary[player.slack_id] = player.name
-    
-    return players_dictionary
-
-def send_match_message(message, to_user, against_user, players_dictionary, debug=True):
+def send_match_message(message, to_user, against_user, players, debug=True):
     if to_user is None:
         return
     
@@ -27,28 +19,28 @@ def send_match_message(message, to_user, against_user, players_dictionary, debug
     if debug and to_user == bot_config.get_commissioner_slack_id():
         slack_client.chat.post_message(bot_config.get_commissioner_slack_id(), message, as_user=True)
     
-    debug_message = message.replace(against_user, players_dictionary[against_user])
+    debug_message = message.replace(against_user, players[against_user].name)
     if debug:
-        return "Debug sent to " + players_dictionary[to_user] + ": " + debug_message
+        return "Debug sent to " + players[to_user].name + ": " + debug_message
     
     if not debug:
         slack_client.chat.post_message(to_user, message, as_user=True)
-        return "For reals sent to " + players_dictionary[to_user] + ": " + debug_message
+        return "For reals sent to " + players[to_user].name + ": " + debug_message
 
 def send_match_messages(message, debug=True):
     today = datetime.datetime.today()
     last_monday = (today - datetime.timedelta(days=today.weekday())).date()
 
     matches = db.get_matches_for_week(last_monday)
-    players_dictionary = get_players_dictionary()
+    players = db.get_player_directory()
 
     sent_messages = ""
     for match in matches:
         if match.winner_id is None:
-            sent_messages = sent_messages + send_match_message(message, match.player_1_id, match.player_2_id, players_dictionary, debug=debug) + "\n"
+            sent_messages = sent_messages + send_match_message(message, match.player_1_id, match.player_2_id, players, debug=debug) + "\n"
             time.sleep(1.5)
 
-            sent_messages = sent_messages + send_match_message(message, match.player_2_id, match.player_1_id, players_dictionary, debug=debug) + "\n"
+            sent_messages = sent_messages + send_match_message(message, match.player_2_id, match.player_1_id, players, debug=debug) + "\n"
             time.sleep(1.5)
     
     return sent_messages
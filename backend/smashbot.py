@@ -2,13 +2,15 @@ import os, sys
 sys.path.append(os.path.dirname(__file__))
 
 from slackclient import SlackClient
+import asyncio
 import bot_config
+import commands
 import db
+import dispatcher
+import response_cache
+import simulator
 import collections
-from match_making import gather_scores, get_player_name
-import time
-from websocket import WebSocketConnectionClosedException
-from multiprocessing import Process
+from match_making import get_group_standings, get_player_name
 from datetime import datetime
 
 import logging, sys
@@ -24,85 +26,42 @@ class SmashBot():
         self.logger.addHandler(hdlr)
         self.logger.setLevel(logging.DEBUG)
 
-        self.logger.debug('booting up smashbot file')
+        self.dispatcher = None
+        self.responses = response_cache.ResponseCache()
+        self.config = commands.snapshot_config()
+        self.router = self.build_router()
 
-    def keepalive(self):
-        while True:
-            time.sleep(3)
-            try:
-                self.slack_client.server.ping()
-            except WebSocketConnectionClosedException as e:
-                self.logger.debug('Keep alive web socket exception.')
-                self.slack_client.rtm_connect()
+        self.logger.debug('booting up smashbot file')
 
     def print_help(self, channel):
         message = 'I support the following:'
         message = message + '\n`@sul me over @them 3-2` or `@sul @them over me 3-2` - report a score'
         message = message + '\n`@sul group a` - see the current rankings of a group'
-        # message = message + '\n`@sul leaderboard` - see the leaderboard, sorted by winrate'
-        # message = message + '\n`@sul loserboard` - see the loserboard, sorted by winrate'
+        message = message + '\n`@sul leaderboard` - see the leaderboard, sorted by winrate'
+        message = message + '\n`@sul loserboard` - see the loserboard, sorted by winrate'
         message = message + '\n`@sul who do i play` - see who you play this week (only in dms)'
         message = message + '\n`@sul matches for week` - see all matches occuring this week in all groups'
-        # message = message + '\n`@sul my total stats` - see your total wins and losses (both games and sets)'
+        message = message + '\n`@sul my total stats` - see your total wins and losses (both games and sets)'
+        message = message + '\n`@sul odds a` - see everyone\'s chances of going up or down in a group'
+        message = message + '\n`@sul rating` - see your rating across every season'
+        message = message + '\n`@sul ratings` - see the top rated players'
 
         self.slack_client.api_call("chat.postMessage", channel=channel, text=message, as_user=True)
 
-    ### TODO Refactor so it can support Bo3 AND Bo5 across the database
     def get_leaderboard(self, reverse_order=True):
-        matches = db.get_matches()
-        players = db.get_players()
-
-        player_dict = dict()
-
-        for player in players:
-            player_dict[player.slack_id] = {
-                'games_won': 0,
-                'games_total': 0,
-                'name': player.name
-            }
-
-        for match in matches:
-            games_played = match.sets
-
-            player_1 = player_dict[match.player_1_id]
-            player_2 = player_dict[match.player_2_id]
-
-            player_dict[match.player_1_id]['games_total'] = player_1['games_total'] + games_played
-            player_dict[match.player_2_id]['games_total'] = player_2['games_total'] + games_played
-
-            if match.player_1_id == match.winner_id:
-                player_dict[match.player_1_id]['games_won'] = player_1['games_won'] + 2
-
-                if games_played == 3:
-                    player_dict[match.player_2_id]['games_won'] = player_2['games_won'] + 1
-
-            elif match.player_2_id == match.winner_id:
-                player_dict[match.player_2_id]['games_won'] = player_2['games_won'] + 2
-
-                if games_played == 3:
-                    player_dict[match.player_1_id]['games_won'] = player_1['games_won'] + 1
-
-
+        # Career totals are kept up to date as scores come in, so this never walks the match history
         winrate_dict = dict()
-        for player_id, player in player_dict.items():
-            if player['games_total'] == 0:
-                winrate_dict[player['name']] = {
-                    'games_won': 0,
-                    'games_lost': 0,
-                    'winrate': round(0, 2)
-                }
-            else:
-                winrate_dict[player['name']] = {
-                    'games_won': player['games_won'],
-                    'games_lost': player['games_total'] - player['games_won'],
-                    'winrate': round((player['games_won'] / player['games_total']) * 100, 2)
-                }
+        for stats in db.get_career_stats():
+            winrate_dict[stats.name] = {
+                'games_won': stats.games_won,
+                'games_lost': stats.games_lost,
+                'winrate': stats.winrate
+            }
 
         sorted_winrates = collections.OrderedDict(sorted(winrate_dict.items(), key=lambda x: x[1]['winrate'], reverse=reverse_order))
 
         return sorted_winrates
 
-    ### TODO Refactor so it can support Bo3 AND Bo5 across the database
     def print_leaderboard(self, channel):
         sorted_winrates = self.get_leaderboard()
 
@@ -113,7 +72,6 @@ class SmashBot():
 
         self.slack_client.api_call("chat.postMessage", channel=channel, text=message, as_user=True)
 
-    ### TODO Refactor so it can support Bo3 AND Bo5 across the database
     def print_loserboard(self, channel):
         sorted_winrates = self.get_leaderboard(False)
 
@@ -124,19 +82,31 @@ class SmashBot():
 
         self.slack_client.api_call("chat.postMessage", channel=channel, text=message, as_user=True)
 
+    def cached_response(self, kind, *key_parts, build):
+        # Replies that only change when the league data does (see response_cache)
+        key = (kind, db.get_current_season()) + key_parts + (db.get_data_version(),)
+        return self.responses.get(key, build)
+
     def print_whole_week(self, channel, date):
+        message = self.cached_response('week', str(date), build=lambda: self.whole_week_text(date))
+        self.slack_client.api_call("chat.postMessage", channel=channel, text=message, as_user=True)
+
+    def whole_week_text(self, date):
         all_weekly_matches = db.get_matches_for_week(date)
-        players = db.get_players()
+        players = db.get_player_directory()
 
         message = ""
         for match in all_weekly_matches:
             message = message + f"\n {get_player_name(players, match.player_1_id)} vs. {get_player_name(players, match.player_2_id)} : week: {match.week}"
+        return message
 
+    def print_user_week(self, user_id, channel, date):
+        message = self.cached_response('user week', str(date), user_id, build=lambda: self.user_week_text(user_id, date))
         self.slack_client.api_call("chat.postMessage", channel=channel, text=message, as_user=True)
 
-    def print_user_week(self, user_id, channel, date):
+    def user_week_text(self, user_id, date):
         all_weekly_matches = db.get_matches_for_week(date)
-        players = db.get_players()
+        players = db.get_player_directory()
 
         user_match_dict = dict()
         for match in all_weekly_matches:
@@ -148,128 +118,148 @@ class SmashBot():
         message = ""
         for player, week in user_match_dict.items():
             message = message + f"\n Playing: {player} | week: {week}"
+        return message
 
-        self.slack_client.api_call("chat.postMessage", channel=channel, text=message, as_user=True)
-
-    ### TODO Refactor so it can support Bo3 AND Bo5 across the database
     def print_user_stats(self, user_id, channel):
-        all_matches = db.get_matches()
-
-        total_won_matches = 0
-        total_lost_matches = 0
-        total_won_sets = 0
-        total_lost_sets = 0
-        for match in all_matches:
-            if match.winner_id is None:
-                continue
+        career = db.get_player_career(user_id)
+        if career is None:
+            self.slack_client.api_call("chat.postMessage", channel=channel, text="I don't have you as a player.", as_user=True)
+            return
+
+        totals, seasons = career
+        message = f"\n Matches Won: {totals.matches_won} | Matches Lost: {totals.matches_lost} | Sets Won: {totals.games_won} | Sets Lost: {totals.games_lost}"
+        for season, matches_won, matches_lost, games_won, games_lost in seasons:
+            message = message + f"\n Season {season}: {matches_won}-{matches_lost} ({games_won}-{games_lost})"
+        self.slack_client.api_call("chat.postMessage", channel=channel, text=message, as_user=True)
 
-            elif user_id == match.winner_id:
-                total_won_matches += 1
-                total_won_sets += 2
+    def print_user_rating(self, user_id, channel):
+        rating = db.get_player_rating(user_id)
+        if rating is None:
+            self.slack_client.api_call("chat.postMessage", channel=channel, text="I don't have you as a player.", as_user=True)
+            return
 
-                if match.sets == 3:
-                    total_lost_sets += 1
-                
-            elif (match.player_1_id == user_id or match.player_2_id == user_id) and user_id != match.winner_id:
-                total_lost_matches += 1
-                total_lost_sets += 2
+        rating, place = rating
+        message = f"\n Rating: {rating.rating:.0f} | #{place} overall | {rating.matches} rated matches"
+        self.slack_client.api_call("chat.postMessage", channel=channel, text=message, as_user=True)
 
-                if match.sets == 3:
-                    total_won_sets += 1
+    def print_ratings(self, channel, top=10):
+        message = ""
+        for place, rating in enumerate(db.get_ratings()[:top], 1):
+            message = message + f"\n {place}. {rating.name}: {rating.rating:.0f} ({rating.matches} matches)"
 
-        message = f"\n Matches Won: {total_won_matches} | Matches Lost: {total_lost_matches} | Sets Won: {total_won_sets} | Sets Lost: {total_lost_sets}"
         self.slack_client.api_call("chat.postMessage", channel=channel, text=message, as_user=True)
 
-    def print_group(self, channel, group):
-        try:
-            season = db.get_current_season()
-            all_matches = db.get_matches_for_season(season)
-            all_players = db.get_players()
-            group_matches = [m for m in all_matches if m.grouping.lower() == group.lower()]
+    def print_db_stats(self, channel, top=10):
+        stats = db.query_stats_snapshot()
+        if stats is None:
+            message = 'Query stats are off. Set QUERY_STATS in the config to turn them on.'
+        else:
+            message = 'Slowest db functions since {} ({} slow queries):'.format(
+                datetime.fromtimestamp(stats['since']).strftime('%Y-%m-%d %H:%M'), stats['slow_queries'])
+            for name, entry in list(stats['functions'].items())[:top]:
+                message += '\n`{}` {} calls, {} rows, {:.1f} ms total, {:.2f} ms mean'.format(
+                    name, entry['calls'], entry['rows'], entry['total_ms'], entry['mean_ms'])
 
-            if not len(group_matches):
-                raise Exception('Not a match')
+        self.slack_client.api_call("chat.postMessage", channel=channel, text=message, as_user=True)
 
-            players = gather_scores(group_matches)
-            message = 'Group ' + group.upper() + ':'
+    def print_health(self, channel):
+        if self.dispatcher is None:
+            return
+        health = self.dispatcher.supervisor.health()
+        message = 'Connected for {:.0f} s'.format(health['connected_for']) if health['connected'] else 'Disconnected'
+        message += '\n{} reconnects ({} failed attempts, {} stalls), {} of {} pings answered, last pong {}'.format(
+            health['reconnects'], health['failed_connects'], health['stalls'], health['pongs'], health['pings'],
+            'n/a' if health['last_pong_ms'] is None else '{:.0f} ms'.format(health['last_pong_ms']))
+        message += '\n{} frames, {} duplicate messages dropped, {} replayed after reconnects'.format(
+            health['frames'], health['duplicates'], health['replayed'])
+        cache = self.responses.stats()
+        message += '\nResponse cache: {} hits, {} misses ({:.0%}), {} of {} entries, {} evicted (data version {})'.format(
+            cache['hits'], cache['misses'], cache['hit_rate'], cache['entries'], cache['max_entries'], cache['evictions'],
+            db.get_data_version())
 
-            for p in players:
-                message += '\n' + get_player_name(all_players, p['player_id']) + ' ' + str(p['m_w']) + '-' + str(p['m_l'])
-                message += ' ('+str(p['s_w'])+'-'+str(p['s_l'])+')'
+        self.slack_client.api_call("chat.postMessage", channel=channel, text=message, as_user=True)
 
+    def print_group(self, channel, group):
+        try:
+            message = self.cached_response('group', group.upper(), build=lambda: self.group_text(group))
             self.slack_client.api_call("chat.postMessage", channel=channel, text=message, as_user=True)
         except Exception as e:
             self.logger.debug(e)
             self.slack_client.api_call("chat.postMessage", channel=channel, text="Not a group (or I messed up).", as_user=True)
 
-    def parse_first_slack_id(self, message):
-        return message[message.index('<@') + 2 : message.index('>')].upper()
-
-    def parse_second_slack_id(self, message):
-        message = message[message.index('>') + 1:]
-        return self.parse_first_slack_id(message)
+    def group_text(self, group):
+        players = get_group_standings(group)
+        if not len(players):
+            raise Exception('Not a match') # not cached, so a group that shows up later is found
 
-    def parse_score(self, message):
-        dash_index = message.index('-')
-        score_substring = message[dash_index - 1 : dash_index + 2]
+        all_players = db.get_player_directory()
+        message = 'Group ' + group.upper() + ':'
 
-        if score_substring != "3-0" and score_substring != "3-1" and score_substring != "3-2":
-            raise Exception("Malformed score")
+        for p in players:
+            message += '\n' + get_player_name(all_players, p['player_id']) + ' ' + str(p['m_w']) + '-' + str(p['m_l'])
+            message += ' ('+str(p['s_w'])+'-'+str(p['s_l'])+')'
+        return message
 
-        score_1 = int(score_substring[0])
-        score_2 = int(score_substring[2])
-
-        return score_1, score_2
-
-    def parse_message(self, command, poster):
-        isAdmin = poster == bot_config.get_commissioner_slack_id()
-
-        if command.startswith('me over '):
-            winner = poster
-            loser = self.parse_first_slack_id(command)
-        elif command.startswith('<@') and command.index('over me') > 0:
-            winner = self.parse_first_slack_id(command)
-            loser = poster
-        elif isAdmin and command.startswith('<@'):
-            winner = self.parse_first_slack_id(command)
-            loser = self.parse_second_slack_id(command)
-        else:
-            self.logger.debug('Bad message format')
-            return None
+    def print_odds(self, channel, group):
+        grouping = group.upper()
+        odds = list(simulator.simulate_season(grouping=grouping).values()) # the group's name as stored
+        if not odds:
+            self.slack_client.api_call("chat.postMessage", channel=channel, text="Not a group (or I messed up).", as_user=True)
+            return
 
-        if winner == loser:
-            self.logger.debug('Cant play against yourself')
-            return None
+        players = db.get_player_directory()
+        message = 'Group ' + grouping + ' odds over ' + str(simulator.RUNS) + ' simulated seasons:'
+        for o in odds[0]:
+            message += f"\n {get_player_name(players, o.player_id)}: {o.promotion:.0%} up, {o.relegation:.0%} down"
 
-        try:
-            score_1, score_2 = self.parse_score(command)
-        except Exception as e:
-            self.logger.debug('Malformed score', e)
-            return None
-
-        return {
-            'winner_id': winner,
-            'loser_id': loser,
-            'score_total': (score_1 + score_2)
-        }
+        self.slack_client.api_call("chat.postMessage", channel=channel, text=message, as_user=True)
 
-    def enter_score(self, winner_id, loser_id, score_total, channel, timestamp):
+    def enter_score(self, winner_id, loser_id, score_total, channel, timestamp, overwrite=False):
         try:
-            if not db.update_match_by_id(winner_id, loser_id, score_total):
+            result = db.enter_score(winner_id, loser_id, score_total, overwrite=overwrite)
+            if result.status == db.ScoreResult.ALREADY_REPORTED:
+                self.slack_client.api_call("chat.postMessage", channel=channel, text='That match was already reported. Ask the commissioner if it needs fixing.', as_user=True)
+                self.slack_client.api_call("reactions.add", name="x", channel=channel, timestamp=timestamp)
+                return result
+            if result.status == db.ScoreResult.INVALID:
+                self.slack_client.api_call("chat.postMessage", channel=channel, text=self.invalid_score_text(result.best_of), as_user=True)
+                self.slack_client.api_call("reactions.add", name="x", channel=channel, timestamp=timestamp)
+                return result
+            if not result:
                 self.slack_client.api_call("chat.postMessage", channel=channel, text='Not a match I have (or I messed up).', as_user=True)
                 self.slack_client.api_call("reactions.add", name="x", channel=channel, timestamp=timestamp)
-                return
+                return result
 
-            self.slack_client.api_call("chat.postMessage", channel=bot_config.get_commissioner_slack_id(), text='Entered into db', as_user=True)
+            if result.replaced is not None:
+                self.slack_client.api_call("chat.postMessage", channel=channel, text=self.correction_text(result.replaced, result.match), as_user=True)
+            self.slack_client.api_call("chat.postMessage", channel=self.config.commissioner_id, text='Entered into db', as_user=True)
             self.slack_client.api_call("reactions.add", name="white_check_mark", channel=channel, timestamp=timestamp)
+            return result
 
         except Exception as e:
-            self.slack_client.api_call("chat.postMessage", channel=bot_config.get_commissioner_slack_id(), text='Failed to enter into db', as_user=True)
+            self.slack_client.api_call("chat.postMessage", channel=self.config.commissioner_id, text='Failed to enter into db', as_user=True)
             self.slack_client.api_call("reactions.add", name="x", channel=channel, timestamp=timestamp)
 
             self.logger.error(e)
 
+    def invalid_score_text(self, best_of):
+        if best_of is None:
+            return "That isn't a score I can enter."
+        to_win = best_of // 2 + 1
+        scores = ', '.join('{}-{}'.format(to_win, lost) for lost in range(to_win))
+        return "That isn't a score for a best of {}. It has to be one of {}.".format(best_of, scores)
+
+    def correction_text(self, before, after):
+        players = db.get_player_directory()
+
+        def result(match):
+            loser_id = match.player_2_id if match.winner_id == match.player_1_id else match.player_1_id
+            return '{} over {} 3-{}'.format(get_player_name(players, match.winner_id), get_player_name(players, loser_id), match.sets - 3)
+
+        return 'Replaced ' + result(before) + ' with ' + result(after) + '.'
+
     def filter_invalid_messages(self, message_list):
+        mention = '<@' + self.config.bot_user_id + '>'
         valid_messages = []
 
         for message_object in message_list:
@@ -284,14 +274,14 @@ class SmashBot():
 
             message_text = message_object['text']
             if message_object['channel'][:1] == 'D':
-                if message_text.startswith('<@' + bot_config.get_bot_slack_user_id() + '>'):
+                if message_text.startswith(mention):
                     message_text = message_text[message_text.index(">") + 1:].strip()
 
                 message_object['text'] = message_text
                 valid_messages.append(message_object)
                 continue
 
-            if message_object['channel'] == bot_config.get_channel_slack_id() and message_text.startswith('<@' + bot_config.get_bot_slack_user_id() + '>'):
+            if message_object['channel'] == self.config.channel_id and message_text.startswith(mention):
                 message_text = message_text[message_text.index(">") + 1:].strip()
 
                 message_object['text'] = message_text
@@ -300,73 +290,80 @@ class SmashBot():
 
         return valid_messages
 
+    def build_router(self):
+        # Checked in this order; a new command is one more line here (see commands for the pattern syntax)
+        router = commands.Router()
+        router.add('leaderboard', lambda m: self.print_leaderboard(m.channel))
+        router.add('loserboard', lambda m: self.print_loserboard(m.channel))
+        router.add('troy', lambda m: self.print_loserboard(m.channel))
+        router.add('my total stats', lambda m: self.print_user_stats(m.user, m.channel), dm_only=True)
+        router.add('matches for week', lambda m: self.print_whole_week(m.channel, self.message_date(m)))
+        router.add('who do i play', lambda m: self.print_user_week(m.user, m.channel, self.message_date(m)), dm_only=True)
+        router.add('rating', lambda m: self.print_user_rating(m.user, m.channel))
+        router.add('ratings', lambda m: self.print_ratings(m.channel))
+        router.add('help', lambda m: self.print_help(m.channel))
+        router.add('db stats', lambda m: self.print_db_stats(m.channel), admin_only=True)
+        router.add('health', lambda m: self.print_health(m.channel), admin_only=True)
+        router.add('odds {group:text}', lambda m, group: self.print_odds(m.channel, group))
+        router.add('group {group:group}...', lambda m, group: self.print_group(m.channel, group))
+        router.add('correct {winner:mention}...over...{loser:mention}...{sets:score}...',
+                   lambda m, winner, loser, sets: self.correct_score(m, winner, loser, sets), admin_only=True)
+        router.add('me over {loser:mention}...{sets:score}...', lambda m, loser, sets: self.report_score(m, m.user, loser, sets))
+        router.add('{winner:mention}...over me...{sets:score}...', lambda m, winner, sets: self.report_score(m, winner, m.user, sets))
+        router.add('{winner:mention}...{loser:mention}...{sets:score}...', lambda m, winner, loser, sets: self.report_score(m, winner, loser, sets),
+                   admin_only=True)
+        router.fallback(lambda m: self.print_format(m.channel))
+        return router
+
+    def message_date(self, message):
+        return datetime.fromtimestamp(float(message.ts)).date()
+
+    def print_format(self, channel):
+        format_msg = "Didn't catch that. The format is `@sul me over @them 3-2` or `@sul @them over me 3-2`."
+        self.slack_client.api_call("chat.postMessage", channel=channel, text=format_msg, as_user=True)
+
+    def report_score(self, message, winner_id, loser_id, sets):
+        if winner_id == loser_id:
+            self.logger.debug('Cant play against yourself')
+            self.print_format(message.channel)
+        elif message.is_dm:
+            format_msg = "Nice try, you have to put this in the main channel"
+            self.slack_client.api_call('chat.postMessage', channel=message.channel, text=format_msg, as_user=True)
+        elif message.channel == self.config.channel_id:
+            score = self.enter_score(winner_id, loser_id, sets, message.channel, message.ts)
+
+            if score is not None and score.match is not None:
+                self.print_group(message.channel, score.match.grouping)
+
+    def correct_score(self, message, winner_id, loser_id, sets):
+        # The commissioner's explicit fix for a reported result; the reply says what it replaced
+        if winner_id == loser_id:
+            self.print_format(message.channel)
+            return
+        score = self.enter_score(winner_id, loser_id, sets, message.channel, message.ts, overwrite=True)
+
+        if score and message.channel == self.config.channel_id:
+            self.print_group(message.channel, score.match.grouping)
+
     def handle_message(self, message_object):
-        command = message_object["text"]
-        channel = message_object["channel"]
-        user_id = message_object["user"]
-        timestamp = float(message_object["ts"])
-        user_date = datetime.fromtimestamp(timestamp).date()
-
-        """"
-        if command == 'leaderboard':
-            self.print_leaderboard(channel)
-        elif command == 'loserboard' or command == 'troy':
-            self.print_loserboard(channel)
-        elif command == 'my total stats' and channel[:1] == 'D':
-            self.print_user_stats(user_id, channel)
-        """
-        if command == 'matches for week':
-            self.print_whole_week(channel, user_date)
-        elif command == 'who do i play' and channel[:1] == 'D':
-            self.print_user_week(user_id, channel, user_date)
-        elif command == 'help':
-            self.print_help(channel)
-        elif command.startswith('group'):
-            self.print_group(channel, command[6])
-        else:
-            result = None
-            try:
-                result = self.parse_message(command, user_id)
-            except Exception as e:
-                self.logger.debug(e)
-
-            if result is None:
-                format_msg = "Didn't catch that. The format is `@sul me over @them 3-2` or `@sul @them over me 3-2`."
-                self.slack_client.api_call("chat.postMessage", channel=channel, text=format_msg, as_user=True)
-            elif result is not None and channel[:1] == 'D':
-                format_msg = "Nice try, you have to put this in the main channel"
-                self.slack_client.api_call('chat.postMessage', channel=channel, text=format_msg, as_user=True)
-            elif result is not None and channel == bot_config.get_channel_slack_id():
-                self.enter_score(result['winner_id'], result['loser_id'], result['score_total'], channel, message_object["ts"])
-
-                player = db.get_player_by_id(result['winner_id'])
-                self.print_group(channel, player.grouping)
-
-        return None
+        self.router.dispatch(commands.message_from_event(message_object, self.config))
 
-    def start_bot(self):
-        p = Process(target=self.keepalive)
-        p.start()
+    def dispatch_message(self, message):
+        # Runs on a dispatcher worker thread; a failed command gets an x instead of taking the bot down
+        try:
+            self.handle_message(message)
+        except Exception as e:
+            self.logger.debug(e)
+            self.slack_client.api_call("reactions.add", name="x", channel=message["channel"], timestamp=message["ts"])
 
-        if self.slack_client.rtm_connect():
+    def start_bot(self):
+        transport = dispatcher.SlackTransport(self.slack_client)
+        if transport.connect():
             print("StarterBot connected and running!")
-
-            while True:
-                try:
-                    message_list = self.slack_client.rtm_read()
-                    message_list = self.filter_invalid_messages(message_list)
-
-                    for message in message_list:
-                        try:
-                            self.handle_message(message)
-                        except Exception as e:
-                            self.logger.debug(e)
-                            self.slack_client.api_call("reactions.add", name="x", channel=message["channel"], timestamp=message["ts"])
-
-                    time.sleep(1)
-                except Exception as e:
-                    self.logger.debug('Main while loop web socket exception.', e)
-                    self.slack_client.rtm_connect()
+            # Messages are handled as soon as they arrive, in order within a channel, and the dispatcher's
+            # supervisor keeps the connection alive (see dispatcher and supervisor)
+            self.dispatcher = dispatcher.Dispatcher(transport, self.dispatch_message, self.filter_invalid_messages, logger=self.logger)
+            asyncio.run(self.dispatcher.run())
         else:
             print("Connection failed. Invalid Slack token or bot ID?")
 
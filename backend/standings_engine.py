@@ -0,0 +1,221 @@
+import os, sys
+sys.path.append(os.path.dirname(__file__))
+
+import collections
+import numpy as np
+import tie_breaker
+
+# Standings for every group of a season in one vectorized pass, with the same results and order as calling
+# match_making.gather_scores on each group. Matches become integer arrays (one slot per player per group,
+# numbered in order of first appearance), the tallies are a handful of np.add.at calls, one lexsort orders
+# everything, and the tie breaker only runs on the buckets where players really share a record.
+
+MatchArrays = collections.namedtuple('MatchArrays', 'groupings slot_group slot_player group player opponent winner sets')
+MatchArrays.__doc__ = """
+Arrays over a season's matches. For match k: group[k] indexes groupings, player[k]/opponent[k] are the slots
+of player 1 and player 2, and winner[k] is 1 if player 1 won, -1 if player 2 won, 0 if it hasn't been played
+and -2 if the winner is someone else (gather_scores credits player 2 with those). Slot s belongs to
+groupings[slot_group[s]] and is slack id slot_player[s] (None for a bye). Results can be swapped in with
+_replace(winner=..., sets=...) to evaluate other outcomes of the same schedule.
+"""
+
+P1_WON, P2_WON, UNPLAYED, OTHER_WON = 1, -1, 0, -2
+
+_OTHER = object() # stands in for a winner who isn't one of the two players
+
+_H2HMatch = collections.namedtuple('_H2HMatch', 'player_1_id player_2_id winner_id')
+
+def _group_matches(arrays, g):
+    """The group's matches rebuilt from the arrays, for the tie breaker's original filters."""
+    matches = []
+    for k in np.flatnonzero(arrays.group == g).tolist():
+        p1, p2, flag = arrays.slot_player[arrays.player[k]], arrays.slot_player[arrays.opponent[k]], arrays.winner[k]
+        winner = p1 if flag == P1_WON else p2 if flag == P2_WON else None if flag == UNPLAYED else _OTHER
+        matches.append(_H2HMatch(p1, p2, winner))
+    return matches
+
+def _winner_flag(m):
+    if m.winner_id is None:
+        return UNPLAYED
+    if m.winner_id == m.player_1_id:
+        return P1_WON
+    return P2_WON if m.winner_id == m.player_2_id else OTHER_WON
+
+def match_arrays(matches):
+    group_index = {}
+    group = [group_index.setdefault(m.grouping, len(group_index)) for m in matches]
+    # Slots numbered by first appearance, player 1 before player 2 within a match, as gather_scores inserts them
+    slots = {}
+    keys = [key for g, m in zip(group, matches) for key in ((g, m.player_1_id), (g, m.player_2_id))]
+    slot_of = [slots.setdefault(key, len(slots)) for key in keys]
+    slot_player = np.empty(len(slots), dtype=object)
+    slot_player[:] = [pid for _, pid in slots]
+    return MatchArrays(
+        groupings=list(group_index),
+        slot_group=np.array([g for g, _ in slots], dtype=np.int32),
+        slot_player=slot_player,
+        group=np.array(group, dtype=np.int32),
+        player=np.array(slot_of[0::2], dtype=np.int32),
+        opponent=np.array(slot_of[1::2], dtype=np.int32),
+        winner=np.array([_winner_flag(m) for m in matches], dtype=np.int8),
+        sets=np.array([(m.sets or 0) if m.winner_id is not None else 0 for m in matches], dtype=np.int32))
+
+STANDINGS_DTYPE = np.dtype([('group', np.int32), ('player_id', object), ('m_w', np.int32), ('m_l', np.int32),
+                            ('s_w', np.int32), ('s_l', np.int32), ('rank', np.int32)])
+
+class SeasonStandings:
+    """
+    Ordered standings for all groups. table is a structured array (STANDINGS_DTYPE) sorted by group and then
+    by place; rank is the 1-based place within the group.
+    """
+    def __init__(self, groupings, table):
+        self.groupings = groupings
+        self.table = table
+        self._starts = dict((g, np.searchsorted(table['group'], i)) for i, g in enumerate(groupings))
+        self._ends = dict((g, np.searchsorted(table['group'], i, side='right')) for i, g in enumerate(groupings))
+
+    def __len__(self):
+        return len(self.table)
+
+    def rows(self, grouping):
+        return self.table[self._starts[grouping]:self._ends[grouping]]
+
+    def group(self, grouping):
+        """The group's standings as gather_scores returns them: dicts with player_id, m_w, m_l, s_w, s_l."""
+        if grouping not in self._starts:
+            return []
+        return [{'player_id': r['player_id'], 'm_w': int(r['m_w']), 'm_l': int(r['m_l']),
+                 's_w': int(r['s_w']), 's_l': int(r['s_l'])} for r in self.rows(grouping)]
+
+def compute_standings(arrays):
+    """SeasonStandings from match_arrays(); each group comes out exactly as gather_scores orders it."""
+    slot_count = len(arrays.slot_player)
+    m_w = np.zeros(slot_count, dtype=np.int32)
+    m_l = np.zeros(slot_count, dtype=np.int32)
+    s_w = np.zeros(slot_count, dtype=np.int32)
+    s_l = np.zeros(slot_count, dtype=np.int32)
+
+    played = arrays.winner != UNPLAYED
+    first_won = arrays.winner == P1_WON
+    winner = np.where(first_won, arrays.player, arrays.opponent)[played]
+    loser = np.where(first_won, arrays.opponent, arrays.player)[played]
+    extra = np.maximum(arrays.sets[played] - 3, 0)
+    np.add.at(m_w, winner, 1)
+    np.add.at(m_l, loser, 1)
+    np.add.at(s_w, winner, 3)
+    np.add.at(s_l, loser, 3)
+    np.add.at(s_w, loser, extra)
+    np.add.at(s_l, winner, extra)
+
+    # Records outside 0..group size - 1 are dropped, like order_players does
+    group_size = np.bincount(arrays.slot_group, minlength=len(arrays.groupings))[arrays.slot_group]
+    kept = np.nonzero((m_w < group_size) & (m_l < group_size))[0]
+
+    # Buckets by wins then losses, both descending (order_players' bucket order); inside a bucket the order
+    # gather_scores hands the tie breaker: more sets won, fewer sets lost, then first appearance
+    order = kept[np.lexsort((kept, s_l[kept], -s_w[kept], -m_l[kept], -m_w[kept], arrays.slot_group[kept]))]
+    order = _break_ties(arrays, order, m_w, m_l, s_w, s_l)
+
+    table = np.empty(len(order), dtype=STANDINGS_DTYPE)
+    table['group'] = arrays.slot_group[order]
+    table['player_id'] = arrays.slot_player[order]
+    table['m_w'] = m_w[order]
+    table['m_l'] = m_l[order]
+    table['s_w'] = s_w[order]
+    table['s_l'] = s_l[order]
+    if len(order):
+        new_group = np.r_[True, table['group'][1:] != table['group'][:-1]]
+        starts = np.maximum.accumulate(np.where(new_group, np.arange(len(order)), 0))
+        table['rank'] = np.arange(len(order)) - starts + 1
+    return SeasonStandings(arrays.groupings, table)
+
+def _local_index(slot_group):
+    """Position of each slot within its group (slots of a group are numbered in first appearance order)."""
+    by_group = np.argsort(slot_group, kind='stable')
+    sorted_groups = slot_group[by_group]
+    first = np.searchsorted(sorted_groups, sorted_groups)
+    local = np.empty(len(slot_group), dtype=np.int64)
+    local[by_group] = np.arange(len(slot_group)) - first
+    return local
+
+class _HeadToHeadCounts:
+    """Head to head wins and unreported matches for a set of groups, tallied together as [group, i, j] arrays."""
+    def __init__(self, arrays, groups):
+        self.arrays = arrays
+        self.local = _local_index(arrays.slot_group)
+        self.size = np.bincount(arrays.slot_group, minlength=len(arrays.groupings))
+        self.lookup = np.full(len(arrays.groupings), -1)
+        self.lookup[groups] = np.arange(len(groups))
+        self.has_bye = np.zeros(len(arrays.groupings), dtype=bool)
+        self.has_bye[arrays.slot_group[np.equal(arrays.slot_player, None)]] = True
+        n = int(self.size[groups].max())
+        self.wins = np.zeros((len(groups), n, n), dtype=np.int64)
+        self.unreported = np.zeros((len(groups), n, n), dtype=np.int64)
+
+        t = self.lookup[arrays.group]
+        counted = t >= 0
+        t, winner = t[counted], arrays.winner[counted]
+        i, j = self.local[arrays.player[counted]], self.local[arrays.opponent[counted]]
+        p1_won, p2_won, unplayed = winner == P1_WON, winner == P2_WON, winner == UNPLAYED
+        np.add.at(self.wins, (t[p1_won], i[p1_won], j[p1_won]), 1)
+        np.add.at(self.wins, (t[p2_won], j[p2_won], i[p2_won]), 1)
+        np.add.at(self.unreported, (t[unplayed], i[unplayed], j[unplayed]), 1)
+        mirrored = unplayed & (i != j)
+        np.add.at(self.unreported, (t[mirrored], j[mirrored], i[mirrored]), 1)
+
+    def within(self, slots, others):
+        """Head to head wins and unreported matches of each slot against itself and the matching other slot."""
+        t, a, b = self.lookup[self.arrays.slot_group[slots]], self.local[slots], self.local[others]
+        return self.wins[t, a, a] + self.wins[t, a, b], self.unreported[t, a, a] + self.unreported[t, a, b]
+
+    def head_to_head(self, g):
+        """A tie_breaker.HeadToHead for group g, or None if it has a bye."""
+        if self.has_bye[g]:
+            return None
+        k, m = self.lookup[g], self.size[g]
+        player_ids = list(self.arrays.slot_player[self.arrays.slot_group == g])
+        return tie_breaker.HeadToHead.from_counts(player_ids, self.wins[k, :m, :m].tolist(), self.unreported[k, :m, :m].tolist())
+
+def _break_ties(arrays, order, m_w, m_l, s_w, s_l):
+    if len(order) < 2:
+        return order
+    group = arrays.slot_group[order]
+    same = (group[1:] == group[:-1]) & (m_w[order][1:] == m_w[order][:-1]) & (m_l[order][1:] == m_l[order][:-1])
+    if not same.any():
+        return order
+
+    # Runs of equal (group, record); only the ones longer than one player need the tie breaker
+    boundaries = np.flatnonzero(np.r_[True, ~same, True])
+    starts, ends = boundaries[:-1], boundaries[1:]
+    tied = ends - starts > 1
+    starts, ends = starts[tied], ends[tied]
+    counts = _HeadToHeadCounts(arrays, np.unique(group[starts]))
+    order = order.copy()
+
+    # Two way ties, the common case, are settled for all groups at once. The pair arrives sorted by sets won
+    # then sets lost, so the set rules and the fallback all keep it as is; only the head to head rules can
+    # swap it: the second player won their match, or the first lost every match and has none left to play.
+    pair = (ends - starts == 2) & ~counts.has_bye[group[starts]]
+    first, second = order[starts[pair]], order[starts[pair] + 1]
+    won_first, open_first = counts.within(first, second)
+    won_second, _ = counts.within(second, first)
+    swap = (won_first != 1) & ((won_second == 1) | ((open_first == 0) & (won_first == 0)))
+    order[starts[pair][swap]] = second[swap]
+    order[starts[pair][swap] + 1] = first[swap]
+
+    head_to_head = {}
+    for start, end in zip(starts[~pair].tolist(), ends[~pair].tolist()):
+        g = group[start]
+        if g not in head_to_head:
+            head_to_head[g] = counts.head_to_head(g)
+        h2h = head_to_head[g]
+        # Groups with a bye go through the original filters, which need the match list
+        group_matches = [] if h2h else _group_matches(arrays, g)
+        tied_players = [{'player_id': arrays.slot_player[s], 'm_w': int(m_w[s]), 'm_l': int(m_l[s]),
+                         's_w': int(s_w[s]), 's_l': int(s_l[s]), 'slot': s} for s in order[start:end].tolist()]
+        order[start:end] = [p['slot'] for p in tie_breaker.resolve_tie(tied_players, group_matches, h2h)]
+    return order
+
+def season_standings(matches):
+    """Standings for every group in a list of matches (e.g. db.get_matches_for_season)."""
+    return compute_standings(match_arrays(matches))
@@ -0,0 +1,190 @@
+import asyncio
+import collections
+import logging
+import random
+import time
+
+# Keeps the bot's RTM connection alive from inside the bot process, on the dispatcher's event loop. Every
+# HEARTBEAT_SECONDS it sends a ping; when MISSED_PONGS pings in a row go unanswered the connection is taken
+# as stalled and reopened. Reconnects back off exponentially with full jitter, so a Slack outage isn't met
+# with a reconnect storm. Messages are remembered by (channel, ts): one delivered twice around a reconnect
+# is only handled once, and when the transport can fetch history, whatever arrived while the connection was
+# down is replayed. health() reports how the connection has been doing.
+
+HEARTBEAT_SECONDS = 5
+MISSED_PONGS = 2
+BACKOFF_BASE = 1.0 # seconds; attempt n waits up to BACKOFF_BASE * 2 ** n
+BACKOFF_CAP = 60.0
+SEEN_LIMIT = 5000 # message timestamps remembered for deduplication
+
+class Supervisor:
+    """
+    Connection state for one transport (see dispatcher for the transport interface). Transports may also
+    have ping(id) (needed for heartbeats), history(channel, oldest) (for replay) and can_reconnect (False
+    for one that can't be reopened, which ends the run instead of retrying).
+    :param max_attempts: connect attempts per reconnect before giving up (None: keep trying)
+    """
+    def __init__(self, transport, heartbeat=HEARTBEAT_SECONDS, missed_pongs=MISSED_PONGS, backoff_base=BACKOFF_BASE,
+                 backoff_cap=BACKOFF_CAP, max_attempts=None, logger=None, rng=None):
+        self.transport = transport
+        self.heartbeat_seconds = heartbeat
+        self.missed_pongs = missed_pongs
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.max_attempts = max_attempts
+        self.logger = logger or logging.getLogger('smashbot')
+        self.rng = rng or random.Random()
+        self.connected = False
+        self._next_ping = 1
+        self._waiting = collections.OrderedDict() # ping id -> when it was sent
+        self._seen = collections.OrderedDict() # (channel, ts) of handled messages, oldest first
+        self._last_ts = {} # channel -> newest message ts seen there
+        self._stats = collections.Counter()
+        self._connected_at = None
+        self._disconnected_at = None
+        self._last_pong_ms = None
+        self._started = time.time()
+
+    def on_connected(self):
+        """Records a successful connect (the first one is made by whoever starts the dispatcher)."""
+        self.connected = True
+        self._stats['connects'] += 1
+        self._connected_at = time.time()
+        self._waiting.clear()
+
+    def on_lost(self, reason):
+        """Records a dead or stalled connection and closes what is left of it, so reconnect() opens a new one."""
+        if self.connected:
+            self.logger.debug('Connection lost: {}'.format(reason))
+            self._stats['disconnects'] += 1
+            self._disconnected_at = time.time()
+        self.connected = False
+        try:
+            self.transport.close()
+        except Exception as e:
+            self.logger.debug('Close failed: {}'.format(e))
+
+    def backoff(self, attempt):
+        """Seconds to wait before connect attempt attempt + 1 (full jitter)."""
+        return self.rng.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    async def reconnect(self):
+        """Reopens the transport, backing off between attempts. False when it gives up."""
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while self.max_attempts is None or attempt < self.max_attempts:
+            if not getattr(self.transport, 'can_reconnect', True):
+                return False
+            await asyncio.sleep(self.backoff(attempt))
+            try:
+                connected = await loop.run_in_executor(None, self.transport.connect)
+            except Exception as e:
+                self.logger.debug('Reconnect attempt failed: {}'.format(e))
+                connected = False
+            if connected:
+                self._stats['reconnects'] += 1
+                self.on_connected()
+                return True
+            self._stats['failed_connects'] += 1
+            attempt += 1
+        return False
+
+    async def heartbeat(self, on_stall):
+        """
+        Pings until cancelled. When too many pings in a row went unanswered it calls on_stall(reason), which
+        should stop reading the connection and call on_lost (the dispatcher's does).
+        """
+        if not hasattr(self.transport, 'ping'):
+            return
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            if not self.connected:
+                continue
+            if len(self._waiting) >= self.missed_pongs:
+                self._stats['stalls'] += 1
+                on_stall('{} pings unanswered'.format(len(self._waiting)))
+                continue
+            ping_id = self._next_ping
+            self._next_ping += 1
+            try:
+                self.transport.ping(ping_id)
+            except Exception as e:
+                self.logger.debug('Ping failed: {}'.format(e))
+            self._waiting[ping_id] = time.perf_counter()
+            self._stats['pings'] += 1
+
+    def received(self, events):
+        """Takes pongs and repeated messages out of a batch of events read from the transport."""
+        fresh = []
+        for event in events:
+            if event is None:
+                continue
+            self._stats['frames'] += 1
+            if event.get('type') == 'pong':
+                self._pong(event.get('reply_to'))
+                continue
+            channel, ts = event.get('channel'), event.get('ts')
+            if ts is not None and channel is not None:
+                key = (channel, ts)
+                if key in self._seen:
+                    self._stats['duplicates'] += 1
+                    continue
+                self._seen[key] = None
+                if len(self._seen) > SEEN_LIMIT:
+                    self._seen.popitem(last=False)
+                if float(ts) > float(self._last_ts.get(channel, 0)):
+                    self._last_ts[channel] = ts
+            fresh.append(event)
+        return fresh
+
+    def _pong(self, reply_to):
+        sent = self._waiting.get(reply_to)
+        if sent is None:
+            return
+        self._stats['pongs'] += 1
+        self._last_pong_ms = (time.perf_counter() - sent) * 1000
+        # A pong also answers every ping sent before it
+        while self._waiting:
+            ping_id, _ = self._waiting.popitem(last=False)
+            if ping_id == reply_to:
+                break
+
+    async def missed(self):
+        """Messages sent to channels we've heard from while the connection was down, oldest first."""
+        if not hasattr(self.transport, 'history'):
+            return []
+        loop = asyncio.get_running_loop()
+        events = []
+        for channel, ts in list(self._last_ts.items()):
+            try:
+                history = await loop.run_in_executor(None, self.transport.history, channel, ts)
+            except Exception as e:
+                self.logger.debug('History for {} failed: {}'.format(channel, e))
+                continue
+            events.extend(history)
+        events = self.received(events)
+        self._stats['replayed'] += len(events)
+        return events
+
+    def health(self):
+        """Connection health as a dict of plain values."""
+        now = time.time()
+        stats = self._stats
+        return {
+            'connected': self.connected,
+            'connected_for': now - self._connected_at if self.connected and self._connected_at else 0.0,
+            'down_since': self._disconnected_at if not self.connected else None,
+            'uptime': now - self._started,
+            'connects': stats['connects'],
+            'reconnects': stats['reconnects'],
+            'failed_connects': stats['failed_connects'],
+            'disconnects': stats['disconnects'],
+            'stalls': stats['stalls'],
+            'pings': stats['pings'],
+            'pongs': stats['pongs'],
+            'unanswered_pings': len(self._waiting),
+            'last_pong_ms': self._last_pong_ms,
+            'frames': stats['frames'],
+            'duplicates': stats['duplicates'],
+            'replayed': stats['replayed'],
+        }
@@ -99,10 +99,131 @@ def resolve_group_tie(players, group_matches):
     moved_down.reverse()
     return moved_up + tied_players + moved_down
 
+class HeadToHead:
+    """
+    Every result between the players of a group, built once from its matches: wins[i][j] counts the matches
+    player i won against player j and unreported[i][j] the ones between them with no winner yet. Indices
+    follow the order of the player list it was built from.
+    """
+    def __init__(self, player_ids, group_matches):
+        self.index = dict((pid, i) for i, pid in enumerate(player_ids))
+        n = len(player_ids)
+        self.wins = [[0] * n for _ in range(n)]
+        self.unreported = [[0] * n for _ in range(n)]
+        index = self.index
+        for m in group_matches:
+            i = index.get(m.player_1_id)
+            j = index.get(m.player_2_id)
+            if i is None or j is None:
+                continue
+            if m.winner_id == m.player_1_id:
+                self.wins[i][j] += 1
+            elif m.winner_id == m.player_2_id:
+                self.wins[j][i] += 1
+            elif m.winner_id is None:
+                self.unreported[i][j] += 1
+                if i != j:
+                    self.unreported[j][i] += 1
+
+    @classmethod
+    def from_counts(cls, player_ids, wins, unreported):
+        """Wraps counts tallied elsewhere (lists of lists indexed like player_ids), e.g. by standings_engine."""
+        h2h = cls.__new__(cls)
+        h2h.index = dict((pid, i) for i, pid in enumerate(player_ids))
+        h2h.wins = wins
+        h2h.unreported = unreported
+        return h2h
+
+def _unique_extreme(players, attribute, largest):
+    """Position of the only player with the most (or least) of attribute, or None if it is shared."""
+    best = None
+    count = 0
+    for t, p in enumerate(players):
+        value = p[attribute]
+        if best is None or (value > best_value if largest else value < best_value):
+            best, best_value, count = t, value, 1
+        elif value == best_value:
+            count += 1
+    return best if count == 1 else None
+
+def _resolve_tie(tied_players, h2h):
+    """
+    resolve_group_tie against a HeadToHead: the head to head wins and unreported matches of each player within
+    the tied set are summed once and updated as players are taken out, instead of re-filtering the matches.
+    """
+    tied_players = tied_players[:]
+    wins, unreported = h2h.wins, h2h.unreported
+    rows = [h2h.index[p['player_id']] for p in tied_players]
+    won = [sum(wins[i][j] for j in rows) for i in rows]
+    open_matches = [sum(unreported[i][j] for j in rows) for i in rows]
+    moved_up = []
+    moved_down = []
+    while len(tied_players) > 1:
+        k = len(tied_players)
+        up = True
+        pick = next((t for t in range(k) if won[t] == k - 1), None)
+        if pick is None:
+            up = False
+            pick = next((t for t in range(k) if open_matches[t] == 0 and won[t] == 0), None)
+        if pick is None:
+            up = True
+            pick = _unique_extreme(tied_players, 's_w', True)
+        if pick is None:
+            up = False
+            pick = _unique_extreme(tied_players, 's_w', False)
+        if pick is None:
+            up = True
+            pick = _unique_extreme(tied_players, 's_l', False)
+        if pick is None:
+            up = False
+            pick = _unique_extreme(tied_players, 's_l', True)
+        if pick is None:
+            up = True
+            pick = 0 #just take whoever
+
+        (moved_up if up else moved_down).append(tied_players.pop(pick))
+        removed = rows.pop(pick)
+        del won[pick], open_matches[pick]
+        for t, i in enumerate(rows):
+            won[t] -= wins[i][removed]
+            open_matches[t] -= unreported[i][removed]
+    moved_down.reverse()
+    return moved_up + tied_players + moved_down
+
 def order_players(group_players, group_matches):
+    """
+    Orders a group by matches won (then by matches lost, more first, as it always has), breaking ties with
+    resolve_group_tie's rules. Players are bucketed by record in one pass and the head to head results are
+    only tallied if some bucket actually has a tie. Records outside 0..len(group_players)-1 are left out.
+    """
+    n = len(group_players)
+    buckets = {}
+    for p in group_players:
+        buckets.setdefault((p['m_w'], p['m_l']), []).append(p)
+    records = sorted((r for r in buckets if 0 <= r[0] < n and 0 <= r[1] < n), reverse=True)
+
+    h2h = None
     final_order = []
-    for wins in range(len(group_players)-1, -1, -1):
-        for losses in range(len(group_players) - 1, -1, -1):
-            temp = [p for p in group_players if p['m_w'] == wins and p['m_l'] == losses]
-            final_order = final_order + resolve_group_tie(temp, group_matches)
+    for record in records:
+        tied = buckets[record]
+        if len(tied) < 2:
+            final_order.extend(tied)
+            continue
+        if h2h is None:
+            h2h = head_to_head(group_players, group_matches) or False
+        final_order.extend(resolve_tie(tied, group_matches, h2h))
     return final_order
+
+def head_to_head(group_players, group_matches):
+    """
+    The group's HeadToHead, or None if it can't have one: a bye (None) "wins" every unreported match in the
+    old checks and ids must be unique for the matrix, so groups like that keep going through the original filters.
+    """
+    player_ids = [p['player_id'] for p in group_players]
+    if None in player_ids or len(set(player_ids)) != len(player_ids):
+        return None
+    return HeadToHead(player_ids, group_matches)
+
+def resolve_tie(tied_players, group_matches, h2h):
+    """Orders one bucket of players sharing a record; h2h is head_to_head() for their group (None falls back)."""
+    return _resolve_tie(tied_players, h2h) if h2h else resolve_group_tie(tied_players, group_matches)
@@ -0,0 +1,169 @@
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(__file__), "../backend"))
+
+import time
+import commands
+from smashbot import SmashBot
+
+# Compares the command router with a copy of the old path (bot_config lookups in the message filter, the
+# if/elif chain and the exception driven parsers): first that both pick the same command with the same
+# arguments for every message in a corpus, then the time each takes per message. The one intended
+# difference: the commissioner's "@winner over @loser 3-1" used to fail (the 'over me' check raised first)
+# and now reports the score.
+# python scripts/bench_commands.py [rounds]
+
+rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+BOT, CHANNEL, ADMIN = 'UBOT', 'CLEAGUE', 'UADMIN'
+os.environ.setdefault('BOT_SLACK_USER_ID', BOT)
+os.environ.setdefault('PONG_CHANNEL_SLACK_ID', CHANNEL)
+os.environ.setdefault('COMMISSIONER_SLACK_ID', ADMIN)
+import bot_config
+
+# The old path, as SmashBot had it, returning what it would have run instead of running it
+
+def old_filter(message_list):
+    valid_messages = []
+    for message_object in message_list:
+        if 'text' not in message_object or 'channel' not in message_object or 'user' not in message_object or 'ts' not in message_object:
+            continue
+        if 'bot_id' in message_object:
+            continue
+        message_object = dict(message_object)
+        message_text = message_object['text']
+        if message_object['channel'][:1] == 'D':
+            if message_text.startswith('<@' + bot_config.get_bot_slack_user_id() + '>'):
+                message_text = message_text[message_text.index(">") + 1:].strip()
+            message_object['text'] = message_text
+            valid_messages.append(message_object)
+            continue
+        if message_object['channel'] == bot_config.get_channel_slack_id() and message_text.startswith('<@' + bot_config.get_bot_slack_user_id() + '>'):
+            message_text = message_text[message_text.index(">") + 1:].strip()
+            message_object['text'] = message_text
+            valid_messages.append(message_object)
+    return valid_messages
+
+def old_parse_first_slack_id(message):
+    return message[message.index('<@') + 2 : message.index('>')].upper()
+
+def old_parse_second_slack_id(message):
+    return old_parse_first_slack_id(message[message.index('>') + 1:])
+
+def old_parse_score(message):
+    dash_index = message.index('-')
+    score_substring = message[dash_index - 1 : dash_index + 2]
+    if score_substring != "3-0" and score_substring != "3-1" and score_substring != "3-2":
+        raise Exception("Malformed score")
+    return int(score_substring[0]), int(score_substring[2])
+
+def old_parse_message(command, poster):
+    isAdmin = poster == bot_config.get_commissioner_slack_id()
+    if command.startswith('me over '):
+        winner, loser = poster, old_parse_first_slack_id(command)
+    elif command.startswith('<@') and command.index('over me') > 0:
+        winner, loser = old_parse_first_slack_id(command), poster
+    elif isAdmin and command.startswith('<@'):
+        winner, loser = old_parse_first_slack_id(command), old_parse_second_slack_id(command)
+    else:
+        return None
+    if winner == loser:
+        return None
+    try:
+        score_1, score_2 = old_parse_score(command)
+    except Exception:
+        return None
+    return {'winner_id': winner, 'loser_id': loser, 'score_total': score_1 + score_2}
+
+def old_route(message_object):
+    command, channel, user_id = message_object['text'], message_object['channel'], message_object['user']
+    if command == 'leaderboard':
+        return ('leaderboard',)
+    elif command == 'loserboard' or command == 'troy':
+        return ('loserboard',)
+    elif command == 'my total stats' and channel[:1] == 'D':
+        return ('my total stats',)
+    elif command == 'matches for week':
+        return ('matches for week',)
+    elif command == 'who do i play' and channel[:1] == 'D':
+        return ('who do i play',)
+    elif command == 'rating':
+        return ('rating',)
+    elif command == 'ratings':
+        return ('ratings',)
+    elif command == 'help':
+        return ('help',)
+    elif command == 'db stats' and user_id == bot_config.get_commissioner_slack_id():
+        return ('db stats',)
+    elif command == 'health' and user_id == bot_config.get_commissioner_slack_id():
+        return ('health',)
+    elif command.startswith('odds '):
+        return ('odds', command[5:].strip())
+    elif command.startswith('group'):
+        return ('group', command[6])
+    try:
+        result = old_parse_message(command, user_id)
+    except Exception:
+        result = None
+    if result is None:
+        return ('format',)
+    return ('score', result['winner_id'], result['loser_id'], result['score_total'])
+
+# The new path, reduced to the same shape
+
+NAMES = {'loserboard': 'loserboard', 'troy': 'loserboard', 'odds {group:text}': 'odds', 'group {group:group}...': 'group'}
+
+def new_route(bot, message):
+    route, arguments = bot.router.match(commands.message_from_event(message, bot.config))
+    if route is None:
+        return ('format',)
+    if 'sets' in arguments:
+        winner, loser = arguments.get('winner', message['user']), arguments.get('loser', message['user'])
+        if winner == loser:
+            return ('format',) # report_score answers with the format help, as before
+        return ('score', winner, loser, arguments['sets'])
+    name = NAMES.get(route.pattern, route.pattern)
+    return (name,) + tuple(arguments.values())
+
+def corpus():
+    mention = '<@' + BOT + '> '
+    texts = ['leaderboard', 'loserboard', 'troy', 'my total stats', 'matches for week', 'who do i play', 'rating',
+             'ratings', 'help', 'db stats', 'health', 'odds a', 'odds  B ', 'group a', 'group c please',
+             'me over <@u2> 3-2', 'me over <@U2> 3-0 gg', '<@U2> over me 3-1', '<@U2> over me 3-0', 'me over <@U2> 2-3',
+             '<@U3> over <@U4> 3-1', 'what is this', 'me over <@U1> 3-1', 'leaderboard please']
+    users = ['U1', ADMIN]
+    events = []
+    for text in texts:
+        for user in users:
+            events.append({'text': mention + text, 'channel': CHANNEL, 'user': user, 'ts': '1570000000.000100'})
+            events.append({'text': text, 'channel': 'D123', 'user': user, 'ts': '1570000000.000200'})
+    events.append({'text': mention + 'help', 'channel': 'COTHER', 'user': 'U1', 'ts': '1'})
+    events.append({'text': 'help', 'channel': CHANNEL, 'user': 'U1', 'ts': '1', 'bot_id': 'B1'})
+    return events
+
+def main():
+    bot = SmashBot.__new__(SmashBot) # no Slack client or log file needed to route messages
+    bot.config = commands.snapshot_config()
+    bot.router = bot.build_router()
+
+    events = corpus()
+    old = [old_route(m) for m in old_filter(events)]
+    new = [new_route(bot, m) for m in bot.filter_invalid_messages([dict(e) for e in events])]
+    differences = [(m['text'], m['user'], a, b) for m, a, b in zip(old_filter(events), old, new) if a != b]
+    intended = [d for d in differences if d[1] == ADMIN and d[0].startswith('<@') and 'over me' not in d[0]]
+    print('{} messages routed, {} differences ({} intended)'.format(len(old), len(differences), len(intended)))
+    for text, user, a, b in differences:
+        print('  {!r} from {}: was {}, now {}'.format(text, user, a, b))
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for m in old_filter(events):
+            old_route(m)
+    old_us = (time.perf_counter() - started) / (rounds * len(events)) * 1e6
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for m in bot.filter_invalid_messages([dict(e) for e in events]):
+            bot.router.match(commands.message_from_event(m, bot.config))
+    new_us = (time.perf_counter() - started) / (rounds * len(events)) * 1e6
+    print('old path {:.2f} us per message, router {:.2f} us per message ({:.1f}x)'.format(old_us, new_us, old_us / new_us))
+
+main()
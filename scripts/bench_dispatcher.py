@@ -0,0 +1,86 @@
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(__file__), "../backend"))
+
+import asyncio
+import threading
+import time
+import dispatcher
+
+# Sends bursts of messages over a local socket to the dispatcher and to a copy of the old loop (read, handle
+# every message in turn, sleep a second), and compares how long messages wait before their handler starts.
+# Every few messages is a slow one, like a group standings recompute. Also checks that each channel's
+# messages were handled in the order they were sent.
+# python scripts/bench_dispatcher.py [messages] [channels] [slow ms]
+
+messages = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+channels = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+slow_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 200
+FAST_MS = 2
+SLOW_EVERY = 10
+BURST = 20 # messages per burst
+GAP = 0.05 # seconds between bursts
+
+def events():
+    return [{'channel': 'C{}'.format(i % channels), 'seq': i, 'text': 'slow' if i % SLOW_EVERY == 0 else 'fast'}
+            for i in range(messages)]
+
+class Recorder:
+    def __init__(self):
+        self.sent = {}
+        self.started = {}
+        self.order = {}
+        self.lock = threading.Lock()
+
+    def handle(self, event):
+        with self.lock:
+            self.started[event['seq']] = time.perf_counter()
+            self.order.setdefault(event['channel'], []).append(event['seq'])
+        time.sleep((slow_ms if event['text'] == 'slow' else FAST_MS) / 1000)
+
+    def report(self, name):
+        waits = sorted((self.started[s] - self.sent[s]) * 1000 for s in self.started)
+        in_order = all(seqs == sorted(seqs) for seqs in self.order.values())
+        print('{:<10} {} handled, wait p50 {:.1f} ms, p99 {:.1f} ms, max {:.1f} ms, channel order {}'.format(
+            name, len(waits), waits[len(waits) // 2], waits[int(len(waits) * 0.99)], waits[-1], 'kept' if in_order else 'BROKEN'))
+
+def send_all(sock, recorder):
+    pending = events()
+    for start in range(0, len(pending), BURST):
+        burst = pending[start:start + BURST]
+        now = time.perf_counter()
+        for e in burst:
+            recorder.sent[e['seq']] = now
+        dispatcher.SocketTransport.send(sock, *burst)
+        time.sleep(GAP)
+
+def run_dispatcher():
+    recorder = Recorder()
+    transport, theirs = dispatcher.socket_pair()
+    sender = threading.Thread(target=lambda: (send_all(theirs, recorder), theirs.close()))
+
+    async def main():
+        d = dispatcher.Dispatcher(transport, recorder.handle)
+        sender.start()
+        await d.run()
+    asyncio.run(main())
+    sender.join()
+    recorder.report('dispatcher')
+
+def run_polling():
+    recorder = Recorder()
+    transport, theirs = dispatcher.socket_pair()
+    sender = threading.Thread(target=lambda: (send_all(theirs, recorder), theirs.close()))
+    sender.start()
+    while True:
+        try:
+            batch = transport.read()
+        except ConnectionError:
+            break
+        for event in batch:
+            recorder.handle(event)
+        time.sleep(1)
+    sender.join()
+    recorder.report('polling')
+
+run_dispatcher()
+run_polling()
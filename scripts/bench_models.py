@@ -0,0 +1,59 @@
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(__file__), "../backend"))
+
+import gc
+import tempfile
+import time
+import tracemalloc
+import db
+import synthetic_league
+
+# Load time and retained memory of db.get_matches() on a large synthetic history, against the
+# dict-backed Match class it replaced.
+# python scripts/bench_models.py [seasons]
+
+seasons = int(sys.argv[1]) if len(sys.argv) > 1 else 150
+
+class LegacyMatch:
+    def __init__(self, p1_id, p2_id, winner_id, week, grouping, season, sets):
+        self.player_1_id = p1_id
+        self.player_2_id = p2_id
+        self.winner_id = winner_id
+        self.week = week
+        self.grouping = grouping
+        self.season = season
+        self.sets = sets
+
+    @classmethod
+    def from_db(cls, row):
+        return LegacyMatch(row[0], row[1], row[2], row[3], row[4], row[5], row[6])
+
+def legacy_get_matches():
+    rows = db.get_connection().execute('SELECT * FROM match').fetchall()
+    return [LegacyMatch.from_db(m) for m in rows]
+
+def measure(load):
+    load()
+    best = None
+    for _ in range(5):
+        start = time.perf_counter()
+        load()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    gc.collect()
+    tracemalloc.start()
+    matches = load()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return len(matches), best, retained / len(matches)
+
+with tempfile.TemporaryDirectory() as tmp:
+    synthetic_league.populate(os.path.join(tmp, 'bench.sqlite'), seasons=seasons, group_count=8)
+    count, legacy_time, legacy_bytes = measure(legacy_get_matches)
+    _, new_time, new_bytes = measure(db.get_matches)
+    db.close_connections()
+
+print('{} matches'.format(count))
+print('{:<10} {:>12} {:>16}'.format('', 'load (ms)', 'bytes per match'))
+print('{:<10} {:>12.1f} {:>16.0f}'.format('dict', legacy_time * 1000, legacy_bytes))
+print('{:<10} {:>12.1f} {:>16.0f}'.format('tuple', new_time * 1000, new_bytes))
@@ -0,0 +1,44 @@
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(__file__), "../backend"))
+
+import tempfile
+import timeit
+import db
+import migrations
+import synthetic_league
+
+# Query latency on a 50+ season history, without and with the match indexes from migration 2.
+# python scripts/bench_queries.py [seasons]
+
+seasons = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+reps = 200
+match_indexes = ['match_season_grouping', 'match_week', 'match_season_players', 'match_season_players_reversed']
+
+def run_queries(players):
+    season = db.get_current_season()
+    week = db.get_matches_for_season(season)[0].week
+    a, b = players[0], players[1]
+    cases = [
+        ('MAX(season) FROM match', lambda: db.get_connection().execute('SELECT MAX(season) FROM match').fetchone()),
+        ('get_matches_for_season', lambda: db.get_matches_for_season(season)),
+        ('get_matches_for_week', lambda: db.get_matches_for_week(week)),
+        ('get_match_by_players', lambda: db.get_match_by_players(a, b)),
+    ]
+    return [(name, timeit.timeit(fn, number=reps) / reps) for name, fn in cases]
+
+with tempfile.TemporaryDirectory() as tmp:
+    players = synthetic_league.populate(os.path.join(tmp, 'bench.sqlite'), seasons=seasons)
+    match_count = db.get_connection().execute('SELECT COUNT(*) FROM match').fetchone()[0]
+    with db.transaction() as c:
+        for index in match_indexes:
+            c.execute('DROP INDEX ' + index)
+    before = run_queries(players)
+    with db.transaction() as c:
+        migrations._match_indexes(c)
+    after = run_queries(players)
+    db.close_connections()
+
+print('{} seasons, {} matches, mean of {} calls'.format(seasons, match_count, reps))
+print('{:<24} {:>12} {:>12} {:>8}'.format('query', 'before (us)', 'after (us)', 'speedup'))
+for (name, b), (_, a) in zip(before, after):
+    print('{:<24} {:>12.1f} {:>12.1f} {:>7.1f}x'.format(name, b * 1e6, a * 1e6, b / a))
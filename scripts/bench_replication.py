@@ -0,0 +1,49 @@
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(__file__), "../backend"))
+
+import random
+import tempfile
+import threading
+import time
+import db
+import replication
+import synthetic_league
+
+# Pushes a synthetic league to a local replica directory while a writer keeps entering scores,
+# then checks that later pushes only ship changed pages and that the replica matches.
+# python scripts/bench_replication.py [seasons]
+
+seasons = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+
+with tempfile.TemporaryDirectory() as tmp:
+    players = synthetic_league.populate(os.path.join(tmp, 'league.sqlite'), seasons=seasons)
+    target = os.path.join(tmp, 'replica')
+
+    stop = threading.Event()
+    writes = []
+    def writer():
+        rng = random.Random(2)
+        open_matches = [m for m in db.get_matches_for_season(seasons) if m.winner_id is None and m.player_1_id and m.player_2_id]
+        while not stop.is_set() and open_matches:
+            m = open_matches.pop(rng.randrange(len(open_matches)))
+            start = time.monotonic()
+            db.enter_score(m.player_1_id, m.player_2_id, rng.choice([3, 4, 5]))
+            writes.append(time.monotonic() - start)
+            time.sleep(0.002)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    first = replication.replicate(db.path, target)
+    stop.set()
+    thread.join()
+    second = replication.replicate(db.path, target)
+    unchanged = replication.replicate(db.path, target)
+    db.close_connections()
+
+    print('{} seasons, {:.1f} MB'.format(seasons, os.path.getsize(db.path) / 1e6))
+    for label, stats in [('first push', first), ('after writes', second), ('no changes', unchanged)]:
+        print('{:<14} {:>6} of {:>6} pages  {:>10} bytes  {:>7.1f} ms'.format(
+            label, stats['pages_changed'], stats['pages'], stats['bytes_written'], stats['seconds'] * 1e3))
+    if writes:
+        print('{} scores entered during the first push, slowest {:.1f} ms'.format(len(writes), max(writes) * 1e3))
+    print('replica verified:', replication.verify_replica(target))
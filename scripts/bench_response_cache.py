@@ -0,0 +1,61 @@
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(__file__), "../backend"))
+
+import logging
+import tempfile
+import time
+import db
+import response_cache
+import synthetic_league
+from smashbot import SmashBot
+
+# Times `group x` and `matches for week` replies on a synthetic league with the response cache cold and
+# warm, then reports a score and checks the next reply is rebuilt with it (the data version moved on).
+# python scripts/bench_response_cache.py [repeats] [groups] [group size]
+
+repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+groups = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+group_size = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+
+class Recorder:
+    """Stands in for the Slack client and keeps what would have been posted."""
+    def __init__(self):
+        self.posted = []
+
+    def api_call(self, method, **kwargs):
+        if method == 'chat.postMessage':
+            self.posted.append(kwargs['text'])
+        return {'ok': True}
+
+def timed(call):
+    started = time.perf_counter()
+    for _ in range(repeats):
+        call()
+    return (time.perf_counter() - started) / repeats * 1000
+
+def main():
+    synthetic_league.populate(os.path.join(tempfile.mkdtemp(), 'bench.sqlite'), seasons=5, group_count=groups,
+                              group_size=group_size, current_played_fraction=0.5)
+    bot = SmashBot.__new__(SmashBot) # no Slack connection or log file
+    bot.slack_client = Recorder()
+    bot.logger = logging.getLogger('bench')
+    bot.responses = response_cache.ResponseCache()
+    week = db.get_matches_for_season(db.get_current_season())[0].week
+
+    uncached = response_cache.ResponseCache(max_entries=0)
+    for name, call in [('group a', lambda: bot.print_group('C1', 'a')), ('matches for week', lambda: bot.print_whole_week('C1', week))]:
+        bot.responses, warm = uncached, bot.responses
+        cold_ms = timed(call)
+        bot.responses = warm
+        warm_ms = timed(call)
+        print('{:<17} uncached {:.3f} ms, cached {:.3f} ms ({:.0f}x)'.format(name, cold_ms, warm_ms, cold_ms / warm_ms))
+
+    bot.print_group('C1', 'a')
+    before = bot.slack_client.posted[-1]
+    open_match = next(m for m in db.get_matches_for_group(db.get_current_season(), 'A') if m.winner_id is None and m.player_2_id)
+    db.enter_score(open_match.player_1_id, open_match.player_2_id, 3)
+    bot.print_group('C1', 'a')
+    print('after a score: reply {}'.format('rebuilt' if bot.slack_client.posted[-1] != before else 'STALE'))
+    print(bot.responses.stats())
+
+main()
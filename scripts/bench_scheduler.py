@@ -0,0 +1,53 @@
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(__file__), "../backend"))
+
+import datetime
+import random
+import time
+import scheduler
+
+# Builds and validates a schedule for every group size up to the largest, with and without byes and with a
+# skip week, then times the largest group on its own and with last season's week 1 to avoid.
+# python scripts/bench_scheduler.py [largest group]
+
+largest = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+start_date = datetime.date(2026, 1, 5)
+skip_weeks = [start_date + datetime.timedelta(weeks=3)]
+
+def expected_weeks(n, include_byes):
+    if n % 2 == 0:
+        return n - 1
+    return n if include_byes else n - 2
+
+started = time.perf_counter()
+for n in range(2, largest + 1):
+    for include_byes in (False, True):
+        players = list(range(n))
+        schedule = scheduler.schedule_group(players, start_date, skip_weeks, include_byes)
+        weeks = set(m['week'] for m in schedule)
+        if weeks & set(skip_weeks) or len(weeks) != expected_weeks(n, include_byes):
+            sys.exit('{} players{}: wrong weeks'.format(n, ' with byes' if include_byes else ''))
+print('{} group sizes valid in {:.2f} s'.format(2 * (largest - 1), time.perf_counter() - started))
+
+# Last season's week 1 to avoid, for every group size, with and without byes
+started = time.perf_counter()
+for n in range(2, largest + 2):
+    for include_byes in (False, True):
+        players = list(range(n))
+        previous = scheduler.schedule_group(players, start_date, include_byes=include_byes, rng=random.Random(n))
+        avoid = [(m['player_1'], m['player_2']) for m in previous if m['week'] == start_date and m['player_2'] is not None]
+        schedule = scheduler.schedule_group(players, start_date, include_byes=include_byes, avoid_pairs=avoid, rng=random.Random(n + 1))
+        if len(set(m['week'] for m in schedule)) != expected_weeks(n, include_byes):
+            sys.exit('{} players{} avoiding week 1: wrong weeks'.format(n, ' with byes' if include_byes else ''))
+print('{} group sizes valid avoiding last week 1 in {:.2f} s'.format(2 * largest, time.perf_counter() - started))
+
+for n in (largest, largest + 1):
+    players = list(range(n))
+    started = time.perf_counter()
+    previous = scheduler.schedule_group(players, start_date, rng=random.Random(1))
+    print('{} players: {} matches in {:.1f} ms'.format(n, len(previous), (time.perf_counter() - started) * 1000))
+    avoid = [(m['player_1'], m['player_2']) for m in previous if m['week'] == start_date]
+    started = time.perf_counter()
+    schedule = scheduler.schedule_group(players, start_date, avoid_pairs=avoid, rng=random.Random(2))
+    repeats = set(map(frozenset, avoid)) & set(frozenset((m['player_1'], m['player_2'])) for m in schedule if m['week'] == start_date)
+    print('  avoiding last week 1: {} repeats in {:.1f} ms'.format(len(repeats), (time.perf_counter() - started) * 1000))
@@ -0,0 +1,111 @@
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(__file__), "../backend"))
+
+import tempfile
+import time
+import db
+import match_making
+import season_report
+import synthetic_league
+
+# Renders a 20 group season with every format and compares the Confluence output against the
+# print_season_markup it replaced (kept below as it was, apart from the module prefixes).
+# With more than 12 groups the old code put every group past the sixth into one "Standings Cont." table,
+# so the comparison uses a 12 group season where both layouts agree.
+# python scripts/bench_season_report.py [groups] [group size]
+
+groups = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+group_size = int(sys.argv[2]) if len(sys.argv) > 2 else 32 # 32 players play a 31 week round robin
+
+def legacy_print_season_markup(season = None):
+    if season is None:
+        season = db.get_current_season()
+    all_matches = db.get_matches_for_season(season)
+    all_players = db.get_player_directory()
+    groupings = list(set(map(lambda match:match.grouping, all_matches)))
+    weeks = list(set(map(lambda match:match.week, all_matches)))
+    groupings.sort()
+    weeks.sort()
+    output = ''
+    ###
+    ###||heading 1||heading 2||heading 3||
+    ###|cell A1|cell A2|cell A3|
+    ###|cell B1|cell B2|cell B3|
+    max_group_size = 0
+    for grouping in groupings:
+        group_players = [p for p in all_players if p.grouping == grouping]
+        if len(group_players) > max_group_size:
+            max_group_size = len(group_players)
+
+    standing_groups = []
+    # standing_groups.append(groupings)
+    standing_groups.append(groupings[:6])
+    standing_groups.append(groupings[6:])
+    first_group = True
+
+    for standing_group in standing_groups:
+        if first_group:
+            first_group = False
+            output += 'h2. Standings\n'
+        else:
+            output += 'h2. Standings Cont.\n'
+        for grouping in standing_group:
+            output += '||Group ' + grouping
+        output += '||\n'
+        for i in range(0, max_group_size):
+            output += '|'
+
+            for grouping in standing_group:
+                group_matches = [m for m in all_matches if m.grouping == grouping]
+                players = match_making.gather_scores(group_matches)
+                if len(players) > i:
+                    p = players[i]
+                    output += match_making.get_player_name(all_players, p['player_id']) + ' ' + str(p['m_w']) + '-' + str(p['m_l'])# + ' (' + str(p['s_w']) + '-' + str(p['s_l']) + ')'
+                else:
+                    output += ' '
+                output += '|'
+            output += '\n'
+
+    for grouping in groupings:
+        group_matches = [m for m in all_matches if m.grouping == grouping]
+        output += '\nh2. Group '+grouping+'\n'
+        matches_by_week = {}
+        for week in weeks:
+            output += '||'+str(week)
+            matches_by_week[week] = [m for m in group_matches if m.week == week]
+        output += '||\n'
+
+        for i in range(0, len(matches_by_week[weeks[0]])):
+            for week in weeks:
+                if i >= len(matches_by_week[week]):
+                    break
+                m = matches_by_week[week][i]
+                output += '|'+match_making.get_player_print(all_players, m.player_1_id, m)+'\\\\'+match_making.get_player_print(all_players, m.player_2_id, m)
+            output+= '|\n'
+    
+    return output
+
+def best_of(fn, runs=3):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+with tempfile.TemporaryDirectory() as tmp:
+    synthetic_league.populate(os.path.join(tmp, 'same.sqlite'), seasons=1, group_count=12, group_size=8)
+    same = legacy_print_season_markup() == match_making.print_season_markup()
+
+    synthetic_league.populate(os.path.join(tmp, 'bench.sqlite'), seasons=1, group_count=groups, group_size=group_size)
+    weeks = len(set(m.week for m in db.get_matches_for_season(db.get_current_season())))
+    legacy_time, _ = best_of(legacy_print_season_markup, runs=1)
+    timings = [(fmt, best_of(lambda: season_report.render_season(fmt=fmt))) for fmt in season_report.WRITERS]
+    db.close_connections()
+
+print('{} groups of {}, {} weeks'.format(groups, group_size, weeks))
+print('{:<24} {:>10.1f} ms'.format('legacy confluence', legacy_time * 1e3))
+for fmt, (seconds, output) in timings:
+    print('{:<24} {:>10.1f} ms {:>10} chars'.format(fmt, seconds * 1e3, len(output)))
+print('confluence output matches the legacy renderer:', same)
@@ -0,0 +1,70 @@
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(__file__), "../backend"))
+
+import collections
+import tempfile
+import time
+import numpy as np
+import db
+import match_making
+import simulator
+import synthetic_league
+
+# Checks the simulator's batched standings against gather_scores run by run (a few hundred runs of the
+# synthetic season, replayed match by match), then times simulate_season.
+# python scripts/bench_simulator.py [runs] [groups] [group size]
+
+runs = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+groups = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+group_size = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+
+class RecordedLeague(simulator._League):
+    """Keeps the last batch of sampled results so it can be replayed through gather_scores."""
+    def sample(self, runs, rng):
+        self.sampled = super().sample(runs, rng)
+        return self.sampled
+
+def replayed(league, runs, promoted, relegated):
+    up, down = collections.Counter(), collections.Counter()
+    first_won, played = league.sampled
+    for r in range(runs):
+        season = list(league.matches)
+        for c, k in enumerate(league.open.tolist()):
+            m = season[k]
+            season[k] = m._replace(winner_id=m.player_1_id if first_won[r, c] else m.player_2_id, sets=int(played[r, c]))
+        by_group = {}
+        for m in season:
+            by_group.setdefault(m.grouping, []).append(m)
+        for grouping, group_matches in by_group.items():
+            order = [p['player_id'] for p in match_making.gather_scores(group_matches)]
+            up.update((grouping, pid) for pid in order[:promoted])
+            down.update((grouping, pid) for pid in order[len(order) - relegated:])
+    return up, down
+
+with tempfile.TemporaryDirectory() as tmp:
+    synthetic_league.populate(os.path.join(tmp, 'bench.sqlite'), seasons=3, group_count=groups, group_size=group_size)
+    season = db.get_current_season()
+    matches = db.get_matches_for_season(season)
+    rates = simulator.game_rates(db.get_career_stats())
+
+    league = RecordedLeague(matches, rates, 5)
+    checked = mismatches = 0
+    for seed in range(5):
+        up, down = league.play(100, np.random.default_rng(seed), simulator.PROMOTED, simulator.RELEGATED)
+        expected_up, expected_down = replayed(league, 100, simulator.PROMOTED, simulator.RELEGATED)
+        for s, pid in enumerate(league.arrays.slot_player):
+            key = (league.arrays.groupings[league.arrays.slot_group[s]], pid)
+            checked += 1
+            if up[s] != expected_up[key] or down[s] != expected_down[key]:
+                mismatches += 1
+    print('{} player tallies compared with gather_scores, {} mismatches'.format(checked, mismatches))
+
+    start = time.perf_counter()
+    odds = simulator.simulate_season(season, n_runs=runs, seed=1)
+    elapsed = time.perf_counter() - start
+    db.close_connections()
+
+open_matches = sum(1 for m in matches if m.winner_id is None and m.player_1_id is not None and m.player_2_id is not None)
+print('{} groups of {}, {} open matches, {} runs: {:.2f} s'.format(groups, group_size, open_matches, runs, elapsed))
+for o in odds[sorted(odds)[0]]:
+    print('  {}. {} {:.1%} up {:.1%} down'.format(o.place, o.player_id, o.promotion, o.relegation))
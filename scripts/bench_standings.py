@@ -0,0 +1,73 @@
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(__file__), "../backend"))
+
+import random
+import tempfile
+import time
+import db
+import match_making
+import standings_engine
+import synthetic_league
+
+# Checks standings_engine against gather_scores group by group on synthetic seasons (partly played, some with
+# byes and odd results thrown in), then times a whole season both ways.
+# python scripts/bench_standings.py [groups] [group size]
+
+groups = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+group_size = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+
+def by_group(matches):
+    grouped = {}
+    for m in matches:
+        grouped.setdefault(m.grouping, []).append(m)
+    return grouped
+
+def scrambled(matches, rng):
+    # Byes, unplayed matches and lopsided sets so plenty of records and set counts are shared
+    result = []
+    for m in matches:
+        r = rng.random()
+        if r < 0.05:
+            m = m._replace(player_2_id=None, winner_id=None, sets=0)
+        elif r < 0.4:
+            m = m._replace(winner_id=None, sets=0)
+        elif r < 0.7:
+            m = m._replace(winner_id=rng.choice([m.player_1_id, m.player_2_id]), sets=rng.choice([3, 3, 4, 5]))
+        result.append(m)
+    return result
+
+with tempfile.TemporaryDirectory() as tmp:
+    synthetic_league.populate(os.path.join(tmp, 'bench.sqlite'), seasons=3, group_count=groups, group_size=group_size)
+    seasons = [db.get_matches_for_season(s) for s in range(1, 4)]
+    db.close_connections()
+
+rng = random.Random(3)
+checked = mismatches = 0
+for trial in range(200):
+    matches = scrambled(seasons[trial % 3], rng)
+    standings = standings_engine.season_standings(matches)
+    for grouping, group_matches in by_group(matches).items():
+        checked += 1
+        if match_making.gather_scores(group_matches) != standings.group(grouping):
+            mismatches += 1
+print('{} groups compared with gather_scores, {} mismatches'.format(checked, mismatches))
+
+matches = seasons[-1]
+runs = 20
+start = time.perf_counter()
+for _ in range(runs):
+    for grouping, group_matches in by_group(matches).items():
+        match_making.gather_scores(group_matches)
+per_group = (time.perf_counter() - start) / runs
+start = time.perf_counter()
+for _ in range(runs):
+    arrays = standings_engine.match_arrays(matches)
+to_arrays = (time.perf_counter() - start) / runs
+start = time.perf_counter()
+for _ in range(runs):
+    standings_engine.compute_standings(arrays)
+batch = (time.perf_counter() - start) / runs
+print('{} groups of {}, {} matches'.format(groups, group_size, len(matches)))
+print('gather_scores per group  {:>8.2f} ms'.format(per_group * 1e3))
+print('match_arrays             {:>8.2f} ms'.format(to_arrays * 1e3))
+print('compute_standings        {:>8.2f} ms'.format(batch * 1e3))
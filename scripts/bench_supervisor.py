@@ -0,0 +1,135 @@
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(__file__), "../backend"))
+
+import asyncio
+import json
+import queue
+import socket
+import threading
+import time
+import dispatcher
+import supervisor
+
+# Runs the dispatcher against a fake Slack on a local socket that answers pings, then goes quiet. Checks the
+# supervisor notices the stall, reconnects, replays what was posted while it was away (via history) and drops
+# the messages the fake Slack sends again after the reconnect, so every message is handled exactly once and
+# in order. Prints how long detection and reconnection took and the health report.
+# python scripts/bench_supervisor.py [messages per phase] [heartbeat seconds]
+
+per_phase = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+heartbeat = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+CHANNELS = 3
+
+class FakeSlack:
+    """The other end of the socket: answers pings unless silent, and keeps every message it was sent."""
+    def __init__(self):
+        self.log = [] # every message posted, as Slack would keep it
+        self.silent = False
+        self.sockets = queue.Queue()
+        self.stalled_at = None
+        self.reconnected_at = None
+        self.sock = None
+        self._ts = 1000
+
+    def post(self, deliver=True):
+        self._ts += 1
+        event = {'type': 'message', 'channel': 'C{}'.format(self._ts % CHANNELS), 'ts': '{}.000100'.format(self._ts)}
+        self.log.append(event)
+        if deliver:
+            dispatcher.SocketTransport.send(self.sock, event)
+        return event
+
+    def reopen(self):
+        ours, theirs = socket.socketpair()
+        self.reconnected_at = time.perf_counter()
+        self.sockets.put(theirs)
+        return ours
+
+    def history(self, channel, oldest):
+        return [e for e in self.log if e['channel'] == channel and float(e['ts']) > float(oldest)]
+
+    def answer_pings(self, stop):
+        buffer = b''
+        while not stop.is_set():
+            try:
+                self.sock = self.sockets.get_nowait()
+                self.sock.settimeout(0.01)
+                buffer = b''
+            except queue.Empty:
+                pass
+            try:
+                data = self.sock.recv(65536)
+            except (socket.timeout, OSError):
+                continue
+            buffer += data
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                frame = json.loads(line)
+                if frame.get('type') == 'ping' and not self.silent:
+                    dispatcher.SocketTransport.send(self.sock, {'type': 'pong', 'reply_to': frame['id']})
+
+class HistoryTransport(dispatcher.SocketTransport):
+    def __init__(self, sock, slack):
+        super().__init__(sock, reopen=slack.reopen)
+        self.history = slack.history
+
+def main():
+    slack = FakeSlack()
+    ours, theirs = socket.socketpair()
+    slack.sockets.put(theirs)
+    stop = threading.Event()
+    responder = threading.Thread(target=slack.answer_pings, args=(stop,))
+    responder.start()
+    while slack.sock is None:
+        time.sleep(0.001)
+
+    handled = []
+    transport = HistoryTransport(ours, slack)
+    watchdog = supervisor.Supervisor(transport, heartbeat=heartbeat, backoff_base=heartbeat, max_attempts=10)
+    d = dispatcher.Dispatcher(transport, handled.append, supervisor=watchdog, max_handlers=1)
+
+    def script():
+        for _ in range(per_phase):
+            slack.post()
+        time.sleep(heartbeat * 3)
+        # The connection stalls: pongs stop and messages posted meanwhile never arrive
+        slack.silent = True
+        slack.stalled_at = time.perf_counter()
+        resent = [slack.post(deliver=False) for _ in range(per_phase)]
+        while watchdog.connected:
+            time.sleep(heartbeat / 10)
+        detected = time.perf_counter() - slack.stalled_at
+        while not watchdog.connected:
+            time.sleep(heartbeat / 10)
+        slack.silent = False
+        while slack.sock.fileno() == -1 or slack.sockets.qsize():
+            time.sleep(heartbeat / 10)
+        time.sleep(heartbeat)
+        # Slack sometimes redelivers around a reconnect
+        dispatcher.SocketTransport.send(slack.sock, *resent[-5:])
+        for _ in range(per_phase):
+            slack.post()
+        time.sleep(heartbeat * 3)
+        d.stop()
+        return detected
+
+    async def run():
+        return await asyncio.gather(d.run(), asyncio.get_running_loop().run_in_executor(None, script))
+    _, detected = asyncio.run(run())
+    stop.set()
+    responder.join()
+
+    expected = [e['ts'] for e in slack.log]
+    got = [e['ts'] for e in handled]
+    by_channel = {}
+    for e in handled:
+        by_channel.setdefault(e['channel'], []).append(float(e['ts']))
+    print('{} of {} messages handled, {} handled twice, channel order {}'.format(
+        len(set(got) & set(expected)), len(expected), len(got) - len(set(got)),
+        'kept' if all(v == sorted(v) for v in by_channel.values()) else 'BROKEN'))
+    print('stall detected after {:.0f} ms (heartbeat {:.0f} ms, {} missed pongs), reconnected {:.0f} ms after that'.format(
+        detected * 1000, heartbeat * 1000, supervisor.MISSED_PONGS, (slack.reconnected_at - slack.stalled_at - detected) * 1000))
+    for key, value in watchdog.health().items():
+        print('  {}: {}'.format(key, value))
+
+main()
@@ -4,6 +4,7 @@ sys.path.append(os.path.join(os.path.dirname(__file__), "../backend"))
 import slack
 import db
 import match_making
+import ratings
 
 # Fill player_map with player names and assignments when ready to run
 player_map = {
@@ -89,22 +90,22 @@ def ensure_players_in_db():
 
 def update_groupings():
     ensure_players_in_db()
-    existing = db.get_players()
+    existing = db.get_player_directory()
 
     for name, grouping in player_map.items():
-        for e in existing:
-            if e.name == name:
-                db.update_grouping(e.slack_id, grouping)
-                if grouping == '':
-                    db.set_active(e.slack_id, False)
-                else:
-                    db.set_active(e.slack_id, True)
+        e = existing.by_name(name)
+        if e is not None:
+            db.update_grouping(e.slack_id, grouping)
+            if grouping == '':
+                db.set_active(e.slack_id, False)
+            else:
+                db.set_active(e.slack_id, True)
     
 
 def print_new_groups():
     season = db.get_current_season()
     all_matches = db.get_matches_for_season(season)
-    all_players = db.get_players()
+    all_players = db.get_player_directory()
     groups = sorted(list(set([m.grouping for m in all_matches])))
 
     last_group_letter = ''
@@ -120,7 +121,7 @@ def print_new_groups():
 
         if len(last_group):
             for player in last_group + promoted + last_relegated_2:
-                name = [p.name for p in all_players if p.slack_id == player['player_id']][0]
+                name = all_players[player['player_id']].name
                 print("u'"+name+"': '"+last_group_letter+"',")
 
         last_relegated_2 = last_relegated[:]
@@ -130,7 +131,20 @@ def print_new_groups():
     
     player_names = []
     for player in last_group + last_relegated_2:
-        name = [p.name for p in all_players if p.slack_id == player['player_id']][0]
+        name = all_players[player['player_id']].name
         print("u'" + name + "': '" + last_group_letter + "',")
 
+def print_seeded_groups(group_sizes):
+    """
+    Prints a player_map for the active players split into groups by rating instead of by last season's
+    finish, e.g. print_seeded_groups([6, 6, 7, 7, 7, 6]). Paste it in and adjust by hand before running.
+    """
+    all_ratings = dict((r.slack_id, r.rating) for r in db.get_ratings())
+    all_players = db.get_player_directory()
+    active = [p.slack_id for p in all_players.active()]
+    for grouping, slack_ids in ratings.seed_groups(active, all_ratings, group_sizes).items():
+        for slack_id in slack_ids:
+            print("u'" + all_players[slack_id].name + "': '" + grouping + "', # " + str(round(all_ratings[slack_id])))
+        print('')
+
 print_new_groups()
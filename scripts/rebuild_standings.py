@@ -0,0 +1,19 @@
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(__file__), "../backend"))
+
+import db
+
+# Checks the standings table against a full recompute from the match table.
+# python scripts/rebuild_standings.py [season] [--fix]
+
+args = [a for a in sys.argv[1:] if a != '--fix']
+season = int(args[0]) if len(args) else None
+
+mismatches = db.verify_standings(season)
+for season_num, grouping, player, stored, recomputed in mismatches:
+    print('Season', season_num, 'group', grouping, player, 'stored', stored, 'recomputed', recomputed)
+print(len(mismatches), 'mismatched rows')
+
+if len(mismatches) and '--fix' in sys.argv:
+    db.rebuild_standings(season)
+    print('Rebuilt, now', len(db.verify_standings(season)), 'mismatched rows')
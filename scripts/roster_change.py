@@ -0,0 +1,30 @@
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(__file__), "../backend"))
+
+import db
+import roster
+
+# Previews a batch of mid-season roster changes and, with --apply, makes them in one transaction.
+# +slack_id:group[:name] joins (or moves to) a group, -slack_id leaves the league.
+# python scripts/roster_change.py [--apply] [--from=YYYY-MM-DD] +U123:C:Jane -U456 ...
+
+options = dict(a[2:].split('=', 1) if '=' in a else (a[2:], True) for a in sys.argv[1:] if a.startswith('--'))
+joining = []
+leaving = []
+for arg in sys.argv[1:]:
+    if arg.startswith('+'):
+        parts = arg[1:].split(':', 2)
+        joining.append((parts[0], parts[2] if len(parts) > 2 else None, parts[1]))
+    elif arg.startswith('-') and not arg.startswith('--'):
+        leaving.append(arg[1:])
+
+if __name__ == '__main__':
+    change = db.change_roster if 'apply' in options else db.preview_roster_change
+    try:
+        plan = change(joining, leaving, from_week=options.get('from'))
+    except roster.RosterError as e:
+        sys.exit(str(e))
+    for line in roster.describe(plan, db.get_player_directory()):
+        print(line)
+    print('{} added, {} voided, {} reassigned{}'.format(len(plan.added), len(plan.voided), len(plan.reassigned),
+                                                        '' if 'apply' in options else ' (preview only, --apply to make the change)'))
@@ -1,67 +1,65 @@
 import os, sys
 sys.path.append(os.path.join(os.path.dirname(__file__), "../backend"))
 
-import match_making
 import db
-from math import pow
-from copy import copy
+import predictor
+import scenarios
 
-# player structure {'player_id': u'U03NSJJJN', 'm_w': 7, 's_l': 0, 's_w': 21, 'm_l': 0}
+# Best and worst possible places for every player, and who has clinched promotion, been eliminated from it,
+# is safe or is going down. --exhaustive counts every scenario (margins included) for one group instead and
+# prints how often each player finishes in each place; --checkpoint=file lets a long count resume.
+# python scripts/scenario_predictor.py [group] [season] [--exhaustive] [--workers=N] [--checkpoint=file]
 
-#each unplayed match has 6 potential outcomes
-def apply_combo(match, combo):
-    if combo < 3:
-        match.winner_id = match.player_1_id
-        match.sets = 5 - combo
-    else:
-        match.winner_id = match.player_2_id
-        match.sets = 5 - (combo - 3)
-
-def apply_binary_combo(match, combo):
-    match.sets = 3
-    if combo == 0:
-        match.winner_id = match.player_1_id
-    else:
-        match.winner_id = match.player_2_id
+options = dict(a[2:].split('=', 1) if '=' in a else (a[2:], True) for a in sys.argv[1:] if a.startswith('--'))
+args = [a for a in sys.argv[1:] if not a.startswith('--')]
+grouping = args[0].upper() if len(args) > 0 else None # groupings are stored upper case
+season = int(args[1]) if len(args) > 1 else None
 
-def create_match_scenario(unplayed_matches, combo_index):
-    theoretical_matches = [copy(m) for m in unplayed_matches]
-    for i in range(0,len(theoretical_matches)):
-        binary_place = long(pow(2, i+1)) #2, 4, 8, etc
-        combo = (combo_index % binary_place) / binary_place
-        m = theoretical_matches[i]
-        apply_binary_combo(m, combo)
-    return theoretical_matches
+def status(outlook):
+    notes = []
+    if outlook.clinched:
+        notes.append('clinched promotion')
+    elif outlook.eliminated:
+        notes.append('out of promotion')
+    if outlook.relegated:
+        notes.append('relegated')
+    elif outlook.safe:
+        notes.append('safe')
+    if not outlook.exact:
+        notes.append('bounds only')
+    return ', '.join(notes)
 
-def index_by_player_id(list, player_id):
-    for index, item in enumerate(list):
-        if item['player_id'] == player_id:
-            return index
+def print_outlooks():
+    players = db.get_player_directory()
+    outlooks = predictor.predict_season(season)
+    if grouping is not None and grouping not in outlooks:
+        sys.exit('No group ' + grouping)
+    for g in sorted(outlooks):
+        if grouping is not None and g != grouping:
+            continue
+        print('Group ' + g)
+        for o in outlooks[g]:
+            print('  {}. {:<20} best {} worst {}  {}'.format(o.place, players.name(o.player_id), o.best, o.worst, status(o)))
 
-def run_match_combinations(group_matches):
-    player_ids = list(set([m.player_1_id for m in group_matches] + [m.player_2_id for m in group_matches]))
-    played_matches = [m for m in group_matches if m.winner_id is not None]
-    unplayed_matches = [copy(m) for m in group_matches if m.winner_id is None]
-    #focus on each match, one at a time to see if it has implications for anyone
-    for match in unplayed_matches:
-        player_outcomes = {}
-        for i in range(0, 6):
-            player_outcomes[str(i)] = {}
-            for player_id in player_ids:
-                player_outcomes[str(i)][player_id] = []
-            apply_combo(match, i)
+def print_enumeration():
+    if grouping is None:
+        sys.exit('--exhaustive needs a group')
+    current = season if season is not None else db.get_current_season()
+    record = db.get_season(current)
+    workers = int(options['workers']) if 'workers' in options else None
+    result = scenarios.enumerate_group(db.get_matches_for_group(current, grouping),
+                                       best_of=record.best_of if record is not None and record.best_of else 5,
+                                       workers=workers, checkpoint=options.get('checkpoint'))
+    players = db.get_player_directory()
+    print('Group {}: {} scenarios in {:.1f} s ({:,.0f} scenarios/s)'.format(
+        grouping, result.scenarios, result.seconds, result.scenarios_per_second))
+    print('  {:<20} '.format('') + ' '.join('{:>6}'.format(p + 1) for p in range(len(result.player_ids))))
+    for pid in result.player_ids:
+        shares = [count / result.scenarios for count in result.histograms[pid]]
+        print('  {:<20} '.format(players.name(pid)) + ' '.join('{:>6.1%}'.format(s) for s in shares))
 
-            unplayed_matches_copy = [m for m in unplayed_matches if m != match]
-            combinations = long(pow(2, len(unplayed_matches_copy)))
-            for j in range(0, combinations):
-                theoretical_matches = create_match_scenario(unplayed_matches_copy, j)
-                full_scenario = played_matches + [match] + theoretical_matches
-                ordered_players = match_making.gather_scores(full_scenario)
-                for player_id in player_ids:
-                    player_outcomes[str(i)][player_id].append(index_by_player_id(ordered_players, player_id))
-
-        a=0
-
-all_matches = db.get_matches_for_season(db.get_current_season())
-group_matches = [m for m in all_matches if m.grouping == 'B']
-run_match_combinations(group_matches)
\ No newline at end of file
+if __name__ == '__main__':
+    if 'exhaustive' in options:
+        print_enumeration()
+    else:
+        print_outlooks()
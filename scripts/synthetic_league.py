@@ -0,0 +1,61 @@
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(__file__), "../backend"))
+
+import datetime
+import random
+import db
+import match_making
+
+# Builds fake league histories for the benchmark scripts. Never point this at the real database.
+
+def make_players(group_count, group_size):
+    players = []
+    for g in range(group_count):
+        grouping = chr(ord('A') + g) if g < 26 else 'G' + str(g)
+        for i in range(group_size):
+            players.append(db.Player('U{:03d}{:03d}'.format(g, i), 'Player {}{}'.format(grouping, i), grouping, 1))
+    return players
+
+def random_result(match_dict, rng):
+    if match_dict['player_1'] is None or match_dict['player_2'] is None:
+        return None, 0
+    winner = match_dict['player_1'] if rng.random() < 0.5 else match_dict['player_2']
+    return winner.slack_id, rng.choice([3, 4, 5])
+
+def season_rows(players, season, start_date, rng, played_fraction=1.0):
+    rows = []
+    groupings = sorted(set(p.grouping for p in players))
+    for grouping in groupings:
+        group_players = [p for p in players if p.grouping == grouping]
+        rng.shuffle(group_players)
+        for m in match_making.create_matches(start_date, group_players, []):
+            winner, sets = random_result(m, rng) if rng.random() < played_fraction else (None, 0)
+            p1 = m['player_1'].slack_id if m['player_1'] is not None else None
+            p2 = m['player_2'].slack_id if m['player_2'] is not None else None
+            rows.append((p1, p2, winner, str(m['week']), grouping, season, sets))
+    return rows
+
+def populate(path, seasons=50, group_count=6, group_size=8, seed=1, current_played_fraction=0.5):
+    """
+    Creates a fresh database at path holding seasons worth of full round robins and points db at it.
+    The last season is only partly played so it looks like one in progress.
+    """
+    if os.path.exists(path):
+        raise Exception(path + ' already exists')
+    rng = random.Random(seed)
+    db.path = path
+    db.create_tables()
+    players = make_players(group_count, group_size)
+    start = datetime.date(2015, 1, 5)
+    with db.transaction() as c:
+        c.executemany('INSERT INTO player VALUES (?, ?, ?, ?)', [(p.slack_id, p.name, p.grouping, p.active) for p in players])
+        for season in range(1, seasons + 1):
+            played = current_played_fraction if season == seasons else 1.0
+            rows = season_rows(players, season, start, rng, played)
+            c.executemany('INSERT INTO match VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            db.create_season(season, start, [r[3] for r in rows])
+            start += datetime.timedelta(weeks=group_size + 2)
+        db.rebuild_standings()
+        db.rebuild_career_stats()
+        db.rebuild_ratings()
+    return players
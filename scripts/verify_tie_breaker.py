@@ -0,0 +1,197 @@
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(__file__), "../backend"))
+
+import collections
+import random
+import time
+import tie_breaker
+
+# Differential check of tie_breaker.order_players against the filter-based version it replaced (frozen
+# below, unchanged), on randomized groups: partial seasons, byes, repeated pairings, results for players
+# outside the group, records out of range and plenty of shared set counts. Then times both on realistic groups.
+# python scripts/verify_tie_breaker.py [groups]
+
+groups = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+# ---- frozen copy of the old tie_breaker ----
+
+# player structure {'player_id': u'U03NSJJJN', 'm_w': 7, 's_l': 0, 's_w': 21, 'm_l': 0}
+
+def get_tied_players(players):
+    tied_groups = []
+    for i in range(0, len(players)):
+        temp = [p for p in players if p['m_w'] == i]
+        if len(temp) > 0:
+            tied_groups.append(temp)
+    return tied_groups
+
+def _check_more_of_player_attribute(players, attribute):
+    temp = sorted(players, key=lambda x: x[attribute], reverse=True)
+    if temp[0][attribute] > temp[1][attribute]:
+        return temp[0]
+    return None
+
+def _check_less_of_player_attribute(players, attribute):
+    temp = sorted(players, key=lambda x: x[attribute])
+    if temp[0][attribute] < temp[1][attribute]:
+        return temp[0]
+    return None
+
+def check_h2h_won_all(players, group_matches):
+    player_ids = [p['player_id'] for p in players]
+    applicable_matches = [m for m in group_matches if m.player_1_id in player_ids and m.player_2_id in player_ids]
+    for player in players:
+        if len([m for m in applicable_matches if m.winner_id == player['player_id']]) == len(players)-1:
+            return player
+    return None
+
+def check_h2h_lost_all(players, group_matches):
+    player_ids = [p['player_id'] for p in players]
+    applicable_matches = [m for m in group_matches if m.player_1_id in player_ids and m.player_2_id in player_ids]
+    for player in players:
+        player_matches = [m for m in applicable_matches if m.player_1_id == player['player_id'] or m.player_2_id == player['player_id']]
+        if len([m for m in player_matches if m.winner_id is None]):
+            continue
+        if len([m for m in applicable_matches if m.winner_id == player['player_id']]) == 0:
+            return player
+    return None
+
+def check_more_sets_won(players):
+    return _check_more_of_player_attribute(players, 's_w')
+
+def check_less_sets_won(players):
+    return _check_less_of_player_attribute(players, 's_w')
+
+def check_more_sets_lost(players):
+    return _check_more_of_player_attribute(players, 's_l')
+
+def check_less_sets_lost(players):
+    return _check_less_of_player_attribute(players, 's_l')
+
+def resolve_group_tie(players, group_matches):
+    tied_players = players[:]
+    moved_up = []
+    moved_down = [] #will have to reverse this one when putting the two together
+    while len(tied_players) > 1:
+        move_up = check_h2h_won_all(tied_players, group_matches)
+        if move_up:
+            moved_up.append(move_up)
+            tied_players.remove(move_up)
+            continue
+
+        move_down = check_h2h_lost_all(tied_players, group_matches)
+        if move_down:
+            moved_down.append(move_down)
+            tied_players.remove(move_down)
+            continue
+
+        move_up = check_more_sets_won(tied_players)
+        if move_up:
+            moved_up.append(move_up)
+            tied_players.remove(move_up)
+            continue
+
+        move_down = check_less_sets_won(tied_players)
+        if move_down:
+            moved_down.append(move_down)
+            tied_players.remove(move_down)
+            continue
+
+        move_up = check_less_sets_lost(tied_players)
+        if move_up:
+            moved_up.append(move_up)
+            tied_players.remove(move_up)
+            continue
+
+        move_down = check_more_sets_lost(tied_players)
+        if move_down:
+            moved_down.append(move_down)
+            tied_players.remove(move_down)
+            continue
+
+        #just take whoever
+        move_up = tied_players[0]
+        moved_up.append(move_up)
+        tied_players.remove(move_up)
+    moved_down.reverse()
+    return moved_up + tied_players + moved_down
+
+def order_players(group_players, group_matches):
+    final_order = []
+    for wins in range(len(group_players)-1, -1, -1):
+        for losses in range(len(group_players) - 1, -1, -1):
+            temp = [p for p in group_players if p['m_w'] == wins and p['m_l'] == losses]
+            final_order = final_order + resolve_group_tie(temp, group_matches)
+    return final_order
+
+# ---- harness ----
+
+Match = collections.namedtuple('Match', 'player_1_id player_2_id winner_id')
+
+def random_group(rng):
+    n = rng.randint(1, 10)
+    ids = ['P{}'.format(i) for i in range(n)]
+    if rng.random() < 0.1:
+        ids[rng.randrange(n)] = None # a bye
+    matches = []
+    for i in range(n):
+        for j in range(i + 1, n):
+            for _ in range(2 if rng.random() < 0.05 else 1):
+                a, b = (ids[i], ids[j]) if rng.random() < 0.5 else (ids[j], ids[i])
+                r = rng.random()
+                winner = a if r < 0.4 else b if r < 0.8 else None if r < 0.97 else 'X'
+                matches.append(Match(a, b, winner))
+    if rng.random() < 0.2:
+        matches.append(Match(ids[0], 'X', ids[0]))
+    rng.shuffle(matches)
+
+    players = []
+    for pid in ids:
+        if rng.random() < 0.5:
+            # A consistent record from the matches
+            won = sum(1 for m in matches if m.winner_id == pid and pid in (m.player_1_id, m.player_2_id))
+            lost = sum(1 for m in matches if pid in (m.player_1_id, m.player_2_id) and m.winner_id not in (None, pid))
+        else:
+            # Crowded records so most groups have ties, occasionally out of range
+            won, lost = rng.randint(0, 2), rng.randint(-1 if rng.random() < 0.05 else 0, 2)
+        players.append({'player_id': pid, 'm_w': won, 'm_l': lost, 's_w': rng.randint(0, 4), 's_l': rng.randint(0, 4)})
+    rng.shuffle(players)
+    return players, matches
+
+def realistic_group(rng, n=8, played=0.7):
+    ids = ['P{}'.format(i) for i in range(n)]
+    matches = []
+    record = dict((pid, [0, 0, 0, 0]) for pid in ids)
+    for i in range(n):
+        for j in range(i + 1, n):
+            winner = None
+            if rng.random() < played:
+                winner, loser = (ids[i], ids[j]) if rng.random() < 0.5 else (ids[j], ids[i])
+                extra = rng.choice([0, 1, 2])
+                record[winner][0] += 1; record[loser][1] += 1
+                record[winner][2] += 3; record[loser][3] += 3
+                record[loser][2] += extra; record[winner][3] += extra
+            matches.append(Match(ids[i], ids[j], winner))
+    players = [{'player_id': k, 'm_w': v[0], 'm_l': v[1], 's_w': v[2], 's_l': v[3]} for k, v in record.items()]
+    players.sort(key=lambda k: (-k['m_w'], k['m_l'], -k['s_w'], k['s_l']))
+    return players, matches
+
+rng = random.Random(7)
+mismatches = 0
+for _ in range(groups):
+    players, matches = random_group(rng)
+    expected = [p['player_id'] for p in order_players(players, matches)]
+    actual = [p['player_id'] for p in tie_breaker.order_players(players, matches)]
+    if expected != actual:
+        mismatches += 1
+        if mismatches <= 5:
+            print('MISMATCH', players, matches, expected, actual)
+print('{} randomized groups, {} mismatches'.format(groups, mismatches))
+
+samples = [realistic_group(rng) for _ in range(2000)]
+for label, fn in [('old', order_players), ('new', tie_breaker.order_players)]:
+    start = time.perf_counter()
+    for players, matches in samples:
+        fn(players, matches)
+    elapsed = time.perf_counter() - start
+    print('{} {:>8.1f} us per 8 player group'.format(label, elapsed / len(samples) * 1e6))
@@ -1,6 +1,11 @@
 
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(__file__), "backend"))
+
 from flask import Flask, render_template, request, jsonify
-from backend import db, match_making, slack
+# Imported the same way the backend modules import each other, so the app and match_making share
+# one db module (and one connection pool) instead of loading backend.db and db side by side
+import db, match_making, simulator, slack
 import datetime
 
 app = Flask(__name__, template_folder="./build", static_folder="./build/static")
@@ -51,29 +56,28 @@ def submit_players():
 
     for group, players in players_and_groups.items():
         print(group, players)
-
         ensure_players_in_db(players)
-        update_groupings(group, players)
 
     today = datetime.datetime.today()
     last_monday = today - datetime.timedelta(days=today.weekday())
     next_monday = (last_monday + datetime.timedelta(days=7)).date()
 
-    match_making.create_matches_for_season(next_monday, skip_weeks=[], include_byes=False)
+    # Regrouping and the new schedule commit together (the slack lookups above stay outside the write lock)
+    directory = db.get_player_directory()
+    with db.transaction():
+        for group, players in players_and_groups.items():
+            update_groupings(group, players, directory)
+        match_making.create_matches_for_season(next_monday, skip_weeks=[], include_byes=False)
 
     return "We did it boys"
 
 
 def ensure_players_in_db(players):
-    existing_players_dict = dict()
-    existing_players = db.get_players()
-
-    for existing_player in existing_players:
-        existing_players_dict[existing_player.name] = existing_player
+    existing_players = db.get_player_directory()
 
     players_to_add = []
     for player in players:
-        if player['name'] not in existing_players_dict:
+        if existing_players.by_name(player['name']) is None:
             print("FOUND ONE", player['name'])
             players_to_add.append(player)
 
@@ -90,18 +94,49 @@ def ensure_players_in_db(players):
                 user_map[player['name']] = user['id']
                 db.add_player(user['id'], player['name'], player['group'])
 
-def update_groupings(group, players):
-    existing = db.get_players()
+def update_groupings(group, players, directory=None):
+    existing = directory if directory is not None else db.get_player_directory()
 
     for player in players:
-        for e in existing:
-            if e.name == player['name']:
-                if group == 'Trash':
-                    db.update_grouping(e.slack_id, "")
-                    db.set_active(e.slack_id, False)
-                else:
-                    db.update_grouping(e.slack_id, group)
-                    db.set_active(e.slack_id, True)
+        e = existing.by_name(player['name'])
+        if e is None:
+            continue
+        if group == 'Trash':
+            db.update_grouping(e.slack_id, "")
+            db.set_active(e.slack_id, False)
+        else:
+            db.update_grouping(e.slack_id, group)
+            db.set_active(e.slack_id, True)
+
+@app.route('/db-stats', methods=['GET'])
+def get_db_stats():
+    return jsonify(db.query_stats_snapshot() or {})
+
+@app.route('/simulation', methods=['GET'])
+def get_simulation():
+    # Promotion and relegation odds for every group; ?runs=N (capped) and ?season=N are optional
+    runs = min(request.args.get('runs', simulator.RUNS, type=int), simulator.MAX_RUNS)
+    season = request.args.get('season', None, type=int)
+    players = db.get_player_directory()
+    odds = simulator.simulate_season(season, n_runs=max(runs, 1))
+    return jsonify(dict((group, [
+        {
+            'name': players.name(o.player_id),
+            'slack_id': o.player_id,
+            'place': o.place,
+            'promotion': o.promotion,
+            'relegation': o.relegation
+        } for o in group_odds]) for group, group_odds in odds.items()))
+
+@app.route('/ratings', methods=['GET'])
+def get_ratings():
+    return jsonify([
+        {
+            'name': r.name,
+            'slack_id': r.slack_id,
+            'rating': round(r.rating, 1),
+            'matches': r.matches
+        } for r in db.get_ratings()])
 
 @app.route('/get-active-players', methods=['GET'])
 def get_active_players():
@@ -111,20 +146,17 @@ def get_active_players():
 
 def get_ranked_players():
     season = db.get_current_season()
-    all_matches = db.get_matches_for_season(season)
-    all_players = db.get_players()
+    all_players = db.get_player_directory()
 
-
-    groups = sorted(list(set([m.grouping for m in all_matches])))
+    # Indexed reads of the standings table; a group's matches are only loaded when it has a tie to break
+    groups = db.get_groupings(season)
     return_players = []
 
     for group in groups:
-        group_matches = [m for m in all_matches if m.grouping == group]
-
-        players = match_making.gather_scores(group_matches)
+        players = match_making.get_group_standings(group, season)
 
         for player in players:
-            name = [p.name for p in all_players if p.slack_id == player['player_id']][0]
+            name = all_players[player['player_id']].name
             return_players.append(
                 {
                     'name': name,
@@ -0,0 +1,31 @@
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(__file__), "../backend"))
+
+import datetime
+import pytest
+import db
+import scheduler
+
+START = datetime.date(2020, 1, 6)
+
+@pytest.fixture
+def database(tmp_path):
+    """db pointed at an empty, fully migrated database file for the length of one test."""
+    original = db.path
+    db.path = str(tmp_path / 'smash_league.sqlite')
+    db.create_tables()
+    yield db
+    db.close_connections()
+    db.path = original
+
+@pytest.fixture
+def season(database):
+    """Season 1 with one group of four players (U0 to U3), a full round robin and nothing reported yet."""
+    for i in range(4):
+        db.add_player('U{}'.format(i), 'Player {}'.format(i), 'A')
+    players = db.get_players()
+    schedule = scheduler.schedule_group(players, START)
+    with db.transaction():
+        db.create_season(1, START, [m['week'] for m in schedule])
+        db.add_matches((m['player_1'], m['player_2'], m['week'], 'A', 1) for m in schedule)
+    return 1
@@ -0,0 +1,66 @@
+import threading
+import pytest
+import db
+
+def test_after_commit_runs_after_the_commit(database):
+    pool = db.get_pool()
+    calls = []
+
+    def callback():
+        # Another thread has to see the committed row by the time this runs
+        seen = []
+        reader = threading.Thread(target=lambda: seen.append(db._fetchone('SELECT version FROM data_version')[0]))
+        reader.start()
+        reader.join()
+        calls.append(seen[0])
+
+    with db.transaction():
+        db._execute('UPDATE data_version SET version = 41')
+        pool.after_commit(callback)
+        assert calls == []
+    assert calls == [41]
+
+def test_after_commit_waits_for_the_outermost_transaction(database):
+    pool = db.get_pool()
+    calls = []
+    with db.transaction():
+        with db.transaction():
+            pool.after_commit(lambda: calls.append('done'))
+        assert calls == []
+    assert calls == ['done']
+
+def test_after_commit_is_dropped_on_rollback(database):
+    pool = db.get_pool()
+    calls = []
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            pool.after_commit(lambda: calls.append('done'))
+            raise RuntimeError
+    assert calls == []
+    # and doesn't leak into the next transaction
+    with db.transaction():
+        pass
+    assert calls == []
+
+def test_after_commit_outside_a_transaction_runs_at_once(database):
+    calls = []
+    db.get_pool().after_commit(lambda: calls.append('done'))
+    assert calls == ['done']
+
+def test_after_commit_runs_a_repeated_callback_once(database):
+    pool = db.get_pool()
+    calls = []
+    callback = lambda: calls.append('done')
+    with db.transaction():
+        pool.after_commit(callback)
+        pool.after_commit(callback)
+    assert calls == ['done']
+
+def test_data_version_is_not_cached_stale_by_a_reader_during_the_commit(database):
+    before = db.get_data_version()
+    with db.transaction():
+        db.bump_data_version()
+        reader = threading.Thread(target=db.get_data_version) # caches the committed, older version
+        reader.start()
+        reader.join()
+    assert db.get_data_version() == before + 1
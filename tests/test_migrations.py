@@ -0,0 +1,105 @@
+import sqlite3
+import pytest
+import db
+import migrations
+from connection import ConnectionManager
+
+# A database as the bot created it before schema versioning: just the player and match tables
+LEGACY_PLAYERS = [('U1', 'One', 'a', 1), ('U2', 'Two', 'a', 1), ('U3', 'Three', 'A', 1), ('U4', 'Four', 'b', 0)]
+LEGACY_MATCHES = [
+    # season 1 was best of 3: a 2-0 only fits there
+    ('U1', 'U2', 'U1', '2019-01-07', 'a', 1, 2),
+    ('U1', 'U3', 'U3', '2019-01-14', 'a', 1, 3),
+    ('U2', 'U3', 'U2', '2019-01-21', 'a', 1, 3),
+    ('U1', 'U2', 'U2', '2019-03-04', 'A', 2, 5),
+    ('U1', 'U3', None, '2019-03-11', 'a', 2, 0),
+    ('U2', 'U3', 'U2', '2019-03-18', 'A', 2, 4),
+    ('U4', None, None, '2019-03-04', 'b', 2, 0),
+]
+
+def legacy_database(path):
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE player (slack_id TEXT PRIMARY KEY, name TEXT, grouping TEXT, active INT)')
+    conn.execute('CREATE TABLE match (player_1 TEXT, player_2 TEXT, winner TEXT, week DATE, grouping TEXT, season INT, sets INT, '
+                 'FOREIGN KEY (player_1) REFERENCES player, FOREIGN KEY (player_2) REFERENCES player, '
+                 'FOREIGN KEY (winner) REFERENCES player)')
+    conn.executemany('INSERT INTO player VALUES (?, ?, ?, ?)', LEGACY_PLAYERS)
+    conn.executemany('INSERT INTO match VALUES (?, ?, ?, ?, ?, ?, ?)', LEGACY_MATCHES)
+    conn.commit()
+    conn.close()
+
+@pytest.fixture
+def legacy(tmp_path):
+    """db pointed at a legacy database, not yet migrated."""
+    path = str(tmp_path / 'legacy.sqlite')
+    legacy_database(path)
+    original, auto_migrate = db.path, db.auto_migrate
+    db.path, db.auto_migrate = path, False
+    yield path
+    db.close_connections()
+    db.path, db.auto_migrate = original, auto_migrate
+
+def test_legacy_database_upgrades_to_the_latest_version(legacy):
+    assert db.create_tables() == [version for version, _, _ in migrations.MIGRATIONS]
+    assert migrations.get_version(db.get_connection()) == migrations.LATEST_VERSION == 8
+    assert db.create_tables() == []
+
+def test_upgrade_builds_seasons(legacy):
+    db.create_tables()
+    one, two = db.get_season(1), db.get_season(2)
+    assert (one.status, one.best_of) == ('complete', 3)
+    assert (two.status, two.best_of) == ('active', 5)
+    assert db.get_current_season() == 2
+
+def test_upgrade_upper_cases_groupings(legacy):
+    db.create_tables()
+    conn = db.get_connection()
+    for table in ('player', 'match', 'standings'):
+        assert set(r[0] for r in conn.execute('SELECT DISTINCT grouping FROM ' + table)) <= {'A', 'B'}
+    assert db.get_groupings(2) == ['A', 'B']
+    assert len(db.get_matches_for_group(2, 'a')) == 3
+
+def test_upgrade_backfills_standings(legacy):
+    db.create_tables()
+    assert db.verify_standings() == []
+    assert db.get_standings(2, 'A') == [
+        {'player_id': 'U2', 'm_w': 2, 'm_l': 0, 's_w': 6, 's_l': 3},
+        {'player_id': 'U1', 'm_w': 0, 'm_l': 1, 's_w': 2, 's_l': 3},
+        {'player_id': 'U3', 'm_w': 0, 'm_l': 1, 's_w': 1, 's_l': 3},
+    ]
+
+def test_upgrade_backfills_career_stats(legacy):
+    db.create_tables()
+    totals, seasons = db.get_player_career('U1')
+    assert (totals.matches_won, totals.matches_lost) == (1, 2)
+    # 2-0 and 1-2 in a best of 3, 2-3 in a best of 5
+    assert (totals.games_won, totals.games_lost) == (5, 5)
+
+def test_upgrade_backfills_ratings(legacy):
+    db.create_tables()
+    conn = db.get_connection()
+    assert conn.execute('SELECT COUNT(*) FROM rating_change').fetchone()[0] == 5
+    rated = dict((r.slack_id, r.matches) for r in db.get_ratings())
+    assert rated == {'U1': 3, 'U2': 4, 'U3': 3, 'U4': 0}
+
+def test_ratings_are_filled_when_step_6_is_applied_later(legacy):
+    migrations.migrate(ConnectionManager(legacy), target=5)
+    assert db.create_tables() == [6, 7, 8]
+    assert db.get_connection().execute('SELECT COUNT(*) FROM rating_change').fetchone()[0] == 5
+
+def test_mixed_case_standings_are_rebuilt(legacy):
+    manager = ConnectionManager(legacy)
+    migrations.migrate(manager, target=7)
+    with manager.transaction() as conn:
+        # Season 2 has U1's matches under both 'a' and 'A', so before step 8 they have a row for each
+        assert conn.execute("SELECT COUNT(*) FROM standings WHERE season = 2 AND player = 'U1'").fetchone()[0] == 2
+    manager.close_all()
+    assert db.create_tables() == [8]
+    assert db.verify_standings() == []
+    assert [p['player_id'] for p in db.get_standings(2, 'A')] == ['U2', 'U1', 'U3']
+
+def test_fresh_database(tmp_path):
+    manager = ConnectionManager(str(tmp_path / 'fresh.sqlite'))
+    assert migrations.migrate(manager) == [version for version, _, _ in migrations.MIGRATIONS]
+    assert migrations.migrate(manager) == []
+    manager.close_all()
@@ -0,0 +1,77 @@
+import datetime
+import random
+import pytest
+import scheduler
+
+START = datetime.date(2020, 1, 6)
+
+def weeks(schedule):
+    return len(set(m['week'] for m in schedule))
+
+@pytest.mark.parametrize('count', range(2, 14))
+@pytest.mark.parametrize('include_byes', [False, True])
+def test_every_pair_meets_once(count, include_byes):
+    players = ['P{}'.format(i) for i in range(count)]
+    schedule = scheduler.schedule_group(players, START, include_byes=include_byes, rng=random.Random(count))
+    scheduler.validate(schedule, players, scheduler.MAX_PER_WEEK, include_byes)
+    byes = [m for m in schedule if m['player_2'] is None]
+    if count % 2 == 0:
+        assert weeks(schedule) == count - 1
+        assert byes == []
+    elif include_byes:
+        assert weeks(schedule) == count
+        assert len(byes) == count
+    else:
+        assert weeks(schedule) == count - 2
+        assert byes == []
+
+@pytest.mark.parametrize('count', range(4, 14)) # three players without byes play everyone in one week
+@pytest.mark.parametrize('include_byes', [False, True])
+def test_last_seasons_first_week_is_avoided(count, include_byes):
+    players = ['P{}'.format(i) for i in range(count)]
+    previous = scheduler.schedule_group(players, START, include_byes=include_byes, rng=random.Random(1))
+    avoid = [(m['player_1'], m['player_2']) for m in previous if m['week'] == START and m['player_2'] is not None]
+    schedule = scheduler.schedule_group(players, START, include_byes=include_byes, avoid_pairs=avoid, rng=random.Random(2))
+    scheduler.validate(schedule, players, scheduler.MAX_PER_WEEK, include_byes)
+    first_week = set(frozenset((m['player_1'], m['player_2'])) for m in schedule if m['week'] == START)
+    assert not first_week & set(frozenset(p) for p in avoid)
+
+def test_odd_group_with_byes_and_pairs_to_avoid():
+    # The bye slot used to be looked up as a player while counting first week conflicts
+    players = ['a', 'b', 'c']
+    schedule = scheduler.schedule_group(players, START, include_byes=True, avoid_pairs=[('a', 'b')], rng=random.Random(0))
+    scheduler.validate(schedule, players, include_byes=True)
+
+def test_skipped_weeks_are_left_out():
+    skip = [START + datetime.timedelta(weeks=1)]
+    schedule = scheduler.schedule_group(['a', 'b', 'c', 'd'], START, skip_weeks=skip)
+    assert sorted(set(m['week'] for m in schedule)) == [START, START + datetime.timedelta(weeks=2), START + datetime.timedelta(weeks=3)]
+
+def test_validate_rejects_a_pair_scheduled_twice():
+    players = ['a', 'b', 'c']
+    schedule = [{'player_1': 'a', 'player_2': 'b', 'week': START}, {'player_1': 'b', 'player_2': 'a', 'week': START},
+                {'player_1': 'a', 'player_2': 'c', 'week': START}]
+    with pytest.raises(scheduler.ScheduleError):
+        scheduler.validate(schedule, players)
+
+def test_validate_rejects_a_missing_pair():
+    with pytest.raises(scheduler.ScheduleError):
+        scheduler.validate([{'player_1': 'a', 'player_2': 'b', 'week': START}], ['a', 'b', 'c'])
+
+def test_validate_rejects_unexpected_byes():
+    schedule = [{'player_1': 'a', 'player_2': 'b', 'week': START}, {'player_1': 'c', 'player_2': None, 'week': START}]
+    with pytest.raises(scheduler.ScheduleError):
+        scheduler.validate(schedule, ['a', 'b'])
+    scheduler.validate(schedule, ['a', 'b'], include_byes=True)
+
+def test_validate_rejects_too_many_matches_in_a_week():
+    players = ['a', 'b', 'c']
+    schedule = [{'player_1': 'a', 'player_2': 'b', 'week': START}, {'player_1': 'a', 'player_2': 'c', 'week': START},
+                {'player_1': 'b', 'player_2': 'c', 'week': START}]
+    scheduler.validate(schedule, players, max_per_week=2)
+    with pytest.raises(scheduler.ScheduleError):
+        scheduler.validate(schedule, players, max_per_week=1)
+
+def test_an_odd_group_without_byes_needs_two_matches_a_week():
+    with pytest.raises(scheduler.ScheduleError):
+        scheduler.schedule_group(['a', 'b', 'c', 'd', 'e'], START, max_per_week=1)
@@ -0,0 +1,61 @@
+import db
+
+def standing(season, player_id):
+    return next(p for p in db.get_standings(season, 'A') if p['player_id'] == player_id)
+
+def test_reporting_an_open_match(season):
+    result = db.enter_score('U0', 'U1', 4)
+    assert result
+    assert result.status == db.ScoreResult.UPDATED
+    assert (result.match.winner_id, result.match.sets) == ('U0', 4)
+    assert result.replaced is None
+    assert standing(season, 'U0') == {'player_id': 'U0', 'm_w': 1, 'm_l': 0, 's_w': 3, 's_l': 1}
+    assert standing(season, 'U1') == {'player_id': 'U1', 'm_w': 0, 'm_l': 1, 's_w': 1, 's_l': 3}
+
+def test_reporting_from_the_losers_side_finds_the_match(season):
+    result = db.enter_score('U1', 'U0', 3)
+    assert result.status == db.ScoreResult.UPDATED
+    assert result.match.winner_id == 'U1'
+
+def test_a_reported_match_is_not_overwritten(season):
+    db.enter_score('U0', 'U1', 4)
+    result = db.enter_score('U1', 'U0', 5)
+    assert not result
+    assert result.status == db.ScoreResult.ALREADY_REPORTED
+    assert (result.match.winner_id, result.match.sets) == ('U0', 4)
+    assert standing(season, 'U0')['m_w'] == 1
+
+def test_overwrite_replaces_the_result_and_the_standings(season):
+    db.enter_score('U0', 'U1', 4)
+    result = db.enter_score('U1', 'U0', 5, overwrite=True)
+    assert result.status == db.ScoreResult.UPDATED
+    assert (result.replaced.winner_id, result.replaced.sets) == ('U0', 4)
+    assert (result.match.winner_id, result.match.sets) == ('U1', 5)
+    assert standing(season, 'U0') == {'player_id': 'U0', 'm_w': 0, 'm_l': 1, 's_w': 2, 's_l': 3}
+    assert standing(season, 'U1') == {'player_id': 'U1', 'm_w': 1, 'm_l': 0, 's_w': 3, 's_l': 2}
+    assert db.verify_standings(season) == []
+
+def test_unknown_match(season):
+    result = db.enter_score('U0', 'U9', 3)
+    assert result.status == db.ScoreResult.NOT_FOUND
+    assert result.match is None
+
+def test_playing_yourself_is_invalid(season):
+    assert db.enter_score('U0', 'U0', 3).status == db.ScoreResult.INVALID
+
+def test_sets_outside_the_seasons_format_are_invalid(season):
+    for sets in (2, 6):
+        result = db.enter_score('U0', 'U1', sets)
+        assert result.status == db.ScoreResult.INVALID
+        assert result.best_of == 5
+    db.set_best_of(season, 3)
+    result = db.enter_score('U0', 'U1', 4)
+    assert (result.status, result.best_of) == (db.ScoreResult.INVALID, 3)
+    assert db.enter_score('U0', 'U1', 3)
+
+def test_reporting_bumps_the_data_version(season):
+    before = db.get_data_version()
+    db.enter_score('U0', 'U1', 3)
+    assert db.get_data_version() == before + 1
+    db.enter_score('U0', 'U1', 3) # already reported: nothing changed
+    assert db.get_data_version() == before + 1
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+import db
+import simulator
+
+def test_odds_for_a_season_in_progress(season):
+    db.enter_score('U0', 'U1', 3)
+    db.enter_score('U0', 'U2', 3)
+    odds = simulator.simulate_season(n_runs=500, seed=1)
+    assert list(odds) == ['A']
+    group = odds['A']
+    assert [o.place for o in group] == [1, 2, 3, 4]
+    assert group[0].player_id == 'U0'
+    # Every run promotes and relegates the same number of players
+    assert sum(o.promotion for o in group) == pytest.approx(simulator.PROMOTED)
+    assert sum(o.relegation for o in group) == pytest.approx(simulator.RELEGATED)
+    assert all(0 <= o.promotion <= 1 and 0 <= o.relegation <= 1 for o in group)
+
+@pytest.mark.parametrize('best_of', [3, 5, 7])
+def test_sampled_results_fit_the_format(season, best_of):
+    matches = db.get_matches_for_season(season)
+    league = simulator._League(matches, {}, best_of)
+    first_won, played = league.sample(1000, np.random.default_rng(0))
+    to_win = best_of // 2 + 1
+    assert played.min() >= to_win and played.max() <= best_of
+    # coin flips: both sides win about half the time
+    assert 0.4 < first_won.mean() < 0.6
+
+def test_a_finished_season_is_certain(season):
+    for winner, loser in [('U0', 'U1'), ('U0', 'U2'), ('U0', 'U3'), ('U1', 'U2'), ('U1', 'U3'), ('U2', 'U3')]:
+        db.enter_score(winner, loser, 3)
+    group = simulator.simulate_season(n_runs=50, seed=1)['A']
+    assert [o.player_id for o in group] == ['U0', 'U1', 'U2', 'U3']
+    assert [o.promotion for o in group] == [1.0] * simulator.PROMOTED + [0.0] * (4 - simulator.PROMOTED)